@@ -1,5 +1,7 @@
 import QuantLib as ql
-from WindPy import w
+import sys
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\行情数据')
+from 行情数据接口 import w
 from tools import str_date_2_ql_date
 
 
@@ -59,4 +61,5 @@ def get_shanghai_repo_1m(date):
     return repo_rate_helpers
 
 
-get_shanghai_repo('2019-01-21')
\ No newline at end of file
+if __name__ == '__main__':
+    get_shanghai_repo('2019-01-21')
\ No newline at end of file
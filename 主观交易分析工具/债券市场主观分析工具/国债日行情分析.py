@@ -1,15 +1,19 @@
 import QuantLib as ql
-import xlrd
-from WindPy import w
-import pandas as pd
+import sys
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\行情数据')
+from 行情数据接口 import w
 import numpy as np
-from scipy.optimize import minimize
-import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
 from tools import str_date_2_ql_date
 from 上交所回购日行情分析 import get_shanghai_repo_1m
 
 
+# 虚拟零息票债券的期限，其报价决定YTM曲线的形状
+# 短期限的债券品种如果过多地话，会造成估计曲线的非光滑性，因此时间间隔较长
+FICTITIOUS_BONDS_TERM = [ql.Period(1, ql.Years), ql.Period(2, ql.Years), ql.Period(3, ql.Years), ql.Period(4, ql.Years),
+                         ql.Period(5, ql.Years), ql.Period(7, ql.Years), ql.Period(10, ql.Years), ql.Period(15, ql.Years),
+                         ql.Period(20, ql.Years), ql.Period(30, ql.Years)]
+
+
 def get_treasury_bond_ytm(date):
     # 处理数据的日期，一些债券惯例的定义
     calc_date = str_date_2_ql_date(date)
@@ -17,6 +21,7 @@ def get_treasury_bond_ytm(date):
     calendar = ql.China()
     bussiness_convention = ql.Following
     # 读取excel文件，提取相关的国债行情数据
+    import xlrd
     workbook = xlrd.open_workbook('data\\债券日行情' + date + '.xlsx')
     main_sheet = workbook.sheet_by_name('万得')
     nrows_range = range(2, main_sheet.nrows - 2)  # 有效信息的行范围
@@ -39,7 +44,7 @@ def get_treasury_bond_ytm(date):
                       'couponrate, carrydate, maturitydate, coupondatetxt, interestfrequency, actualbenchmark').Data
     debt_data = list(zip(*debt_data))
 
-    bond_helpers = []
+    bonds = []
     for i in range(len(debt_codes)):
         debt_data_temp = debt_data[i]
         # if debt_data_temp[1].date() < (calc_date + ql.Period(-1, ql.Years)).to_date():  # 剔除发行期超过一年的老债
@@ -71,67 +76,32 @@ def get_treasury_bond_ytm(date):
             bond = ql.FixedRateBond(0, 100.0, schedule, [debt_data_temp[0] / 100.0], day_count)
         else:
             bond = ql.ZeroCouponBond(0, calendar, 100.0, maturity_date, bussiness_convention, 100.0, issue_date)
-        dirty_price_handle = ql.QuoteHandle(ql.SimpleQuote(debt_list[i][1]))
-        bond_helper = ql.BondHelper(dirty_price_handle, bond, useCleanPrice=False)
-        bond_helpers.append(bond_helper)
+        bonds.append(bond)
+    dirty_prices = np.array([d[1] for d in debt_list])
+    debt_volumes = np.array([d[2] for d in debt_list])
+    debt_volumes = debt_volumes / np.sum(debt_volumes)  # 归一化权重
 
     # 构造虚拟的零息票债券，调整零息票债券报价，进而调整YTM曲线
-    # 短期限的债券品种如果过多地话，会造成估计曲线的非光滑性，因此时间间隔较长
     dayCount = ql.ActualActual()
-    fictitious_bonds_term = [ql.Period(1, ql.Years), ql.Period(2, ql.Years), ql.Period(3, ql.Years), ql.Period(4, ql.Years),
-                             ql.Period(5, ql.Years), ql.Period(7, ql.Years), ql.Period(10, ql.Years), ql.Period(15, ql.Years),
-                             ql.Period(20, ql.Years), ql.Period(30, ql.Years)]
-    fictitious_bonds = [ql.ZeroCouponBond(0, calendar, 100.0, calc_date + t, bussiness_convention, 100.0, calc_date) for
-                        t in fictitious_bonds_term]
-    # 虚拟债券报价器定义，以调整不同的价格
-    fictitious_bonds_init_prices_quote = [ql.SimpleQuote(100.0) for _ in fictitious_bonds_term]  # 初始化为收益率为0
-    fictitious_bonds_init_prices_quote_handle = [ql.QuoteHandle(q) for q in fictitious_bonds_init_prices_quote]
-    ficitious_bonds_helper = [ql.BondHelper(p, b, useCleanPrice=False) for p, b in
-                              zip(fictitious_bonds_init_prices_quote_handle, fictitious_bonds)]
     repo_rate_helpers = get_shanghai_repo_1m(date)  # 回购利率作为短期利率
-    all_helpers = repo_rate_helpers + ficitious_bonds_helper
-    # all_helpers = ficitious_bonds_helper
-    # 定义不同插值方法的YTM曲线
-    # ficitious_ytm_curve = ql.PiecewiseLogLinearDiscount(calc_date, all_helpers, dayCount)
-    ficitious_ytm_curve = ql.PiecewiseLogCubicDiscount(calc_date, all_helpers, dayCount)
-    ficitious_ytm_curve.enableExtrapolation()  # 允许外推计算功能
+    ficitious_ytm_curve, ficitious_bonds_helper, fictitious_bonds_prices_quote = get_fictitious_ytm_curve(calc_date, repo_rate_helpers)
     ficitious_pricing_engine = ql.DiscountingBondEngine(ql.YieldTermStructureHandle(ficitious_ytm_curve))
-    for bond_helper in bond_helpers:
-        bond_temp = bond_helper.bond()
-        bond_temp.setPricingEngine(ficitious_pricing_engine)  # 设置定价引擎
-
-    # 优化目标函数
-    def calculate_diff(zero_prices):
-        # zero_prices为虚拟的零息债券的报价
-        # zero_prices的size与fictitious_bonds_term一致
-        print(zero_prices)
-        debt_volumes = np.array([v[2] for v in debt_list])
-        debt_volumes = debt_volumes / np.sum(debt_volumes)  # 归一化权重
-        diff = 0.0  # 测算误差
-        set_ytm_curve(zero_prices)
-        for i, bond_helper in enumerate(bond_helpers):  # 计算现在的曲线对应的报价差
-            bond_temp = bond_helper.bond()
-            bond_temp_dirty_price = bond_temp.dirtyPrice()
-            diff += debt_volumes[i] * (debt_list[i][1] - bond_temp_dirty_price) ** 2
-        print(diff)
-        return diff
-
-    # 根据零息票债券的报价设置YTM曲线的函数
-    def set_ytm_curve(zero_prices):
-        for i, zero_price in enumerate(zero_prices):  # 报价调节为现在的报价
-            price_quote = fictitious_bonds_init_prices_quote[i]
-            price_quote.setValue(zero_price)
+    for bond in bonds:
+        bond.setPricingEngine(ficitious_pricing_engine)  # 设置定价引擎
 
     # 进行优化，需求最优的拟合曲线
-    res = minimize(calculate_diff, x0=np.array([100.0] * len(fictitious_bonds)), method='BFGS')
-    print(res.x)
-    set_ytm_curve(res.x)
-    zero_rates = [ficitious_ytm_curve.zeroRate(calc_date + t, dayCount, ql.Compounded).rate() for t in fictitious_bonds_term]
+    fitted_prices = fit_ytm_curve(ficitious_ytm_curve, ficitious_bonds_helper, fictitious_bonds_prices_quote, bonds, dirty_prices,
+                                  debt_volumes)
+    print('加权误差平方和：', np.sum(debt_volumes * (dirty_prices - fitted_prices) ** 2))
+    print([q.value() for q in fictitious_bonds_prices_quote])
+    zero_rates = [ficitious_ytm_curve.zeroRate(calc_date + t, dayCount, ql.Compounded).rate() for t in FICTITIOUS_BONDS_TERM]
     print(zero_rates)
     # 展示不同时期的零息国债收益率曲线
     need_maturity = [calc_date + ql.Period(i, ql.Months) for i in range(0, 361)]
     zero_rates = [ficitious_ytm_curve.zeroRate(maturity, dayCount, ql.Compounded).rate() for maturity in need_maturity]
     need_maturity = [d.to_date() for d in need_maturity]
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DateFormatter
     fig = plt.figure()
     ax = fig.add_subplot(1, 1, 1)
     ax.xaxis.set_major_formatter(DateFormatter('%Y-%m-%d'))
@@ -145,4 +115,148 @@ def get_treasury_bond_ytm(date):
     return ficitious_ytm_curve
 
 
-get_treasury_bond_ytm('2018-12-25')
\ No newline at end of file
+def get_fictitious_ytm_curve(calc_date, base_helpers):
+    # 以base_helpers（如回购利率）和虚拟零息票债券构造YTM曲线，返回(曲线, 虚拟债券的helper, 虚拟债券的报价器)
+    # 虚拟债券的报价初始化为100（收益率为0），由fit_ytm_curve调整
+    calendar = ql.China()
+    bussiness_convention = ql.Following
+    dayCount = ql.ActualActual()
+    fictitious_bonds = [ql.ZeroCouponBond(0, calendar, 100.0, calc_date + t, bussiness_convention, 100.0, calc_date) for
+                        t in FICTITIOUS_BONDS_TERM]
+    fictitious_bonds_prices_quote = [ql.SimpleQuote(100.0) for _ in FICTITIOUS_BONDS_TERM]
+    ficitious_bonds_helper = [ql.BondHelper(ql.QuoteHandle(p), b, useCleanPrice=False) for p, b in
+                              zip(fictitious_bonds_prices_quote, fictitious_bonds)]
+    # 定义不同插值方法的YTM曲线，改变插值方法时get_log_cubic_matrix需要相应修改
+    # ficitious_ytm_curve = ql.PiecewiseLogLinearDiscount(calc_date, base_helpers + ficitious_bonds_helper, dayCount)
+    ficitious_ytm_curve = ql.PiecewiseLogCubicDiscount(calc_date, base_helpers + ficitious_bonds_helper, dayCount)
+    ficitious_ytm_curve.enableExtrapolation()  # 允许外推计算功能
+    return ficitious_ytm_curve, ficitious_bonds_helper, fictitious_bonds_prices_quote
+
+
+# 曲线拟合
+# PiecewiseLogCubicDiscount的对数贴现因子是节点对数贴现因子的三次样条，任意日期的对数贴现因子是节点值的线性组合，
+# 因此全部债券的全价 = 现金流矩阵(债券×现金流日期) @ exp(插值矩阵(现金流日期×节点) @ 节点对数贴现因子)，
+# 两个矩阵只计算一次，优化中不需要重新bootstrap曲线和逐个债券定价，误差对节点值的导数（Jacobian）也有解析形式
+def fit_ytm_curve(curve, fictitious_helpers, fictitious_quotes, bonds, dirty_prices, weights):
+    # curve由get_fictitious_ytm_curve构造，调整虚拟零息票债券对应的节点，使bonds的全价与dirty_prices的加权误差平方和最小
+    # 其它helper对应的节点与虚拟债券的报价无关，保持不变
+    # 拟合后fictitious_quotes设为最优报价，curve即为拟合的曲线，返回bonds在拟合曲线下的全价
+    from scipy.optimize import least_squares
+    reference_date = curve.referenceDate()
+    day_count = curve.dayCounter()
+    node_dates, node_discounts = zip(*curve.nodes())
+    node_times = np.array([day_count.yearFraction(reference_date, d) for d in node_dates])
+    node_values = np.log(node_discounts)
+    free = np.isin([d.serialNumber() for d in node_dates], [h.pillarDate().serialNumber() for h in fictitious_helpers])
+    cashflows, times = get_cashflow_matrix(bonds, reference_date, day_count)
+    interpolation = get_log_cubic_matrix(node_times, times)
+    fixed_values = interpolation[:, ~free] @ node_values[~free]
+    interpolation_free = interpolation[:, free]
+    weights_sqrt = np.sqrt(weights)
+
+    # 加权误差及其对虚拟债券节点对数贴现因子的导数
+    def calculate_diff(values):
+        return weights_sqrt * (cashflows @ np.exp(fixed_values + interpolation_free @ values) - dirty_prices)
+
+    def calculate_jacobian(values):
+        discounts = np.exp(fixed_values + interpolation_free @ values)
+        return weights_sqrt[:, None] * ((cashflows * discounts) @ interpolation_free)
+
+    res = least_squares(calculate_diff, node_values[free], jac=calculate_jacobian)
+    node_values[free] = res.x
+    # 虚拟债券的报价设为拟合曲线下的全价，曲线重新bootstrap一次即得到拟合的节点
+    fictitious_cashflows, fictitious_times = get_cashflow_matrix([h.bond() for h in fictitious_helpers], reference_date, day_count)
+    fictitious_prices = fictitious_cashflows @ np.exp(get_log_cubic_matrix(node_times, fictitious_times) @ node_values)
+    for quote, price in zip(fictitious_quotes, fictitious_prices):
+        quote.setValue(price)
+    return cashflows @ np.exp(interpolation @ node_values)
+
+
+def get_cashflow_matrix(bonds, reference_date, day_count):
+    # 返回(债券×现金流日期的现金流矩阵, 各现金流日期到reference_date的时间)，只包括reference_date之后的现金流
+    rows = []
+    serials = []
+    amounts = []
+    for i, bond in enumerate(bonds):
+        for cashflow in bond.cashflows():
+            if cashflow.date() > reference_date:
+                rows.append(i)
+                serials.append(cashflow.date().serialNumber())
+                amounts.append(cashflow.amount())
+    serials, columns = np.unique(serials, return_inverse=True)
+    cashflows = np.zeros((len(bonds), len(serials)))
+    np.add.at(cashflows, (rows, columns), amounts)
+    times = np.array([day_count.yearFraction(reference_date, ql.Date(int(serial))) for serial in serials])
+    return cashflows, times
+
+
+def get_log_cubic_matrix(node_times, times):
+    # 对数贴现因子三次样条插值的权重矩阵(times×节点)：log D(times) = 矩阵 @ log D(节点)
+    # 样条两端二阶导数为0，与PiecewiseLogCubicDiscount一致（曲线单调，QuantLib的单调性修正不起作用时）
+    # 最后一个节点之后与QuantLib相同，按该节点的瞬时远期利率外推
+    n = len(node_times)
+    h = np.diff(node_times)
+    # 节点上的二阶导数M = A^-1 @ B @ y
+    A = np.zeros((n, n))
+    B = np.zeros((n, n))
+    A[0, 0] = A[-1, -1] = 1.0
+    for i in range(1, n - 1):
+        A[i, i - 1:i + 2] = [h[i - 1] / 6.0, (h[i - 1] + h[i]) / 3.0, h[i] / 6.0]
+        B[i, i - 1:i + 2] = [1.0 / h[i - 1], -1.0 / h[i - 1] - 1.0 / h[i], 1.0 / h[i]]
+    M = np.linalg.solve(A, B)
+    identity = np.eye(n)
+    # 样条在第k段[node_times[k], node_times[k+1]]上的值
+    inner_times = np.minimum(times, node_times[-1])
+    k = np.clip(np.searchsorted(node_times, inner_times, side='right') - 1, 0, n - 2)
+    right = (node_times[k + 1] - inner_times)[:, None]
+    left = (inner_times - node_times[k])[:, None]
+    hk = h[k][:, None]
+    matrix = (M[k] * right ** 3 + M[k + 1] * left ** 3) / (6.0 * hk) + (identity[k] / hk - M[k] * hk / 6.0) * right + \
+             (identity[k + 1] / hk - M[k + 1] * hk / 6.0) * left
+    # 外推部分：最后一个节点的斜率
+    slope = (identity[-1] - identity[-2]) / h[-1] + h[-1] * (M[-2] + 2.0 * M[-1]) / 6.0
+    return matrix + np.maximum(times - node_times[-1], 0.0)[:, None] * slope
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 国债收益率曲线拟合测试1():
+    # 用已知的零息收益率曲线生成60只附息国债的全价，拟合后比较定价误差，以及拟合曲线与QuantLib定价的一致性
+    import time
+    calc_date = ql.Date(25, 12, 2018)
+    ql.Settings.instance().evaluationDate = calc_date
+    calendar = ql.China()
+    dayCount = ql.ActualActual()
+    true_dates = [calc_date + ql.Period(i, ql.Years) for i in range(0, 51)]
+    true_rates = [0.025 + 0.012 * (1.0 - np.exp(-i / 4.0)) for i in range(0, 51)]
+    true_curve = ql.YieldTermStructureHandle(ql.ZeroCurve(true_dates, true_rates, dayCount))
+    true_curve.enableExtrapolation()
+    rng = np.random.default_rng(0)
+    bonds = []
+    for years in np.linspace(0.5, 45.0, 60):
+        issue_date = calc_date - ql.Period(int(rng.integers(0, 720)), ql.Days)
+        maturity_date = calc_date + ql.Period(int(years * 12), ql.Months)
+        schedule = ql.Schedule(issue_date, maturity_date, ql.Period(ql.Annual), calendar, ql.Following, ql.Following,
+                               ql.DateGeneration.Backward, False)
+        bond = ql.FixedRateBond(0, 100.0, schedule, [float(rng.uniform(0.02, 0.045))], dayCount)
+        bond.setPricingEngine(ql.DiscountingBondEngine(true_curve))
+        bonds.append(bond)
+    dirty_prices = np.array([bond.dirtyPrice() for bond in bonds])
+    weights = rng.uniform(0.5, 1.5, len(bonds))
+    weights = weights / np.sum(weights)
+    base_helpers = [ql.DepositRateHelper(ql.QuoteHandle(ql.SimpleQuote(0.025)), ql.Period(1, ql.Months), 0, calendar,
+                                         ql.Following, False, ql.Actual365Fixed())]
+    time_start = time.time()
+    curve, helpers, quotes = get_fictitious_ytm_curve(calc_date, base_helpers)
+    fitted_prices = fit_ytm_curve(curve, helpers, quotes, bonds, dirty_prices, weights)
+    print('拟合耗时%.4f秒' % (time.time() - time_start))
+    print('最大定价误差：', np.max(np.abs(fitted_prices - dirty_prices)))
+    engine = ql.DiscountingBondEngine(ql.YieldTermStructureHandle(curve))
+    for bond in bonds:
+        bond.setPricingEngine(engine)
+    print('拟合曲线下QuantLib定价与矩阵定价的最大差：', np.max(np.abs([bond.dirtyPrice() for bond in bonds] - fitted_prices)))
+
+
+if __name__ == '__main__':
+    get_treasury_bond_ytm('2018-12-25')
\ No newline at end of file
@@ -1,9 +1,11 @@
 import datetime
 import QuantLib as ql
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MultipleLocator
-from WindPy import w
+import sys
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\衍生品定价模型')
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\行情数据')
+from 行情数据接口 import w
+from 股票期权定价模型 import EuropeanOptionBSMAnalytic
 
 
 class OptionAnalysisBase(object):
@@ -62,12 +64,13 @@ class ETF50OptionAnalysis(OptionAnalysisBase):
         self.etf = float(etf)  # 是否买入ETF的标识，买入为正数，卖出为负数，单位为ETF的份数（100份为一手）
         super().__init__(options, unit, eps_diff)
         w.start()
-        self.ql_options, self.date_end, self.strike_list = self._set_ql_option()
+        self.ql_options, self.option_terms, self.date_end, self.strike_list = self._set_ql_option()
         self.etf_now = w.wsq('510050.SH', "rt_latest").Data[0][0]
         print(self.etf_now)
 
     def _set_ql_option(self):
         ql_options = {}
+        option_terms = {}  # 记录每个期权的类型、行权价和到期日，用于计算隐含波动率
         date_end = datetime.datetime.strptime(self.date_now, '%Y-%m-%d')  # 记录期权的最后到期日，此类应该都是一个到期日
         strike_list = []
         # 将期权的payoff转化为ql中的对象
@@ -83,8 +86,20 @@ class ETF50OptionAnalysis(OptionAnalysisBase):
             if option_last_day > date_end:
                 date_end = option_last_day
             ql_options[option] = (option_payoff, option_volume)  # 记录期权的payoff函数和对应的份数函数
+            option_terms[option] = (option_type, option_strike, option_last_day.strftime('%Y-%m-%d'))
             strike_list.append(option_strike)
-        return ql_options, date_end.strftime('%Y-%m-%d'), np.array(strike_list)
+        return ql_options, option_terms, date_end.strftime('%Y-%m-%d'), np.array(strike_list)
+
+    def get_implied_volatility(self, risk_free=0.03, dividend_rate=0.0):
+        # 用期权和50ETF的最新价一次性批量反解全部期权的隐含波动率，可以在每次行情更新时调用
+        # 返回{期权代码: (隐含波动率, 是否收敛)}，价格不满足无套利条件的期权隐含波动率为nan
+        codes = list(self.option_terms)
+        option_prices = w.wsq(','.join(codes), "rt_latest").Data[0]
+        etf_price = w.wsq('510050.SH', "rt_latest").Data[0][0]
+        option_type, strike, last_day = [np.array(term) for term in zip(*[self.option_terms[code] for code in codes])]
+        implied_volatility, converged = EuropeanOptionBSMAnalytic.impliedVolatilityBatch(
+            np.array(option_prices), etf_price, strike, self.date_now, last_day, option_type.astype(int), dividend_rate, risk_free)
+        return {code: (implied_volatility[i], converged[i]) for i, code in enumerate(codes)}
 
     def _get_cost(self):
         cost = 0
@@ -135,12 +150,17 @@ class ETF50OptionAnalysis(OptionAnalysisBase):
         etf_option_string += '策略到期盈亏平衡点为（每份50ETF）：\n'
         for zero in zeros:
             etf_option_string += ('%.4f元\n' % zero)
+        etf_option_string += '策略中使用到的期权的隐含波动率为：\n'
+        implied_volatility = self.get_implied_volatility()
+        for option in self.options:
+            etf_option_string += ('%s，%.2f%%\n' % (option, implied_volatility[option][0] * 100))
         etf_option_string += '策略中使用到的期权的行权价为（从小到大）：\n'
         strikes = sorted(self.strike_list)
         for strike in strikes:
             etf_option_string += '%.4f元（策略利润：%.4f元）\n' % (strike, self._get_payoff(strike)-cost)
         print(etf_option_string)
-        # 画图的配置
+        # 画图的配置，matplotlib只在画图时导入
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(12, 12))
         plt.rcParams['font.sans-serif'] = ['SimHei']  # 显示负号
         plt.rcParams['axes.unicode_minus'] = False  # 显示中文
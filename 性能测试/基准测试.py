@@ -0,0 +1,244 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+import zlib
+import numpy as np
+import QuantLib as ql
+# 导入模型的设定
+import sys
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\衍生品定价模型')
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\衍生品回测\\日收盘衍生品回测')
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\行情数据')
+import 交易日历
+import 行情数据接口
+
+
+# 基准测试
+# 使用固定的、不需要Wind的数据对定价模型、路径生成器和回测计时，结果追加写入HISTORY_FILE（每行一次运行的JSON）
+# 命令行用法：
+# python 基准测试.py run [--repeat 5] [--filter 关键字]    运行基准测试并记录
+# python 基准测试.py compare [--baseline -2] [--threshold 0.1]    比较最近一次与基准记录，耗时增加超过threshold的项目记为退化，有退化时返回1
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '基准测试记录.jsonl')
+EVALUATION_DATE = '2014-03-07'
+MATURITY_DATE = '2014-06-09'
+BACKTEST_START_DATE = '2018-03-08'
+BACKTEST_END_DATE = '2018-06-08'
+PATH_NUMBERS = (1000, 10000, 100000)  # 仿真路径生成器的路径数
+HISTORY_PATH_NUMBERS = (100, 500)  # 历史路径生成器的路径数，受历史区间长度的限制
+
+
+class FixtureProvider(行情数据接口.MarketDataProvider):
+    # 基准测试用的数据源，每个代码的收益率为固定种子生成的序列，与运行环境无关
+    def __init__(self, startDate=ql.Date(4, 1, 1990), endDate=ql.Date(31, 12, 2030)):
+        self.business_serials = np.array([d.serialNumber() for d in 交易日历.CHINA.businessDates(startDate, endDate)])
+        self.series = {}
+
+    def _get_series(self, code):
+        if code not in self.series:
+            rng = np.random.default_rng(zlib.crc32(code.encode('utf-8')))
+            self.series[code] = np.round(rng.standard_t(4, len(self.business_serials)) * 1.2, 2)  # 百分比收益率
+        return self.series[code]
+
+    def wsd(self, codes, fields, beginTime, endTime, options=''):
+        codes = 行情数据接口._split(codes)
+        first, last = np.searchsorted(self.business_serials, [交易日历.str2date(beginTime).serialNumber(),
+                                                              交易日历.str2date(endTime).serialNumber() + 1])
+        times = [datetime.datetime.strptime(交易日历.date2str(ql.Date(int(n))), '%Y-%m-%d') for n in self.business_serials[first:last]]
+        return 行情数据接口.MarketData(codes, [fields], times, [self._get_series(code)[first:last].tolist() for code in codes])
+
+    def wss(self, codes, fields, options=''):
+        # 截面数据取每个代码序列的最后一项
+        codes, fields = 行情数据接口._split(codes), 行情数据接口._split(fields)
+        return 行情数据接口.MarketData(codes, fields, [], [[float(self._get_series(code)[-1]) for code in codes] for _ in fields])
+
+    def wsq(self, codes, fields):
+        return self.wss(codes, fields)
+
+
+# 定价模型的固定参数
+def _get_model_fixtures():
+    import 股票期权定价模型 as models
+    european = {'stockPrice': 100.0, 'strikePrice': 100.0, 'evaluationDate': EVALUATION_DATE, 'exerciseDate': MATURITY_DATE,
+                'optionType': ql.Option.Call, 'riskFree': 0.01, 'volatility': 0.2}
+    american = {'stockPrice': 100.0, 'strikePrice': 100.0, 'evaluationDate': EVALUATION_DATE, 'maturityDate': MATURITY_DATE,
+                'optionType': ql.Option.Put, 'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.2}
+    asian = dict(european, historyPrices=[99.0, 98.7, 101.5, 101.4], dividendRate=0.0, seed=1234)
+    return [
+        (models.EuropeanOptionBSAnalytic, european),
+        (models.EuropeanOptionBSMAnalytic, dict(european, dividendRate=0.0)),
+        (models.EuropeanOptionBSMMonteCarlo, dict(european, dividendRate=0.0, seed=1234)),
+        (models.EuropeanOptionDiscreteDividendsBSAnalytic, dict(european, dividendDates=['2014-04-10', '2014-05-12'], dividends=[1.0, 1.0])),
+        (models.AmericanOptionBSMBinomial, american),
+        (models.AmericanOptionBSMFD, american),
+        (models.AmericanOptionBSMMonteCarlo, dict(american, seed=1234)),
+        (models.AmericanOptionBSMLongstaffSchwartz, dict(american, seed=1234)),
+        (models.DiscreteArithmeticAveragingPriceAsiannOptionBSMMonteCarlo, asian),
+        (models.DiscreteArithmeticAveragingPriceAsiannOptionBSMControlVariateMonteCarlo, asian),
+    ]
+
+
+def _get_path_generator_fixtures():
+    import 路径生成器 as generators
+    fixtures = []
+    for path_number in PATH_NUMBERS:
+        fixtures.append((generators.BrownianMCReturnPathGeneratorByEverydayReturn, {'path_number': path_number, 'drift': 0.0, 'volatility': 0.3}))
+        fixtures.append((generators.CorrelatedGBMReturnPathGeneratorByEverydayReturn,
+                         {'path_number': path_number, 'drift': [0.0, 0.0], 'volatility': [0.3, 0.25], 'correlation': [[1.0, 0.9], [0.9, 1.0]], 'seed': 1234}))
+        fixtures.append((generators.BootstrapReturnPathGeneratorByEverydayReturn,
+                         {'path_number': path_number, 'history_start_date': '2008-01-02', 'history_end_date': '2018-03-07', 'seed': 1234}))
+    for path_number in HISTORY_PATH_NUMBERS:
+        fixtures.append((generators.HistoryReturnPathGeneratorByEverydayReturn,
+                         {'path_number': path_number, 'history_end_date': '2018-03-07', 'history_frequrncy': 4}))
+    return fixtures
+
+
+# 计时
+def _measure(function, repeat):
+    # 返回repeat次调用中最短的耗时（秒）
+    times = []
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - time_start)
+    return min(times)
+
+
+def _measure_model(Derivative, coefsOfDerivative, method, repeat):
+    # 每次在新构造的模型上调用method，不计构造时间
+    times = []
+    for _ in range(repeat):
+        model = Derivative(**coefsOfDerivative)
+        time_start = time.perf_counter()
+        getattr(model, method)()
+        times.append(time.perf_counter() - time_start)
+    return min(times)
+
+
+def run_benchmarks(repeat=5, keyword=None):
+    # 返回{项目名: 耗时（秒）}，keyword不为None时只运行名称中包含keyword的项目
+    行情数据接口.set_provider(FixtureProvider())
+    results = {}
+
+    def record(name, function):
+        if keyword is None or keyword in name:
+            try:
+                results[name] = function()
+            except Exception as e:
+                # 当前环境不能运行的项目（如QuantLib版本不支持）不记录，不影响其它项目
+                print('%-90s失败：%r' % (name, e))
+                return
+            print('%-90s%.6f' % (name, results[name]))
+
+    for Derivative, coefsOfDerivative in _get_model_fixtures():
+        name = Derivative.__name__
+        record('model/%s/construct' % name, lambda: _measure(lambda: Derivative(**coefsOfDerivative), repeat))
+        record('model/%s/value' % name, lambda: _measure_model(Derivative, coefsOfDerivative, 'value', repeat))
+        record('model/%s/delta' % name, lambda: _measure_model(Derivative, coefsOfDerivative, 'delta', repeat))
+    for PathGenerator, coefsOfPathGenerator in _get_path_generator_fixtures():
+        name = 'path/%s/%i' % (PathGenerator.__name__, coefsOfPathGenerator['path_number'])
+        np.random.seed(1234)
+        record(name, lambda: _measure(lambda: PathGenerator('000300.SH', BACKTEST_START_DATE, BACKTEST_END_DATE, **coefsOfPathGenerator).get_data(), repeat))
+    for name, function in _get_backtest_fixtures():
+        record(name, lambda: _measure(function, max(1, repeat // 2)))
+    return results
+
+
+def _get_backtest_fixtures():
+    from 单资产衍生品对冲回测 import SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption
+    from 路径生成器 import BrownianMCReturnPathGeneratorByEverydayReturn
+    from 股票期权定价模型 import EuropeanOptionBSMAnalytic
+    coefsOfDerivative = {'strikePrice': 1.0, 'optionType': ql.Option.Call, 'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.3}
+    fixtures = []
+    for delta_mode, path_number in [('tensor', 10000), ('row', 10000), ('object', 200), ('pool', 200)]:
+        def backtest(delta_mode=delta_mode, path_number=path_number):
+            np.random.seed(1234)
+            backtest_model = SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption(
+                '000300.SH', BACKTEST_START_DATE, BACKTEST_END_DATE, BrownianMCReturnPathGeneratorByEverydayReturn,
+                {'path_number': path_number, 'drift': 0.0, 'volatility': 0.3}, EuropeanOptionBSMAnalytic, coefsOfDerivative, delta_mode=delta_mode)
+            backtest_model.get_hedging_profit_and_loss()
+        fixtures.append(('backtest/%s/%i' % (delta_mode, path_number), backtest))
+    return fixtures
+
+
+# 记录与比较
+def _get_environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit, 'python': platform.python_version(),
+            'numpy': np.__version__, 'QuantLib': ql.__version__, 'machine': platform.node()}
+
+
+def save_results(results, history_file=HISTORY_FILE):
+    record = dict(_get_environment(), results=results)
+    with open(history_file, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return record
+
+
+def load_history(history_file=HISTORY_FILE):
+    with open(history_file, encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare(history_file=HISTORY_FILE, baseline=-2, current=-1, threshold=0.1, min_difference=2e-5):
+    # 比较history_file中第current次与第baseline次运行，返回耗时增加超过threshold（比例）的[(项目名, 基准耗时, 当前耗时), ...]
+    # 耗时之差小于min_difference（秒）的项目视为计时误差，不记为退化或改进
+    history = load_history(history_file)
+    baseline_record, current_record = history[baseline], history[current]
+    print('基准：%s %s，当前：%s %s' % (baseline_record['time'], baseline_record['commit'], current_record['time'], current_record['commit']))
+    regressions = []
+    for name, current_time in current_record['results'].items():
+        baseline_time = baseline_record['results'].get(name)
+        if baseline_time is None:
+            continue
+        ratio = current_time / baseline_time - 1.0 if abs(current_time - baseline_time) >= min_difference else 0.0
+        flag = '退化' if ratio > threshold else ('改进' if ratio < -threshold else '')
+        print('%-90s%12.6f%12.6f%+9.1f%% %s' % (name, baseline_time, current_time, (current_time / baseline_time - 1.0) * 100, flag))
+        if ratio > threshold:
+            regressions.append((name, baseline_time, current_time))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='定价模型、路径生成器和回测的基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parser_run = subparsers.add_parser('run')
+    parser_run.add_argument('--repeat', type=int, default=5)
+    parser_run.add_argument('--filter', default=None)
+    parser_run.add_argument('--history', default=HISTORY_FILE)
+    parser_compare = subparsers.add_parser('compare')
+    parser_compare.add_argument('--baseline', type=int, default=-2)
+    parser_compare.add_argument('--current', type=int, default=-1)
+    parser_compare.add_argument('--threshold', type=float, default=0.1)
+    parser_compare.add_argument('--min-difference', type=float, default=2e-5)
+    parser_compare.add_argument('--history', default=HISTORY_FILE)
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        save_results(run_benchmarks(args.repeat, args.filter), args.history)
+        return 0
+    regressions = compare(args.history, args.baseline, args.current, args.threshold, args.min_difference)
+    print('%i项退化' % len(regressions))
+    return 1 if regressions else 0
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 基准测试测试1():
+    # 只运行欧式解析模型，记录两次后比较
+    import tempfile
+    history_file = os.path.join(tempfile.mkdtemp(), '基准测试记录.jsonl')
+    for _ in range(2):
+        save_results(run_benchmarks(repeat=3, keyword='EuropeanOptionBSMAnalytic'), history_file)
+    print(compare(history_file, threshold=0.5))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+# 导入耗时
+# 每个模块在新的Python进程中导入并计时，不受已导入模块的影响，多进程计算中每个子进程启动时都要付出这部分时间
+# 同时检查导入后不应加载的可选依赖：WindPy只在向Wind请求数据时导入，pygal、matplotlib只在画图时导入，
+# statsmodels、xlrd只在回归和读取excel时导入，scipy只在需要正态分布函数、Sobol序列或优化时导入
+# 命令行用法：
+# python 导入耗时.py [--repeat 3] [--scale 1.0]    超出预算或加载了不应加载的依赖时返回1
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPTIONAL_DEPENDENCIES = ('WindPy', 'pygal', 'matplotlib', 'statsmodels', 'xlrd')
+# (模块所在目录, 模块名, 导入耗时预算（秒）, 导入后不应加载的模块)，预算包括numpy、QuantLib等必需依赖的导入时间
+IMPORT_BUDGETS = [
+    ('衍生品定价模型', '交易日历', 0.5, OPTIONAL_DEPENDENCIES + ('scipy', 'pandas')),
+    ('衍生品定价模型', '蒙特卡洛引擎', 0.5, OPTIONAL_DEPENDENCIES + ('scipy', 'pandas')),
+    ('衍生品定价模型', '股票期权定价模型', 0.6, OPTIONAL_DEPENDENCIES + ('scipy', 'pandas')),
+    ('衍生品定价模型', '运行统计', 0.5, OPTIONAL_DEPENDENCIES + ('scipy', 'pandas')),
+    ('行情数据', '行情数据接口', 0.5, OPTIONAL_DEPENDENCIES + ('scipy', 'pandas')),
+    ('衍生品回测/日收盘衍生品回测', '回测结果存储', 0.5, OPTIONAL_DEPENDENCIES + ('scipy', 'pandas')),
+    ('衍生品回测/日收盘衍生品回测', '路径生成器', 1.2, OPTIONAL_DEPENDENCIES + ('scipy',)),
+    ('衍生品回测/日收盘衍生品回测', '单资产衍生品对冲回测', 1.2, OPTIONAL_DEPENDENCIES + ('scipy',)),
+    ('衍生品回测/日收盘衍生品回测', '参数扫描', 1.2, OPTIONAL_DEPENDENCIES + ('scipy',)),
+    ('主观交易分析工具/期权主观交易分析工具/股票期权主观交易分析工具', 'tools', 0.8, OPTIONAL_DEPENDENCIES + ('scipy',)),
+    ('主观交易分析工具/债券市场主观分析工具', '国债日行情分析', 0.5, OPTIONAL_DEPENDENCIES + ('scipy',)),
+    ('衍生品应用/期货套期保值分析/股票-股指期货套期保值', 'utils', 0.5, OPTIONAL_DEPENDENCIES + ('scipy',)),
+]
+# 各模块之间的相互导入依赖这些目录在sys.path中
+PATH_DIRECTORIES = ('衍生品定价模型', '衍生品回测/日收盘衍生品回测', '行情数据')
+_IMPORT_SCRIPT = '''
+import json, sys, time
+sys.path[:0] = %r
+time_start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - time_start
+print(json.dumps({'time': elapsed, 'loaded': [name for name in %r if name in sys.modules]}))
+'''
+
+
+def measure_import(directory, module_name, forbidden=(), repeat=3):
+    # 在新进程中导入模块repeat次，返回(最短耗时（秒）, 导入后已加载的forbidden中的模块)
+    # 子进程不读取行情数据，WindPy未安装时同样可以运行
+    paths = [os.path.join(ROOT, directory)] + [os.path.join(ROOT, d) for d in PATH_DIRECTORIES if d != directory]
+    script = _IMPORT_SCRIPT % (paths, module_name, tuple(forbidden))
+    times = []
+    loaded = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=ROOT,
+                                   env=dict(os.environ, MARKET_DATA_PROVIDER='offline'))
+        if completed.returncode != 0:
+            raise Exception('导入%s失败：%s' % (module_name, completed.stderr.strip().splitlines()[-1:]))
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        times.append(result['time'])
+        loaded = result['loaded']
+    return min(times), loaded
+
+
+def check_import_budgets(repeat=3, scale=1.0, budgets=None):
+    # 检查每个模块的导入耗时是否超过预算乘以scale（较慢的机器上可以放大），以及是否加载了不应加载的模块
+    # 返回{模块名: {'time', 'budget', 'loaded', 'passed'}}，导入失败（如缺少必需依赖）的模块不记录
+    results = {}
+    for directory, module_name, budget, forbidden in (IMPORT_BUDGETS if budgets is None else budgets):
+        try:
+            elapsed, loaded = measure_import(directory, module_name, forbidden, repeat)
+        except Exception as e:
+            print('%-30s失败：%s' % (module_name, e))
+            continue
+        passed = elapsed <= budget * scale and not loaded
+        results[module_name] = {'time': elapsed, 'budget': budget * scale, 'loaded': loaded, 'passed': passed}
+        print('%-30s%10.4f%10.4f  %s %s' % (module_name, elapsed, budget * scale, '通过' if passed else '超出',
+                                             ','.join(loaded)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='各模块在新进程中的导入耗时与可选依赖检查')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scale', type=float, default=1.0)
+    args = parser.parse_args(argv)
+    results = check_import_budgets(args.repeat, args.scale)
+    failed = [name for name, result in results.items() if not result['passed']]
+    print('%i个模块超出预算' % len(failed))
+    return 1 if failed else 0
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 导入耗时测试1():
+    # 纯定价和纯仿真用到的模块，导入后不应加载WindPy、pygal和scipy
+    budgets = [item for item in IMPORT_BUDGETS if item[1] in ('股票期权定价模型', '路径生成器', '单资产衍生品对冲回测')]
+    print(check_import_budgets(repeat=2, budgets=budgets))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+import datetime
+import hashlib
+import os
+import numpy as np
+from abc import ABCMeta, abstractmethod
+
+
+# 行情数据接口
+# 工具中的w.start()、w.wsd()、w.wss()、w.wsq()通过本模块的w调用，由当前的数据源提供数据：
+# 'wind'-直接调用WindPy，'cache'（默认）-先查本地缓存，缺少的日期才从WindPy补充，'offline'-只使用本地缓存，不需要WindPy
+# 数据源可由环境变量MARKET_DATA_PROVIDER设定，或在程序中调用set_provider
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+
+# 与WindPy返回结果相同结构的数据对象
+class MarketData(object):
+    def __init__(self, codes, fields, times, data, error_code=0):
+        self.Codes = codes
+        self.Fields = fields
+        self.Times = times
+        self.Data = data
+        self.ErrorCode = error_code
+
+
+# 数据源的基类，缺少wsd、wss、wsq任一方法的数据源在构造时即报错
+class MarketDataProvider(metaclass=ABCMeta):
+    def start(self):
+        pass
+
+    @abstractmethod
+    def wsd(self, codes, fields, beginTime, endTime, options=''):
+        # 日期序列数据，多个代码时只能有一个指标
+        pass
+
+    @abstractmethod
+    def wss(self, codes, fields, options=''):
+        # 截面数据，Data[指标][代码]
+        pass
+
+    @abstractmethod
+    def wsq(self, codes, fields):
+        # 实时行情快照，Data[指标][代码]
+        pass
+
+
+# 直接调用WindPy的数据源，第一次使用时才导入WindPy
+class WindProvider(MarketDataProvider):
+    def __init__(self):
+        self._w = None
+
+    def start(self):
+        if self._w is None:
+            from WindPy import w
+            w.start()
+            self._w = w
+
+    def wsd(self, codes, fields, beginTime, endTime, options=''):
+        self.start()
+        return self._check(self._w.wsd(codes, fields, beginTime, endTime, options))
+
+    def wss(self, codes, fields, options=''):
+        self.start()
+        return self._check(self._w.wss(codes, fields, options))
+
+    def wsq(self, codes, fields):
+        self.start()
+        return self._check(self._w.wsq(codes, fields))
+
+    @staticmethod
+    def _check(result):
+        if result.ErrorCode != 0:
+            raise Exception('Wind数据获取错误，错误代码：%s，%s' % (result.ErrorCode, result.Data))
+        return result
+
+
+# 带本地缓存的数据源
+# 缓存按(代码, 指标, 参数)分别保存为npz文件：wsd保存日期、数值和已覆盖的日期区间，只向source请求未覆盖的日期区间
+# wss按(代码, 指标, 参数)保存数值，wsq总是向source请求，只记录最新快照供离线使用
+# source为None时为离线数据源，缓存中没有的数据抛出异常
+class CachedProvider(MarketDataProvider):
+    def __init__(self, source, cache_dir=CACHE_DIR):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.requests = 0  # 向source请求数据的次数
+        self.hits = 0  # 完全由缓存提供的调用次数
+
+    def start(self):
+        pass  # 需要向source请求数据时才启动
+
+    def wsd(self, codes, fields, beginTime, endTime, options=''):
+        codes, fields = _split(codes), _split(fields, lower=True)
+        if len(codes) > 1 and len(fields) > 1:
+            raise Exception('wsd多个代码时只能有一个指标')
+        beginTime, endTime = _date_string(beginTime), _date_string(endTime)
+        keys = [(code, field) for code in codes for field in fields]
+        series = {key: self._load('wsd', key, options) for key in keys}
+        # 按缺少的日期区间分组，同一组的代码（或指标）一次请求
+        missing = {}
+        for key in keys:
+            ranges = _missing_ranges(series[key]['covered'], beginTime, endTime)
+            if ranges:
+                missing.setdefault(tuple(ranges), []).append(key)
+        if not missing:
+            self.hits += 1
+        for ranges, group in missing.items():
+            request_codes = [code for code in codes if any(c == code for c, _ in group)]
+            request_fields = [field for field in fields if any(f == field for _, f in group)]
+            for rangeBegin, rangeEnd in ranges:
+                result = self._request('wsd', ','.join(request_codes), ','.join(request_fields), rangeBegin, rangeEnd, options)
+                times = [_date_string(t) for t in result.Times]
+                for i, row in enumerate(result.Data):
+                    key = (request_codes[i], fields[0]) if len(codes) > 1 else (codes[0], request_fields[i])
+                    _merge(series[key], times, row)
+            for key in group:
+                _cover(series[key], ranges)
+                self._save('wsd', key, options, series[key])
+        # 按日期对齐输出
+        times = sorted(set(t for key in keys for t in series[key]['dates'] if beginTime <= t <= endTime))
+        data = []
+        for key in keys:
+            values = dict(zip(series[key]['dates'], series[key]['values']))
+            data.append([values.get(t) for t in times])
+        return MarketData(codes, fields, [datetime.datetime.strptime(t, '%Y-%m-%d') for t in times], data)
+
+    def wss(self, codes, fields, options=''):
+        codes, fields = _split(codes), _split(fields, lower=True)
+        values = {}
+        missing_codes = []
+        for code in codes:
+            for field in fields:
+                record = self._load('wss', (code, field), options)
+                if record is None:
+                    missing_codes.append(code)
+                    break
+                values[(code, field)] = record['value']
+        if missing_codes:
+            result = self._request('wss', ','.join(missing_codes), ','.join(fields), options)
+            for i, field in enumerate(fields):
+                for j, code in enumerate(missing_codes):
+                    values[(code, field)] = result.Data[i][j]
+                    self._save('wss', (code, field), options, {'value': result.Data[i][j]})
+        else:
+            self.hits += 1
+        return MarketData(codes, fields, [], [[values[(code, field)] for code in codes] for field in fields])
+
+    def wsq(self, codes, fields):
+        codes, fields = _split(codes), _split(fields, lower=True)
+        if self.source is None:
+            # 离线时使用记录的最新快照
+            data = [[self._require('wsq', (code, field), '')['value'] for code in codes] for field in fields]
+            return MarketData(codes, fields, [], data)
+        result = self._request('wsq', ','.join(codes), ','.join(fields))
+        for i, field in enumerate(fields):
+            for j, code in enumerate(codes):
+                self._save('wsq', (code, field), '', {'value': result.Data[i][j]})
+        return result
+
+    def _request(self, method, *args):
+        if self.source is None:
+            raise Exception('离线数据源中没有%s%s的数据' % (method, args))
+        self.requests += 1
+        return getattr(self.source, method)(*args)
+
+    def _path(self, method, key, options):
+        name = hashlib.md5(repr((key, options)).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, method, name + '.npz')
+
+    def _load(self, method, key, options):
+        path = self._path(method, key, options)
+        if not os.path.exists(path):
+            if method == 'wsd':
+                return {'dates': np.array([], dtype='U10'), 'values': np.array([]), 'covered': np.empty((0, 2), dtype='U10')}
+            return None
+        with np.load(path, allow_pickle=True) as record:
+            return {name: (record[name][()] if record[name].ndim == 0 else record[name]) for name in record.files}
+
+    def _require(self, method, key, options):
+        record = self._load(method, key, options)
+        if record is None:
+            raise Exception('离线数据源中没有%s%s的数据' % (method, key))
+        return record
+
+    def _save(self, method, key, options, record):
+        path = self._path(method, key, options)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        record = dict(record, key=np.array(repr((key, options))))
+        # datetime等非数值的数据以object数组保存
+        np.savez(path, **{name: np.array(record[name], dtype=object) if isinstance(record[name], datetime.date) else np.asarray(record[name])
+                          for name in record})
+
+
+# 辅助函数区
+def _split(items, lower=False):
+    # 'a,b'或['a', 'b']形式的代码和指标统一为列表，指标不区分大小写，统一为小写
+    if isinstance(items, str):
+        items = items.split(',')
+    return [item.strip().lower() if lower else item.strip() for item in items]
+
+
+def _date_string(date):
+    # 'YYYY-MM-DD'、'YYYYMMDD'、datetime转化为'YYYY-MM-DD'
+    if isinstance(date, (datetime.date, datetime.datetime)):
+        return date.strftime('%Y-%m-%d')
+    date = str(date).strip()
+    if len(date) == 8 and date.isdigit():
+        return date[0:4] + '-' + date[4:6] + '-' + date[6:8]
+    return date[0:10]
+
+
+def _shift_date(date, days):
+    return (datetime.datetime.strptime(date, '%Y-%m-%d') + datetime.timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def _missing_ranges(covered, beginTime, endTime):
+    # [beginTime, endTime]中不被covered的区间覆盖的部分
+    ranges = []
+    start = beginTime
+    for coveredBegin, coveredEnd in sorted(map(tuple, covered)):
+        if coveredEnd < start:
+            continue
+        if coveredBegin > endTime:
+            break
+        if coveredBegin > start:
+            ranges.append((start, _shift_date(coveredBegin, -1)))
+        start = max(start, _shift_date(coveredEnd, 1))
+    if start <= endTime:
+        ranges.append((start, endTime))
+    return ranges
+
+
+def _merge(series, times, values):
+    merged = dict(zip(series['dates'], series['values']))
+    merged.update(zip(times, values))
+    dates = sorted(merged)
+    series['dates'] = np.array(dates, dtype='U10')
+    values = [merged[d] for d in dates]
+    try:
+        series['values'] = np.array([np.nan if v is None else v for v in values], dtype=float)
+    except (TypeError, ValueError):
+        series['values'] = np.array(values, dtype=object)
+
+
+def _cover(series, ranges):
+    # 今天及以后的数据可能尚未收盘，不记为已覆盖，下次重新请求
+    today = datetime.date.today().strftime('%Y-%m-%d')
+    intervals = [tuple(r) for r in series['covered']] + [(b, min(e, _shift_date(today, -1))) for b, e in ranges]
+    intervals = sorted(r for r in intervals if r[0] <= r[1])
+    merged = []
+    for b, e in intervals:
+        if merged and b <= _shift_date(merged[-1][1], 1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((b, e))
+    series['covered'] = np.array(merged, dtype='U10').reshape(-1, 2)
+
+
+def get_provider(name):
+    if name == 'wind':
+        return WindProvider()
+    if name == 'offline':
+        return CachedProvider(None)
+    return CachedProvider(WindProvider())
+
+
+# 工具中使用的数据源代理，所有调用转发给set_provider设定的数据源
+class _ProviderProxy(object):
+    def __init__(self, provider):
+        self.provider = provider
+
+    def __getattr__(self, name):
+        return getattr(self.provider, name)
+
+
+w = _ProviderProxy(get_provider(os.environ.get('MARKET_DATA_PROVIDER', 'cache')))
+
+
+def set_provider(provider):
+    # provider为'wind'、'cache'、'offline'或MarketDataProvider对象
+    w.provider = get_provider(provider) if isinstance(provider, str) else provider
+    return w.provider
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 行情数据缓存测试1():
+    # 用一个生成数据的数据源代替WindPy，检查缓存只请求缺少的日期，以及离线数据源的读取
+    import tempfile
+
+    class FakeProvider(MarketDataProvider):
+        def wsd(self, codes, fields, beginTime, endTime, options=''):
+            print('请求', codes, fields, beginTime, endTime)
+            times = [t for t in np.arange(beginTime, _shift_date(endTime, 1), dtype='datetime64[D]').astype(datetime.datetime)
+                     if t.weekday() < 5]
+            data = [[float(t.toordinal() % 97) for t in times] for _ in _split(codes if ',' in codes else fields)]
+            return MarketData(_split(codes), _split(fields), times, data)
+
+        def wss(self, codes, fields, options=''):
+            return MarketData(_split(codes), _split(fields), [], [[1.0 for _ in _split(codes)] for _ in _split(fields)])
+
+        def wsq(self, codes, fields):
+            return self.wss(codes, fields)
+
+    cache_dir = tempfile.mkdtemp()
+    provider = CachedProvider(FakeProvider(), cache_dir)
+    first = provider.wsd('000300.SH', 'pct_chg', '2018-01-01', '2018-03-31', 'ShowBlank=0').Data[0]
+    second = provider.wsd('000300.SH', 'pct_chg', '2018-02-01', '2018-06-30', 'ShowBlank=0').Data[0]  # 只请求4月至6月
+    offline = CachedProvider(None, cache_dir).wsd('000300.SH', 'pct_chg', '2018-01-01', '2018-06-30', 'ShowBlank=0').Data[0]
+    print(len(first), len(second), len(offline), '请求次数：', provider.requests)
+
+
+if __name__ == '__main__':
+    行情数据缓存测试1()
@@ -1,53 +1,212 @@
+import functools
+import itertools
+import multiprocessing
 import numpy as np
+import pandas as pd
 import QuantLib as ql
-import pygal
 # 导入模型的设定
 import sys
 sys.path.append('D:\\programs\\DerivativesWithQuantLib\\衍生品回测\\日收盘衍生品回测')
 sys.path.append('D:\\programs\\DerivativesWithQuantLib\\衍生品定价模型')
+import 交易日历
 
 
 class SingleAssetDerivativeBacktestDayBase(object):
-    def __init__(self, asset, start_date, end_date, PathGenerator, coefsOfPathGenerator, Derivative, coefsOfDerivative, slippage=0.0, commission=0.0):
+    # get_hedging_profit_and_loss返回的各项结果的名称，保存回测结果时使用
+    result_names = ('hedging_profit_and_loss',)
+
+    def __init__(self, asset, start_date, end_date, PathGenerator, coefsOfPathGenerator, Derivative, coefsOfDerivative, slippage=0.0, commission=0.0, delta_mode='tensor', processes=1, block_size=None):
         self.asset = asset
         self.start_date = start_date  # 回测开始日期，此时刻的asset的价格为1
         self.end_date = end_date  # 回测到期日，也是期权的到期日
         # 生成仿真价格路径
         # self.simPaths表示计算标的的价格走势，self.simPathsHedging表示对冲标的的价格走势
-        self.simPaths, self.simPathsHedging = PathGenerator(asset, start_date, end_date, **coefsOfPathGenerator).get_data()
-        self.date_list = [self.date2str(d) for d in list(self.simPaths.index.values)]
+        # block_size不为None时为流式模式：不一次生成全部路径，由路径生成器每次生成block_size条路径，逐块计算后累积统计量
+        # 流式模式下self.simPaths和self.simPathsHedging为None，结果通过get_hedging_statistics获得
+        self.block_size = block_size
+        self.path_generator = PathGenerator(asset, start_date, end_date, **coefsOfPathGenerator)
+        if block_size is None:
+            self.simPaths, self.simPathsHedging = self.path_generator.get_data()
+        else:
+            self.simPaths, self.simPathsHedging = None, None
+        self.date_list = [self.date2str(d) for d in self.path_generator.date_list]
         # 衍生品与其用到的其它参数
         self.Derivative = Derivative
         self.coefsOfDerivative = coefsOfDerivative
         # 滑点和手续费
         self.slippage = slippage
         self.commission = commission
+        # delta的计算方式：'tensor'-全部日期×路径一次批量计算，'row'-逐日批量计算全部路径，'object'-逐个构造衍生品模型计算
+        # 'pool'-通过定价池复用模型，只更新行情和估值日，定价池的统计见self.pricer_pool.statistics()
+        # 'cache'-通过估值缓存复用相同（量化后）行情下的delta，可以预先设定self.valuation_cache的大小和量化精度
+        # 多进程计算时每个子进程按self.valuation_cache的设定新建缓存，命中统计合并到self.valuation_cache
+        # 衍生品没有批量定价（Derivative.batch）时，'tensor'和'row'使用'object'方式
+        self.delta_mode = delta_mode
+        self.pricer_pool = None
+        self.valuation_cache = None
+        # processes大于1时，路径按列分片后在多个进程中分别计算，结果按路径顺序合并，与串行计算完全一致
+        # MC定价模型需要在coefsOfDerivative中指定seed，结果才可重复
+        self.processes = processes
 
     def get_hedging_profit_and_loss(self):
         # 计算对冲和行权造成的衍生品盈亏
         hedging_profit_and_loss = np.zeros((self.simPathsHedging.shape[0]-1, self.simPathsHedging.shape[1]))
         return hedging_profit_and_loss
 
+    def get_hedging_result(self):
+        # 根据self.processes选择串行或多进程计算get_hedging_profit_and_loss
+        if self.processes > 1:
+            return self.get_hedging_profit_and_loss_parallel(self.processes)
+        return self.get_hedging_profit_and_loss()
+
+    def get_hedging_profit_and_loss_parallel(self, processes, shard_number=None):
+        # 路径按列分为shard_number片，每片在子进程中计算get_hedging_profit_and_loss，按路径顺序合并各项结果
+        # QuantLib的估值日为进程内的全局变量，因此只能使用多进程而不是多线程
+        shard_number = processes if shard_number is None else shard_number
+        path_index_list = np.array_split(np.arange(self.simPaths.shape[1]), shard_number)
+        tasks = [(type(self), self._get_shard_state(path_index)) for path_index in path_index_list if len(path_index) > 0]
+        with multiprocessing.Pool(processes) as pool:
+            results = [self._merge_shard_result(result) for result in pool.map(_get_hedging_profit_and_loss_of_shard, tasks)]
+        if not isinstance(results[0], tuple):
+            return np.concatenate(results, axis=-1)
+        return tuple(np.concatenate(result, axis=-1) for result in zip(*results))
+
+    def _get_shard_state(self, path_index):
+        # 子进程中重建回测对象用的属性，价格路径只保留分片内的列
+        # 路径的ql.Date索引不能序列化，分片内使用默认索引（计算中只用到路径的数值）
+        return self._get_block_state(self.simPaths.values[:, path_index], self.simPathsHedging.values[:, path_index])
+
+    def _get_block_state(self, sim_path_values, sim_path_values_for_hedging, share_cache=False):
+        # 只包含一块路径的回测对象的属性，路径为np.ndarray
+        # 'cache'方式下，share_cache为True时（同一进程中逐块计算）各块共用self.valuation_cache，
+        # 否则每块使用与self.valuation_cache设定（maxsize、量化精度）相同的新缓存，命中统计由_merge_shard_result合并
+        if self.delta_mode == 'cache' and self.valuation_cache is None:
+            from 期权估值缓存 import OptionValuationCache
+            self.valuation_cache = OptionValuationCache()
+        state = dict(self.__dict__)
+        state['simPaths'] = pd.DataFrame(sim_path_values)
+        state['simPathsHedging'] = pd.DataFrame(sim_path_values_for_hedging)
+        state['path_generator'] = None
+        state['block_size'] = None
+        state['processes'] = 1
+        state['pricer_pool'] = None
+        if self.valuation_cache is not None and not share_cache:
+            state['valuation_cache'] = type(self.valuation_cache)(self.valuation_cache.maxsize, self.valuation_cache.quantization)
+        return state
+
+    def _merge_shard_result(self, shard_result):
+        # 子进程返回(结果, 估值缓存的统计)，把子进程中缓存的命中统计计入self.valuation_cache
+        result, cache_statistics = shard_result
+        if cache_statistics is not None and self.valuation_cache is not None:
+            self.valuation_cache.merge_statistics(cache_statistics)
+        return result
+
+    def iter_path_blocks(self):
+        # 按块返回(仿真价格路径, 对冲价格路径)，非流式模式下全部路径为一块
+        if self.block_size is None:
+            yield self.simPaths.values, self.simPathsHedging.values
+        else:
+            yield from self.path_generator.get_data_blocks(self.block_size)
+
+    def iter_hedging_result_blocks(self, with_paths=False):
+        # 逐块计算get_hedging_profit_and_loss，self.processes大于1时每次由多个进程各计算一块
+        # 非流式模式下self.processes大于1时，全部路径按列分为self.processes块
+        # with_paths为True时返回(路径块, 结果)
+        path_blocks = self.iter_path_blocks()
+        if self.block_size is None and self.processes > 1:
+            path_blocks = ((self.simPaths.values[:, path_index], self.simPathsHedging.values[:, path_index])
+                           for path_index in np.array_split(np.arange(self.simPaths.shape[1]), self.processes) if len(path_index) > 0)
+        if self.processes <= 1:
+            for paths in path_blocks:
+                result, _ = _get_hedging_profit_and_loss_of_shard((type(self), self._get_block_state(*paths, share_cache=True)))
+                yield (paths, result) if with_paths else result
+            return
+        with multiprocessing.Pool(self.processes) as pool:
+            while True:
+                # 每次只生成self.processes块路径，内存占用与路径总数无关
+                path_block_list = list(itertools.islice(path_blocks, self.processes))
+                if not path_block_list:
+                    break
+                results = pool.map(_get_hedging_profit_and_loss_of_shard,
+                                   [(type(self), self._get_block_state(*paths)) for paths in path_block_list])
+                results = [self._merge_shard_result(result) for result in results]
+                for paths, result in zip(path_block_list, results):
+                    yield (paths, result) if with_paths else result
+
+    def get_hedging_statistics(self, result_directory=None):
+        # 逐块计算对冲盈亏并累积统计量，流式模式与非流式模式均可使用，统计量占用的内存与路径数无关
+        # result_directory不为None时，同时把路径和各项结果按块写入该目录下的内存映射文件，见回测结果存储.py，
+        # 此时统计量也保留每条路径的总盈亏，分位数为精确值
+        statistics = HedgingStatistics(keep_paths=result_directory is not None)
+        store = None if result_directory is None else self._create_result_store(result_directory)
+        path_start = 0
+        for paths, result in self.iter_hedging_result_blocks(with_paths=True):
+            result = result if isinstance(result, tuple) else (result,)
+            if store is not None:
+                store.write_block(path_start, sim_path=paths[0], sim_path_for_hedging=paths[1], **dict(zip(self.result_names, result)))
+            path_start += paths[0].shape[1]
+            statistics.update(*[dict(zip(self.result_names, result)).get(name) for name in ('asset_delta', 'hedging_profit_and_loss', 'payoff')])
+        if store is not None:
+            store.close()
+        return statistics
+
+    def _create_result_store(self, result_directory):
+        from 回测结果存储 import BacktestResultStore
+        path_number = self.path_generator.path_number if self.simPaths is None else self.simPaths.shape[1]
+        return BacktestResultStore.create(result_directory, self.date_list, path_number,
+                                          backtest=type(self).__name__, asset=self.asset, start_date=self.start_date, end_date=self.end_date,
+                                          PathGenerator=type(self.path_generator).__name__, Derivative=self.Derivative.__name__,
+                                          coefsOfDerivative=self.coefsOfDerivative, slippage=self.slippage, commission=self.commission,
+                                          delta_mode=self.delta_mode)
+
     def summary(self):
         pass
 
     def str2date(self, string):
         # 2010-01-01格式的日期转化为ql.Date对象的函数
-        string = [int(s) for s in string.split('-')]
-        date = ql.Date(string[2], string[1], string[0])
-        return date
+        return 交易日历.str2date(string)
 
     def date2str(self, date):
-        # 2010-01-01格式的日期转化为ql.Date对象的函数
-        date = date.to_date()
-        date = date.strftime('%Y-%m-%d')
-        return date
+        # ql.Date对象转化为2010-01-01格式的日期
+        return 交易日历.date2str(date)
 
 
 class SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption(SingleAssetDerivativeBacktestDayBase):
     # 适用于欧式期权
     # 计算期权的delta值，用delta值作为对冲比例
+    result_names = ('asset_delta', 'hedging_profit_and_loss', 'payoff')
+
     def get_asset_delta(self):
+        if self.delta_mode in ('object', 'pool', 'cache') or getattr(self.Derivative, 'batch', None) is None:
+            return self._get_asset_delta_by_object()
+        asset_delta = np.zeros(self.simPaths.shape)  # 最后一日全部平仓，delta值都是零
+        exerciseDate = self.end_date
+        if self.delta_mode == 'row':
+            for date_index in range(len(self.date_list) - 1):
+                asset_delta[date_index] = self.Derivative.batch(stockPrice=self.simPaths.values[date_index],
+                                                                evaluationDate=self.date_list[date_index],
+                                                                exerciseDate=exerciseDate,
+                                                                **self.coefsOfDerivative)['delta']
+        else:
+            evaluationDate = np.array(self.date_list[:-1])[:, np.newaxis]  # 与路径矩阵按列广播
+            asset_delta[:-1] = self.Derivative.batch(stockPrice=self.simPaths.values[:-1],
+                                                     evaluationDate=evaluationDate,
+                                                     exerciseDate=exerciseDate,
+                                                     **self.coefsOfDerivative)['delta']
+        return asset_delta
+
+    def _get_asset_delta_by_object(self):
+        if self.delta_mode == 'pool':
+            from 期权定价池 import OptionPricerPool
+            self.pricer_pool = OptionPricerPool()
+            Derivative = functools.partial(self.pricer_pool.get, self.Derivative)
+        elif self.delta_mode == 'cache':
+            from 期权估值缓存 import OptionValuationCache
+            if self.valuation_cache is None:
+                self.valuation_cache = OptionValuationCache()
+            Derivative = functools.partial(_CachedDerivative, self.valuation_cache, self.Derivative)
+        else:
+            Derivative = self.Derivative
         asset_delta = np.zeros(self.simPaths.shape)
         date_number = len(self.date_list)
         path_number = self.simPaths.shape[1]
@@ -60,10 +219,10 @@ class SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption(SingleAssetDeriva
                     stockPrice = self.simPaths.values[date_index, path_index]  # 获取虚拟时刻的股票头寸
                     evaluationDate = date  # 获取期权股指
                     exerciseDate = self.end_date
-                    option = self.Derivative(stockPrice=stockPrice,
-                                             evaluationDate=evaluationDate,
-                                             exerciseDate=exerciseDate,
-                                             **self.coefsOfDerivative)
+                    option = Derivative(stockPrice=stockPrice,
+                                        evaluationDate=evaluationDate,
+                                        exerciseDate=exerciseDate,
+                                        **self.coefsOfDerivative)
                     delta_value = option.delta()
                     asset_delta[date_index, path_index] = delta_value
         return asset_delta
@@ -81,22 +240,55 @@ class SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption(SingleAssetDeriva
             payoff = np.ones_like(price_exercise_date)
         return payoff
 
-    def get_hedging_profit_and_loss(self):
-        asset_delta = self.get_asset_delta()
-        payoff = self.get_payoff()
+    def get_hedging_profit_and_loss_before_cost(self, asset_delta):
+        # 不计交易成本的delta对冲的每日盈亏
         hedging_profit_and_loss = np.zeros_like(self.simPathsHedging.values)
         hedging_profit_and_loss[1:] = np.diff(self.simPathsHedging.values, axis=0) * asset_delta[0:-1, :]  # delta对冲的盈亏
+        return hedging_profit_and_loss
+
+    def get_trading_amount(self, asset_delta):
+        # 每日调仓的成交金额，乘以self.slippage * self.commission为交易成本
         asset_delta_delta = np.diff(np.r_[np.ones((1, asset_delta.shape[1])), asset_delta], axis=0)  # 每日调仓量
-        hedging_profit_and_loss -= (np.abs(self.simPathsHedging.values * asset_delta_delta) * self.slippage * self.commission)  # delta对冲盈亏加入手续费影响
+        return np.abs(self.simPathsHedging.values * asset_delta_delta)
+
+    def get_hedging_profit_and_loss(self):
+        asset_delta = self.get_asset_delta()
+        payoff = self.get_payoff()
+        hedging_profit_and_loss = self.get_hedging_profit_and_loss_before_cost(asset_delta)
+        hedging_profit_and_loss -= (self.get_trading_amount(asset_delta) * self.slippage * self.commission)  # delta对冲盈亏加入手续费影响
         hedging_profit_and_loss[-1] = hedging_profit_and_loss[-1] - payoff  # payoff的支出
         return asset_delta, hedging_profit_and_loss, payoff
 
-    def summary(self):
-        asset_delta, hedging_profit_and_loss, payoff = self.get_hedging_profit_and_loss()
+    def summary(self, report_mode='paths', percentiles=(5, 25, 50, 75, 95), sample_number=0, bins=50, seed=None):
+        # report_mode：'paths'-每条路径画一条线，'fan'-只画每日的分位数带和盈亏分布直方图，画图时间与路径数无关
+        # 'fan'模式下percentiles为分位数带的分位数，sample_number为随机抽取画出的路径数，bins为直方图的分组数
+        if self.block_size is not None:
+            # 流式模式下不保留全部路径，只输出累积的统计量
+            statistics = self.get_hedging_statistics()
+            print('路径数：', statistics.path_number)
+            print('对冲和payoff盈亏的均值与标准差:', statistics.mean(), statistics.std())
+            print('对冲和payoff盈亏图的分位数计算值:')
+            print(*statistics.percentile([10, 25, 50, 75, 90]))
+            if report_mode == 'fan':
+                _render_histogram('累积对冲和payoff盈亏分布', *statistics.histogram(bins), 'data\\累积对冲和payoff盈亏分布.svg')
+            return
+        asset_delta, hedging_profit_and_loss, payoff = self.get_hedging_result()
         all_hedging_profit_and_loss = np.sum(hedging_profit_and_loss, axis=0)
         sim_path_values = self.simPaths.values
         path_number = self.simPaths.shape[1]
-        # 画图
+        if report_mode == 'fan':
+            sample_index = np.sort(np.random.default_rng(seed).choice(path_number, min(sample_number, path_number), replace=False))
+            _render_fan_chart('仿真价格路径', self.date_list, sim_path_values, percentiles, sample_index, 'data\\仿真价格路径.svg')
+            _render_fan_chart('Delta值', self.date_list, asset_delta, percentiles, sample_index, 'data\\Delta值.svg')
+            _render_fan_chart('当日盯市与Payoff之和的盈亏图', self.date_list, hedging_profit_and_loss, percentiles, sample_index,
+                              'data\\当日盯市与Payoff之和的盈亏图.svg')
+            _render_histogram('累积对冲和payoff盈亏分布', *np.histogram(all_hedging_profit_and_loss, bins=bins), 'data\\累积对冲和payoff盈亏分布.svg')
+            _render_histogram('payoff分布', *np.histogram(payoff, bins=bins), 'data\\payoff分布.svg')
+            print('对冲和payoff盈亏图的分位数计算值:')
+            print(*np.percentile(all_hedging_profit_and_loss, [10, 25, 50, 75, 90]))
+            return
+        # 画图，pygal只在画图时导入
+        import pygal
         # 仿真价格路径
         line_chart_sim_path_values = pygal.Line()
         line_chart_sim_path_values.title = '仿真价格路径'
@@ -139,6 +331,190 @@ class SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption(SingleAssetDeriva
               np.percentile(all_hedging_profit_and_loss, 90))
 
 
+class HedgingStatistics(object):
+    # 按路径块累积的对冲结果统计量，占用的内存与路径数无关
+    # 每日的delta和盈亏只累积按路径的和与平方和，每条路径的总盈亏累积均值、方差和流式直方图（用于分位数和分布图）
+    # keep_paths为True时另外保留每条路径的总盈亏，分位数和分布图为精确值
+    def __init__(self, keep_paths=False, bin_number=4096):
+        self.path_number = 0
+        self.asset_delta_sum = 0.0  # 每日delta按路径求和
+        self.profit_and_loss_sum = 0.0  # 每日盈亏按路径求和
+        self.profit_and_loss_square_sum = 0.0
+        self.payoff_sum = 0.0
+        self.total_mean = 0.0  # 每条路径总盈亏的均值
+        self.total_square_deviation = 0.0  # 每条路径总盈亏与均值之差的平方和
+        self.total_histogram = StreamingHistogram(bin_number)
+        self.keep_paths = keep_paths
+        self._all_profit_and_loss = []  # keep_paths为True时每块路径的总盈亏
+
+    def update(self, asset_delta, hedging_profit_and_loss, payoff):
+        # 加入一块路径的结果，asset_delta和payoff可以为None
+        block_path_number = hedging_profit_and_loss.shape[1]
+        if asset_delta is not None:
+            self.asset_delta_sum += np.sum(asset_delta, axis=1)
+        self.profit_and_loss_sum += np.sum(hedging_profit_and_loss, axis=1)
+        self.profit_and_loss_square_sum += np.sum(hedging_profit_and_loss ** 2, axis=1)
+        if payoff is not None:
+            self.payoff_sum += np.sum(payoff)
+        total = np.sum(hedging_profit_and_loss, axis=0)
+        # 按块合并均值和离差平方和（Chan等的合并公式），避免平方和相减的精度损失
+        block_mean = np.mean(total)
+        path_number = self.path_number + block_path_number
+        difference = block_mean - self.total_mean
+        self.total_square_deviation += np.sum((total - block_mean) ** 2) + difference ** 2 * self.path_number * block_path_number / path_number
+        self.total_mean += difference * block_path_number / path_number
+        self.path_number = path_number
+        self.total_histogram.update(total)
+        if self.keep_paths:
+            self._all_profit_and_loss.append(total)
+
+    @property
+    def all_profit_and_loss(self):
+        # 每条路径的累积对冲和payoff盈亏，只在keep_paths为True时保留
+        if not self.keep_paths:
+            raise Exception('未保留每条路径的盈亏，需要在get_hedging_statistics中指定result_directory')
+        if len(self._all_profit_and_loss) > 1:
+            self._all_profit_and_loss = [np.concatenate(self._all_profit_and_loss)]
+        return self._all_profit_and_loss[0] if self._all_profit_and_loss else np.zeros(0)
+
+    def mean(self):
+        return self.total_mean
+
+    def std(self):
+        return np.sqrt(self.total_square_deviation / self.path_number)
+
+    def percentile(self, q):
+        # 未保留每条路径时为流式直方图的近似值，误差不超过直方图一组的宽度
+        if self.keep_paths:
+            return np.percentile(self.all_profit_and_loss, q)
+        return self.total_histogram.percentile(q)
+
+    def histogram(self, bins):
+        # 每条路径总盈亏的分布，返回与np.histogram相同的(各组个数, 分组边界)
+        if self.keep_paths:
+            return np.histogram(self.all_profit_and_loss, bins=bins)
+        return self.total_histogram.histogram(bins)
+
+    def mean_asset_delta(self):
+        # 每日delta的路径平均
+        return self.asset_delta_sum / self.path_number
+
+    def mean_profit_and_loss(self):
+        # 每日盈亏的路径平均
+        return self.profit_and_loss_sum / self.path_number
+
+    def std_profit_and_loss(self):
+        mean = self.mean_profit_and_loss()
+        return np.sqrt(np.maximum(self.profit_and_loss_square_sum / self.path_number - mean ** 2, 0.0))
+
+    def mean_payoff(self):
+        return self.payoff_sum / self.path_number
+
+
+class StreamingHistogram(object):
+    # 内存固定的流式直方图
+    # bin_number个等宽分组覆盖[origin, origin + bin_number * width)，新数据超出范围时相邻两组合并、宽度加倍，直到覆盖全部数据
+    # 分位数在组内线性插值，误差不超过一组的宽度，约为数据范围的2 / bin_number
+    def __init__(self, bin_number=4096):
+        self.bin_number = bin_number - bin_number % 2  # 合并相邻两组需要偶数个分组
+        self.counts = np.zeros(self.bin_number, dtype=np.int64)
+        self.origin = None
+        self.width = None
+        self.count = 0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return
+        low, high = np.min(values), np.max(values)
+        if self.origin is None:
+            # 第一块数据占用一半的分组，之后的数据在一定范围内不需要合并
+            self.origin = low
+            self.width = (high - low) * 2.0 / self.bin_number if high > low else max(abs(low), 1.0) * 1e-9
+        while low < self.origin or high >= self.origin + self.width * self.bin_number:
+            self._expand(low < self.origin)
+        index = np.minimum(((values - self.origin) / self.width).astype(np.int64), self.bin_number - 1)
+        self.counts += np.bincount(index, minlength=self.bin_number)
+        self.count += values.size
+        self.minimum = min(self.minimum, low)
+        self.maximum = max(self.maximum, high)
+
+    def _expand(self, downward):
+        # 宽度加倍，原来的范围成为新范围的上半部分（downward为True时）或下半部分
+        merged = self.counts.reshape(-1, 2).sum(axis=1)
+        self.counts = np.zeros_like(self.counts)
+        if downward:
+            self.counts[self.bin_number // 2:] = merged
+            self.origin -= self.width * self.bin_number
+        else:
+            self.counts[:self.bin_number // 2] = merged
+        self.width *= 2.0
+
+    def percentile(self, q):
+        # 与np.percentile的线性插值定义相同的秩，q可以为数值或列表
+        rank = np.asarray(q, dtype=float) / 100.0 * (self.count - 1)
+        cumulative = np.cumsum(self.counts)
+        index = np.minimum(np.searchsorted(cumulative, rank, side='right'), self.bin_number - 1)
+        before = cumulative[index] - self.counts[index]
+        value = self.origin + self.width * (index + (rank - before + 0.5) / np.maximum(self.counts[index], 1))
+        value = np.where(rank <= 0, self.minimum, np.where(rank >= self.count - 1, self.maximum, value))  # 最小值和最大值为精确值
+        return np.clip(value, self.minimum, self.maximum)
+
+    def histogram(self, bins):
+        # 合并为数据范围内bins个等宽分组，返回(各组个数, 分组边界)
+        edges = np.linspace(self.minimum, self.maximum, bins + 1)
+        centers = self.origin + self.width * (np.arange(self.bin_number) + 0.5)
+        count, _ = np.histogram(np.clip(centers, self.minimum, self.maximum), bins=edges, weights=self.counts)
+        return count.astype(np.int64), edges
+
+
+# 汇总图的画图函数
+def _render_fan_chart(title, x_labels, values, percentiles, sample_index, file_name):
+    # values为日期数×路径数，每个分位数画一条线，另外画出sample_index对应的路径
+    import pygal
+    line_chart = pygal.Line(show_dots=False)
+    line_chart.title = title
+    line_chart.x_labels = x_labels
+    for q, band in zip(percentiles, np.percentile(values, percentiles, axis=1)):
+        line_chart.add('%g%%' % q, band)
+    for index in sample_index:
+        line_chart.add(str(index+1), values[:, index], stroke_style={'width': 0.5})
+    line_chart.render_to_file(file_name)
+
+
+def _render_histogram(title, count, edges, file_name):
+    # 画分组统计后的直方图（np.histogram的结果），图的大小与数据个数无关
+    import pygal
+    histogram = pygal.Histogram(show_legend=False)
+    histogram.title = title
+    histogram.add('', list(zip(count.tolist(), edges[:-1].tolist(), edges[1:].tolist())))
+    histogram.render_to_file(file_name)
+
+
+class _CachedDerivative(object):
+    # 'cache'方式下代替衍生品模型，delta()从估值缓存中取得
+    def __init__(self, valuation_cache, Derivative, **coefsOfDerivative):
+        self.valuation_cache = valuation_cache
+        self.Derivative = Derivative
+        self.coefsOfDerivative = coefsOfDerivative
+
+    def delta(self):
+        return self.valuation_cache.delta(self.Derivative, **self.coefsOfDerivative)
+
+
+# 多进程计算中子进程执行的函数，需要定义在模块层面以便序列化
+def _get_hedging_profit_and_loss_of_shard(task):
+    # 返回(结果, 估值缓存的统计)，没有使用估值缓存时统计为None
+    backtest_class, state = task
+    backtest_model = backtest_class.__new__(backtest_class)
+    backtest_model.__dict__.update(state)
+    result = backtest_model.get_hedging_profit_and_loss()
+    valuation_cache = backtest_model.valuation_cache
+    return result, (None if valuation_cache is None else valuation_cache.statistics())
+
+
 # 此处开始写测试函数
 # 测试函数为各个回测类的使用模板
 # 实际应用中参考此处测试函数的写法
@@ -160,5 +536,86 @@ def 欧式回测测试1():
     backtest_model.summary()
 
 
+def 欧式回测分位数图测试1():
+    # 5000条路径只画分位数带、盈亏分布和随机抽取的10条路径
+    from 路径生成器 import BrownianMCReturnPathGeneratorByEverydayReturn
+    from 股票期权定价模型 import EuropeanOptionBSMAnalytic
+
+    asset = '000300.SH'
+    start_date = '2018-03-08'
+    end_date = '2018-06-08'
+    PathGenerator = BrownianMCReturnPathGeneratorByEverydayReturn
+    coefsOfPathGenerator = {'path_number': 5000, 'drift': 0.0, 'volatility': 0.3}
+    Derivative = EuropeanOptionBSMAnalytic
+    coefsOfDerivative = {'strikePrice': 1.0, 'optionType': ql.Option.Call, 'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.3}
+    backtest_model = SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption(asset, start_date, end_date, PathGenerator, coefsOfPathGenerator, Derivative, coefsOfDerivative)
+    backtest_model.summary(report_mode='fan', sample_number=10, seed=1234)
+
+
+def 欧式回测结果存储测试1():
+    # 流式计算时把路径、delta、盈亏和payoff写入内存映射文件，之后不需要重新仿真和定价即可读取
+    import tempfile
+    from 路径生成器 import BrownianMCReturnPathGeneratorByEverydayReturn
+    from 股票期权定价模型 import EuropeanOptionBSMAnalytic
+    from 回测结果存储 import BacktestResultStore
+
+    asset = '000300.SH'
+    start_date = '2018-03-08'
+    end_date = '2018-06-08'
+    PathGenerator = BrownianMCReturnPathGeneratorByEverydayReturn
+    coefsOfPathGenerator = {'path_number': 10000, 'drift': 0.0, 'volatility': 0.3}
+    Derivative = EuropeanOptionBSMAnalytic
+    coefsOfDerivative = {'strikePrice': 1.0, 'optionType': ql.Option.Call, 'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.3}
+    backtest_model = SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption(asset, start_date, end_date, PathGenerator, coefsOfPathGenerator, Derivative, coefsOfDerivative, block_size=1000)
+    result_directory = tempfile.mkdtemp()
+    statistics = backtest_model.get_hedging_statistics(result_directory)
+    store = BacktestResultStore.open(result_directory)
+    all_hedging_profit_and_loss = np.sum(store['hedging_profit_and_loss'], axis=0)
+    print('结果：', list(store.keys()), store['asset_delta'].shape)
+    print('读取的结果与计算时一致：', np.allclose(all_hedging_profit_and_loss, statistics.all_profit_and_loss))
+
+
+def 欧式回测并行测试1():
+    # 多进程计算与串行计算的结果对比
+    from 路径生成器 import BrownianMCReturnPathGeneratorByEverydayReturn
+    from 股票期权定价模型 import EuropeanOptionBSMAnalytic
+
+    asset = '000300.SH'
+    start_date = '2018-03-08'
+    end_date = '2018-06-08'
+    PathGenerator = BrownianMCReturnPathGeneratorByEverydayReturn
+    coefsOfPathGenerator = {'path_number': 500, 'drift': 0.0, 'volatility': 0.3}
+    Derivative = EuropeanOptionBSMAnalytic
+    coefsOfDerivative = {'strikePrice': 1.0, 'optionType': ql.Option.Call, 'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.3}
+    backtest_model = SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption(asset, start_date, end_date, PathGenerator, coefsOfPathGenerator, Derivative, coefsOfDerivative, delta_mode='object')
+    result_serial = backtest_model.get_hedging_profit_and_loss()
+    result_parallel = backtest_model.get_hedging_profit_and_loss_parallel(processes=4)
+    print('多进程与串行计算结果一致：', all(np.array_equal(a, b) for a, b in zip(result_serial, result_parallel)))
+
+
+def 欧式回测流式测试1():
+    # 每次生成1000条路径逐块计算，与一次生成全部路径的结果对比
+    from 路径生成器 import BrownianMCReturnPathGeneratorByEverydayReturn
+    from 股票期权定价模型 import EuropeanOptionBSMAnalytic
+
+    asset = '000300.SH'
+    start_date = '2018-03-08'
+    end_date = '2018-06-08'
+    PathGenerator = BrownianMCReturnPathGeneratorByEverydayReturn
+    coefsOfPathGenerator = {'path_number': 10000, 'drift': 0.0, 'volatility': 0.3}
+    Derivative = EuropeanOptionBSMAnalytic
+    coefsOfDerivative = {'strikePrice': 1.0, 'optionType': ql.Option.Call, 'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.3}
+    np.random.seed(0)
+    backtest_model = SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption(asset, start_date, end_date, PathGenerator, coefsOfPathGenerator, Derivative, coefsOfDerivative)
+    statistics_whole = backtest_model.get_hedging_statistics()
+    np.random.seed(0)
+    backtest_model = SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption(asset, start_date, end_date, PathGenerator, coefsOfPathGenerator, Derivative, coefsOfDerivative, block_size=1000)
+    statistics_block = backtest_model.get_hedging_statistics()
+    print('路径数：', statistics_whole.path_number, statistics_block.path_number)
+    print('一次生成：', statistics_whole.mean(), statistics_whole.percentile([10, 50, 90]))
+    print('逐块生成：', statistics_block.mean(), statistics_block.percentile([10, 50, 90]))
+    backtest_model.summary()
+
+
 if __name__ == '__main__':
     欧式回测测试1()
@@ -0,0 +1,159 @@
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import QuantLib as ql
+# 导入模型的设定
+import sys
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\衍生品回测\\日收盘衍生品回测')
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\衍生品定价模型')
+from 单资产衍生品对冲回测 import SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption
+from 回测结果存储 import METADATA_FILE, BacktestResultStore
+import 交易日历
+
+
+# 只影响交易成本的参数，其余参数均为衍生品的定价参数
+COST_PARAMETERS = ('slippage', 'commission')
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+# 参数扫描
+# 同一组仿真路径上对多组参数回测，路径只生成一次，保存为内存映射文件后由各个进程只读共享
+# 定价参数（如strikePrice、volatility）相同的参数组合只计算一次delta，只改变slippage、commission时只重新计算交易成本
+# 交易成本对slippage * commission是线性的，因此每组定价参数只需保存每条路径的对冲盈亏、成交金额和payoff
+class ParameterSweep(object):
+    def __init__(self, asset, start_date, end_date, PathGenerator, coefsOfPathGenerator, Derivative, coefsOfDerivative,
+                 Backtest=SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption, delta_mode='tensor', processes=1,
+                 path_directory=None, block_size=10000):
+        # coefsOfDerivative为定价参数的默认值，run中的参数网格覆盖其中的同名参数
+        # path_directory为保存仿真路径的目录，为None时使用临时目录
+        # 目录中已有完整的、相同设定（标的、日期、路径生成器及其参数）的路径时直接使用，生成中断的路径重新生成，设定不同时抛出异常
+        self.asset = asset
+        self.start_date = start_date
+        self.end_date = end_date
+        self.Derivative = Derivative
+        self.coefsOfDerivative = coefsOfDerivative
+        self.Backtest = Backtest
+        self.delta_mode = delta_mode
+        self.processes = processes
+        # 流式模式的回测对象，构造时不生成路径，用于生成路径和子进程中重建回测对象
+        self.backtest_model = Backtest(asset, start_date, end_date, PathGenerator, coefsOfPathGenerator, Derivative, coefsOfDerivative,
+                                       delta_mode=delta_mode, block_size=block_size)
+        self.path_directory = tempfile.mkdtemp() if path_directory is None else path_directory
+        self.path_settings = {'asset': asset, 'start_date': start_date, 'end_date': end_date, 'PathGenerator': PathGenerator.__name__,
+                              'coefsOfPathGenerator': json.loads(json.dumps(coefsOfPathGenerator, default=str))}
+        if not self._has_paths():
+            self._generate_paths(self.backtest_model.path_generator, block_size)
+        self.paths = BacktestResultStore.open(self.path_directory)
+        self.pricing_results = {}  # 定价参数 -> 每条路径的(不计成本的对冲盈亏, 成交金额, payoff)，多次run之间复用
+
+    def _has_paths(self):
+        # 目录中是否已有可以使用的路径
+        if not os.path.exists(os.path.join(self.path_directory, METADATA_FILE)):
+            return False
+        metadata = BacktestResultStore.open(self.path_directory).metadata
+        if not metadata.get('complete'):
+            return False  # 上次生成中断，重新生成
+        for name, value in self.path_settings.items():
+            if metadata.get(name) != value:
+                raise Exception('%s中的路径与现在的设定不同：%s为%r，现在为%r' % (self.path_directory, name, metadata.get(name), value))
+        return True
+
+    def _generate_paths(self, path_generator, block_size):
+        # 按块生成路径并写入内存映射文件，metadata中记录路径的设定
+        store = BacktestResultStore.create(self.path_directory, [交易日历.date2str(d) for d in path_generator.date_list],
+                                           path_generator.path_number, **self.path_settings)
+        path_start = 0
+        for sim_path, sim_path_for_hedging in path_generator.get_data_blocks(block_size):
+            store.write_block(path_start, sim_path=sim_path, sim_path_for_hedging=sim_path_for_hedging)
+            path_start += sim_path.shape[1]
+        store.close()
+
+    def run(self, grid):
+        # grid为{参数名: 取值列表}，对全部组合回测，返回每个组合一行的pd.DataFrame
+        # 各列为参数值、路径数、每条路径总盈亏的均值、标准差、分位数、payoff均值和交易成本均值
+        names = list(grid)
+        configurations = [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+        pricing_keys = []
+        tasks = {}
+        for configuration in configurations:
+            coefsOfDerivative = dict(self.coefsOfDerivative, **{name: value for name, value in configuration.items() if name not in COST_PARAMETERS})
+            key = _get_key(coefsOfDerivative)
+            pricing_keys.append(key)
+            if key not in self.pricing_results and key not in tasks:
+                tasks[key] = (self.Backtest, self._get_backtest_state(coefsOfDerivative), self.path_directory)
+        if tasks:
+            if self.processes > 1 and len(tasks) > 1:
+                with multiprocessing.Pool(min(self.processes, len(tasks))) as pool:
+                    results = pool.map(_get_pricing_result, list(tasks.values()))
+            else:
+                results = [_get_pricing_result(task) for task in tasks.values()]
+            self.pricing_results.update(zip(tasks, results))
+        rows = []
+        for configuration, key in zip(configurations, pricing_keys):
+            profit_and_loss_before_cost, trading_amount, payoff = self.pricing_results[key]
+            cost_rate = configuration.get('slippage', 0.0) * configuration.get('commission', 0.0)
+            trading_cost = trading_amount * cost_rate
+            all_hedging_profit_and_loss = profit_and_loss_before_cost - trading_cost - payoff
+            row = dict(configuration, path_number=len(payoff), mean=np.mean(all_hedging_profit_and_loss), std=np.std(all_hedging_profit_and_loss))
+            row.update(('p%i' % q, value) for q, value in zip(PERCENTILES, np.percentile(all_hedging_profit_and_loss, PERCENTILES)))
+            row.update(payoff_mean=np.mean(payoff), trading_cost_mean=np.mean(trading_cost))
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def _get_backtest_state(self, coefsOfDerivative):
+        # 子进程中重建回测对象用的属性，由回测对象的_get_block_state得到，路径在子进程中从内存映射文件读取
+        state = self.backtest_model._get_block_state(np.empty((0, 0)), np.empty((0, 0)))
+        state.update(coefsOfDerivative=coefsOfDerivative, date_list=self.paths.metadata['date_list'], slippage=0.0, commission=0.0)
+        return state
+
+
+# 辅助函数区
+def _get_key(coefsOfDerivative):
+    return tuple(sorted((name, repr(value)) for name, value in coefsOfDerivative.items()))
+
+
+def _get_pricing_result(task):
+    # 对一组定价参数计算delta，返回每条路径不计成本的对冲盈亏、成交金额和payoff
+    # 路径为只读内存映射，多个进程共享同一份数据
+    Backtest, state, path_directory = task
+    paths = BacktestResultStore.open(path_directory)
+    backtest_model = Backtest.__new__(Backtest)
+    backtest_model.__dict__.update(state)
+    backtest_model.simPaths = pd.DataFrame(paths['sim_path'], copy=False)
+    backtest_model.simPathsHedging = pd.DataFrame(paths['sim_path_for_hedging'], copy=False)
+    asset_delta = backtest_model.get_asset_delta()
+    profit_and_loss_before_cost = np.sum(backtest_model.get_hedging_profit_and_loss_before_cost(asset_delta), axis=0)
+    trading_amount = np.sum(backtest_model.get_trading_amount(asset_delta), axis=0)
+    return profit_and_loss_before_cost, trading_amount, np.asarray(backtest_model.get_payoff())
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 参数扫描测试1():
+    # 3个行权价×3个定价波动率×4组交易成本，只计算9次delta
+    import time
+    from 路径生成器 import BrownianMCReturnPathGeneratorByEverydayReturn
+    from 股票期权定价模型 import EuropeanOptionBSMAnalytic
+
+    asset = '000300.SH'
+    start_date = '2018-03-08'
+    end_date = '2018-06-08'
+    PathGenerator = BrownianMCReturnPathGeneratorByEverydayReturn
+    coefsOfPathGenerator = {'path_number': 5000, 'drift': 0.0, 'volatility': 0.3}
+    Derivative = EuropeanOptionBSMAnalytic
+    coefsOfDerivative = {'strikePrice': 1.0, 'optionType': ql.Option.Call, 'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.3}
+    time_start = time.time()
+    sweep = ParameterSweep(asset, start_date, end_date, PathGenerator, coefsOfPathGenerator, Derivative, coefsOfDerivative, processes=4)
+    grid = {'strikePrice': [0.95, 1.0, 1.05], 'volatility': [0.25, 0.3, 0.35], 'slippage': [0.0, 1.0], 'commission': [0.0, 0.001]}
+    results = sweep.run(grid)
+    print(results)
+    print('%i组参数，计算delta %i次，耗时%.4f秒' % (len(results), len(sweep.pricing_results), time.time() - time_start))
+
+
+if __name__ == '__main__':
+    参数扫描测试1()
@@ -0,0 +1,87 @@
+import json
+import os
+import numpy as np
+
+
+METADATA_FILE = 'metadata.json'
+
+
+# 回测结果存储
+# 每项结果（仿真价格路径、对冲价格路径、delta、每日盈亏、payoff等）保存为一个.npy文件，最后一维为路径
+# 写入时通过内存映射按路径块写入，结果可以超过内存大小；读取时以只读内存映射打开，不复制数据
+# 日期列表、数组的形状和回测参数保存在metadata.json中
+class BacktestResultStore(object):
+    def __init__(self, directory, metadata, arrays):
+        self.directory = directory
+        self.metadata = metadata
+        self.arrays = arrays  # 名称 -> np.memmap
+
+    @classmethod
+    def create(cls, directory, date_list, path_number, **metadata):
+        # 新建一个空的存储，数组在第一次写入时按结果的形状创建
+        os.makedirs(directory, exist_ok=True)
+        metadata = dict(metadata, date_list=list(date_list), path_number=int(path_number), written=0, arrays={}, complete=False)
+        store = cls(directory, metadata, {})
+        store._save_metadata()
+        return store
+
+    @classmethod
+    def open(cls, directory, mode='r'):
+        # mode为'r'时只读，'r+'时可以修改已有的数据
+        with open(os.path.join(directory, METADATA_FILE), encoding='utf-8') as file:
+            metadata = json.load(file)
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode) for name in metadata['arrays']}
+        return cls(directory, metadata, arrays)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def keys(self):
+        return self.arrays.keys()
+
+    def write_block(self, path_start, **blocks):
+        # 写入从第path_start条路径开始的一块结果，各项结果的最后一维为路径
+        for name, block in blocks.items():
+            block = np.asarray(block)
+            if name not in self.arrays:
+                shape = block.shape[:-1] + (self.metadata['path_number'],)
+                self.arrays[name] = np.lib.format.open_memmap(os.path.join(self.directory, name + '.npy'), mode='w+',
+                                                              dtype=block.dtype, shape=shape)
+                self.metadata['arrays'][name] = {'shape': list(shape), 'dtype': str(block.dtype)}
+            self.arrays[name][..., path_start:path_start + block.shape[-1]] = block
+        self.metadata['written'] = max(self.metadata['written'], path_start + max(np.shape(block)[-1] for block in blocks.values()))
+
+    def close(self):
+        # 写入磁盘并记录完成状态
+        for array in self.arrays.values():
+            if isinstance(array, np.memmap) and array.mode != 'r':
+                array.flush()
+        self.metadata['complete'] = self.metadata['written'] == self.metadata['path_number']
+        self._save_metadata()
+
+    def _save_metadata(self):
+        with open(os.path.join(self.directory, METADATA_FILE), 'w', encoding='utf-8') as file:
+            json.dump(self.metadata, file, ensure_ascii=False, indent=2, default=str)
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 回测结果存储测试1():
+    # 按块写入后重新打开，读取的数据为内存映射
+    import tempfile
+    directory = tempfile.mkdtemp()
+    date_list = ['2018-03-08', '2018-03-09', '2018-03-12']
+    store = BacktestResultStore.create(directory, date_list, 10, asset='000300.SH')
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(3, 10))
+    for path_start in range(0, 10, 4):
+        block = data[:, path_start:path_start + 4]
+        store.write_block(path_start, hedging_profit_and_loss=block, payoff=block[-1])
+    store.close()
+    store = BacktestResultStore.open(directory)
+    print(store.metadata['complete'], type(store['hedging_profit_and_loss']), np.array_equal(store['hedging_profit_and_loss'], data))
+
+
+if __name__ == '__main__':
+    回测结果存储测试1()
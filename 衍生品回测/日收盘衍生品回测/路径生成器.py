@@ -1,7 +1,13 @@
+import collections
+import warnings
 import numpy as np
 import pandas as pd
 import QuantLib as ql
-from WindPy import w
+import sys
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\衍生品定价模型')
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\行情数据')
+from 行情数据接口 import w
+import 交易日历
 
 
 class PathGenerator(object):
@@ -15,33 +21,17 @@ class PathGenerator(object):
     # 时间转换通用函数
     @staticmethod
     def _date_string_2_date_ql(date):
-        date = date.split('-')
-        date = ql.Date(int(date[2]), int(date[1]), int(date[0]))
-        return date
+        return 交易日历.str2date(date)
 
     @staticmethod
     def _date_ql_2_date_string(date):
-        date = date.to_date().strftime('%Y-%m-%d')
-        return date
+        return 交易日历.date2str(date)
 
     # 日期列表的生成函数
     @staticmethod
     def _generate_date_list(start_date, end_date, includeFirst=True, includeLast=True):
-        calendar = ql.China()
-        start_date = calendar.advance(start_date, 0, ql.Days)  # 休息日取为下一个交易日
-        end_date = calendar.advance(end_date, 0, ql.Days)
-        date_list = [start_date]
-        date_temp = start_date
-        while True:
-            date_temp = calendar.advance(date_temp, 1, ql.Days)
-            date_list.append(date_temp)
-            if date_temp == end_date:
-                break
-        if not includeFirst:
-            date_list = date_list[1:]
-        if not includeLast:
-            date_list = date_list[:-1]
-        return date_list
+        # 休息日取为下一个交易日
+        return 交易日历.CHINA.businessDates(start_date, end_date, includeFirst, includeLast)
 
 
 class SingleAssetPathGeneratorByErerydayReturn(PathGenerator):
@@ -57,17 +47,23 @@ class SingleAssetPathGeneratorByErerydayReturn(PathGenerator):
         return_everyday = np.zeros((len(self.date_list), self.path_number))  # 每日价格不变
         return return_everyday, return_everyday
 
+    def _get_return_everyday_block(self, path_index):
+        # 只生成path_index对应的路径，用于流式生成，结果与_get_return_everyday相同，列数为len(path_index)
+        return_everyday = np.zeros((len(self.date_list), len(path_index)))  # 每日价格不变
+        return return_everyday, return_everyday
+
+    @staticmethod
+    def _cumulate_return(return_everyday):
+        # 每日对数收益率累积为价格路径，初始价格为1.0
+        return np.exp(np.cumsum(return_everyday, axis=0))
+
     def _get_path_everyday(self):
         # 此函数为通过生成每日价格变动来生成路径的核心函数
         return_everyday, return_everyday_for_hedging = self._get_return_everyday()
         # 计算路径每日回报
-        return_everyday = np.cumsum(return_everyday, axis=0)
-        path_everyday = np.exp(return_everyday)
-        path_everyday = pd.DataFrame(path_everyday, index=self.date_list)
+        path_everyday = pd.DataFrame(self._cumulate_return(return_everyday), index=self.date_list)
         # 对冲路径每日回报
-        return_everyday_for_hedging = np.cumsum(return_everyday_for_hedging, axis=0)
-        path_everyday_for_hedging = np.exp(return_everyday_for_hedging)
-        path_everyday_for_hedging = pd.DataFrame(path_everyday_for_hedging, index=self.date_list)
+        path_everyday_for_hedging = pd.DataFrame(self._cumulate_return(return_everyday_for_hedging), index=self.date_list)
         return path_everyday, path_everyday_for_hedging
 
     def get_data(self):
@@ -76,27 +72,35 @@ class SingleAssetPathGeneratorByErerydayReturn(PathGenerator):
         path_everyday, path_everyday_for_hedging = self._get_path_everyday()
         return path_everyday, path_everyday_for_hedging
 
+    def get_data_blocks(self, block_size):
+        # 流式生成路径，每次返回不超过block_size条路径的(仿真价格路径, 对冲价格路径)
+        # 均为len(self.date_list)行的np.ndarray，内存占用只与block_size有关
+        for path_start in range(0, self.path_number, block_size):
+            path_index = np.arange(path_start, min(path_start + block_size, self.path_number))
+            return_everyday, return_everyday_for_hedging = self._get_return_everyday_block(path_index)
+            path_everyday = self._cumulate_return(return_everyday)
+            if return_everyday_for_hedging is return_everyday:
+                yield path_everyday, path_everyday
+            else:
+                yield path_everyday, self._cumulate_return(return_everyday_for_hedging)
+
 
 class HistoryReturnPathGeneratorByEverydayReturn(SingleAssetPathGeneratorByErerydayReturn):
     # 使用历史收益率数据构造仿真路径，初始价格为1.0
     def __init__(self, asset, start_date, end_date, path_number, history_end_date, history_frequrncy=0):
         self.history_end_date = history_end_date  # 历史路径的最后采样日
         self.history_frequency = history_frequrncy  # 历史路径的采样频率：0-收尾相接，1-年频率，2-月频率，3-季度频率，4-周频率
+        self._history_windows = None
         super().__init__(asset, start_date, end_date, path_number)
 
-    def _get_return_everyday_by_asset(self, asset):
-        return_data_list = []
+    def _get_history_end_dates(self):
+        # 每条历史路径的最后一个交易日，每条路径为截至该日的len(self.date_list)个交易日
+        end_dates = []
         calendar = ql.China()
-        # 初始化end_date和start_date
         end_date = self._date_string_2_date_ql(self.history_end_date)
-        start_date = calendar.advance(end_date, -len(self.date_list)+1, ql.Days)
+        start_date = 交易日历.CHINA.advanceDate(end_date, -len(self.date_list)+1)
         for pn in range(self.path_number):
-            w.start()
-            print('获取第'+str(pn+1)+'条历史路径，共计'+str(self.path_number)+'条，日期为从'+str(start_date)+'到'+str(end_date))
-            return_data = np.array(w.wsd(asset, "pct_chg", self._date_ql_2_date_string(start_date), self._date_ql_2_date_string(end_date), "ShowBlank=0").Data[0])
-            return_data = np.log((return_data / 100.0 + 1.0))[:, np.newaxis]
-            return_data[0, :] = 0.0  # 第一天收盘为初始交易时刻
-            return_data_list.append(return_data)
+            end_dates.append(end_date)
             if self.history_frequency == 1:  # 一年
                 end_date = calendar.advance(end_date, -1, ql.Years)
             elif self.history_frequency == 2:  # 一个月
@@ -107,13 +111,45 @@ class HistoryReturnPathGeneratorByEverydayReturn(SingleAssetPathGeneratorByErery
                 end_date = calendar.advance(end_date, -1, ql.Weeks)
             else:  # 0为默认模式，收尾相接模式
                 end_date = start_date
-            start_date = calendar.advance(end_date, -len(self.date_list) + 1, ql.Days)
-        return_everyday = np.concatenate(return_data_list, axis=1)  # 每日价格不变
-        return return_everyday
+            start_date = 交易日历.CHINA.advanceDate(end_date, -len(self.date_list) + 1)
+        return end_dates
+
+    def _get_history_assets(self):
+        # 需要历史数据的资产，第一个用于仿真价格路径，第二个（如有）用于对冲
+        return [self.asset]
+
+    def _get_history_windows(self):
+        # 一次获取全部路径覆盖的历史区间，每条路径为对数收益率序列上的一个窗口
+        # 返回(每个资产的全部窗口，每条路径的窗口位置)，窗口不复制数据，结果保存后供各个路径块使用
+        if self._history_windows is not None:
+            return self._history_windows
+        day_number = len(self.date_list)
+        end_dates = self._get_history_end_dates()
+        start_date = 交易日历.CHINA.advanceDate(min(end_dates), -day_number + 1)
+        end_date = max(end_dates)
+        print('获取%i条历史路径，日期为从%s到%s' % (self.path_number, start_date, end_date))
+        time_serials, return_data_list = _get_history_log_return(self._get_history_assets(), start_date, end_date)
+        # 每条路径最后一个交易日在历史数据中的位置，窗口的起始位置
+        window_starts = np.searchsorted(time_serials, [d.serialNumber() for d in end_dates], side='right') - day_number
+        if np.min(window_starts) < 0:
+            raise Exception('历史数据不足%i个交易日' % day_number)
+        windows_list = []
+        for return_data in return_data_list:
+            windows_list.append(np.lib.stride_tricks.sliding_window_view(return_data, day_number))  # 不复制数据的全部窗口
+        self._history_windows = (windows_list, window_starts)
+        return self._history_windows
+
+    def _get_return_everyday_block(self, path_index):
+        windows_list, window_starts = self._get_history_windows()
+        return_everyday_list = []
+        for windows in windows_list:
+            return_everyday = windows[window_starts[path_index]].T  # 只在选取路径时分配一次内存
+            return_everyday[0, :] = 0.0  # 第一天收盘为初始交易时刻
+            return_everyday_list.append(return_everyday)
+        return return_everyday_list[0], return_everyday_list[-1]
 
     def _get_return_everyday(self):
-        return_everyday = self._get_return_everyday_by_asset(self.asset)
-        return return_everyday, return_everyday
+        return self._get_return_everyday_block(np.arange(self.path_number))
 
 
 class HistoryReturnPathGeneratorByEverydayReturnDiffHedging(HistoryReturnPathGeneratorByEverydayReturn):
@@ -122,26 +158,206 @@ class HistoryReturnPathGeneratorByEverydayReturnDiffHedging(HistoryReturnPathGen
         self.asset_for_hedging = asset_for_hedging
         super().__init__(asset, start_date, end_date, path_number, history_end_date, history_frequrncy)
 
+    def _get_history_assets(self):
+        # 两个资产的历史数据一次获取
+        return [self.asset, self.asset_for_hedging]
+
+
+class BootstrapReturnPathGeneratorByEverydayReturn(SingleAssetPathGeneratorByErerydayReturn):
+    # 对一段历史收益率重抽样构造仿真路径，初始价格为1.0，路径数不受历史区间长度的限制
+    # 历史数据只获取一次，每条路径由若干段历史收益率首尾相接而成，保留收益率的短期相关性
+    # stationary为True时为平稳bootstrap：每日以1/block_length的概率开始新的一段，段长服从几何分布，历史序列首尾循环
+    # stationary为False时为移动块bootstrap：每段固定为block_length个交易日
+    def __init__(self, asset, start_date, end_date, path_number, history_start_date, history_end_date, block_length=10,
+                 stationary=True, seed=None, asset_for_hedging=None):
+        # asset_for_hedging不为None时同时重抽样对冲标的在相同日期的收益率，作为对冲路径
+        self.history_start_date = history_start_date
+        self.history_end_date = history_end_date
+        self.block_length = block_length
+        self.stationary = stationary
+        self.rng = np.random.default_rng(seed)
+        self.asset_for_hedging = asset_for_hedging
+        self._history_return = None
+        super().__init__(asset, start_date, end_date, path_number)
+
+    def _get_history_return(self):
+        # 资产数×历史交易日数的对数收益率，第一次使用时获取
+        if self._history_return is None:
+            assets = [self.asset] if self.asset_for_hedging is None else [self.asset, self.asset_for_hedging]
+            _, return_data_list = _get_history_log_return(assets, self._date_string_2_date_ql(self.history_start_date),
+                                                          self._date_string_2_date_ql(self.history_end_date))
+            self._history_return = np.array(return_data_list)
+            if self._history_return.shape[1] < self.block_length:
+                raise Exception('历史数据不足%i个交易日' % self.block_length)
+        return self._history_return
+
+    def _get_bootstrap_index(self, path_number, step_number, history_number):
+        # path_number×step_number的历史收益率位置
+        step = np.arange(step_number)
+        if self.stationary:
+            block_start = self.rng.random((path_number, step_number)) < 1.0 / self.block_length
+            block_start[:, 0] = True
+            # 每一日所在段的开始日
+            block_start_step = np.maximum.accumulate(np.where(block_start, step, 0), axis=1)
+            start_position = self.rng.integers(0, history_number, (path_number, step_number))
+            start_position = np.take_along_axis(start_position, block_start_step, axis=1)
+            return (start_position + step - block_start_step) % history_number
+        block_number = -(-step_number // self.block_length)
+        start_position = self.rng.integers(0, history_number - self.block_length + 1, (path_number, block_number))
+        index = start_position[:, :, np.newaxis] + np.arange(self.block_length)
+        return index.reshape(path_number, -1)[:, :step_number]
+
     def _get_return_everyday(self):
-        return_everyday = self._get_return_everyday_by_asset(self.asset)
-        return_everyday_for_hedging = self._get_return_everyday_by_asset(self.asset_for_hedging)
-        return return_everyday, return_everyday_for_hedging
+        return self._get_return_everyday_block(np.arange(self.path_number))
+
+    def _get_return_everyday_block(self, path_index):
+        history_return = self._get_history_return()
+        index = self._get_bootstrap_index(len(path_index), len(self.date_list) - 1, history_return.shape[1])
+        return_everyday_list = []
+        for return_data in history_return:
+            return_everyday = np.zeros((len(self.date_list), len(path_index)))  # 第一天收盘为初始交易时刻
+            return_everyday[1:] = return_data[index.T]
+            return_everyday_list.append(return_everyday)
+        return return_everyday_list[0], return_everyday_list[-1]
 
 
 class BrownianMCReturnPathGeneratorByEverydayReturn(SingleAssetPathGeneratorByErerydayReturn):
-    def __init__(self, asset, start_date, end_date, path_number, drift, volatility):
+    def __init__(self, asset, start_date, end_date, path_number, drift, volatility, annualization=240):
         # 使用正态分布生成收益率数据，，初始价格为1.0
-        # Brownian运动的参数，240天的年化
-        self.volatility = volatility / np.sqrt(240)
-        self.drift = drift / 240
+        # Brownian运动的参数，annualization为一年的交易日数，默认240天的年化
+        self.volatility = volatility / np.sqrt(annualization)
+        self.drift = drift / annualization
         super().__init__(asset, start_date, end_date, path_number)
 
     def _get_return_everyday(self):
-        return_everyday = np.random.normal(self.drift, self.volatility, size=(len(self.date_list), self.path_number))
+        return self._get_return_everyday_block(np.arange(self.path_number))
+
+    def _get_return_everyday_block(self, path_index):
+        return_everyday = np.random.normal(self.drift, self.volatility, size=(len(self.date_list), len(path_index)))
         return_everyday[0, :] = 0.0
         return return_everyday, return_everyday
 
 
+class CorrelatedGBMReturnPathGeneratorByEverydayReturn(SingleAssetPathGeneratorByErerydayReturn):
+    # 多资产相关的几何布朗运动，初始价格均为1.0
+    # 第一个资产为仿真价格路径，hedging_index对应的资产为对冲价格路径，因此计算标的与对冲标的可以不同
+    # 路径按shard_size条分片，每个分片使用由seed派生的独立随机数流，结果与分片的计算顺序和进程数无关
+    # sobol为True时使用Sobol序列（scipy）加Brownian桥生成正态增量，每个分片为一组独立加扰的Sobol点
+    # Sobol点的均匀性要求点数为2的幂，shard_size向上取为2的幂；路径数不是2的幂时最后一个分片点数不足，不提示scipy的警告
+    def __init__(self, asset, start_date, end_date, path_number, drift, volatility, correlation=None, hedging_index=None,
+                 seed=None, shard_size=None, sobol=False, annualization=240):
+        # drift、volatility为各资产的年化漂移率和波动率（标量时为单资产），correlation为资产间的相关系数矩阵
+        # hedging_index默认为第二个资产，只有一个资产时为第一个资产
+        # annualization为一年的交易日数，对数收益率的每日均值为(drift-volatility**2/2)/annualization
+        super().__init__(asset, start_date, end_date, path_number)
+        self.drift = np.atleast_1d(np.asarray(drift, dtype=float))
+        self.volatility = np.atleast_1d(np.asarray(volatility, dtype=float))
+        asset_number = len(self.volatility)
+        correlation = np.eye(asset_number) if correlation is None else np.asarray(correlation, dtype=float)
+        if correlation.shape != (asset_number, asset_number) or len(self.drift) != asset_number:
+            raise Exception('drift、volatility与correlation的资产个数不一致')
+        self.cholesky = np.linalg.cholesky(correlation)  # 相关系数矩阵不正定时抛出异常
+        self.hedging_index = min(1, asset_number - 1) if hedging_index is None else hedging_index
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.shard_size = path_number if shard_size is None else shard_size
+        if sobol:
+            self.shard_size = 1 << int(self.shard_size - 1).bit_length()
+        self.sobol = sobol
+        self.annualization = annualization
+        self._shard = (None, None)  # 最近生成的分片，流式生成时相邻的路径块可以复用
+
+    def _get_standard_normal(self, rng, shard_path_number, out):
+        # 在out（资产数×日期数×路径数）中写入独立的标准正态增量，第一日不使用
+        if not self.sobol:
+            rng.standard_normal(out=out)
+            return
+        from scipy.stats import qmc
+        from scipy.special import ndtri
+        asset_number, date_number = out.shape[0], out.shape[1]
+        step_number = date_number - 1
+        # Sobol点的前几维用于Brownian桥的终点和较粗的中点，维度排列为(桥的次序, 资产)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='The balance properties of Sobol', category=UserWarning)
+            uniform = qmc.Sobol(step_number * asset_number, scramble=True, seed=rng).random(shard_path_number)
+        normal = ndtri(uniform).T.reshape(step_number, asset_number, shard_path_number)
+        brownian = np.zeros((date_number, asset_number, shard_path_number))
+        brownian[step_number] = np.sqrt(step_number) * normal[0]
+        for order, (index, left, right, left_weight, right_weight, std) in enumerate(_brownian_bridge(step_number), 1):
+            brownian[index] = left_weight * brownian[left] + right_weight * brownian[right] + std * normal[order]
+        out[:, 1:, :] = np.diff(brownian, axis=0).transpose(1, 0, 2)
+
+    def _get_shard_return(self, shard_index):
+        # 第shard_index个分片的对数收益率，资产数×日期数×路径数，在一个预先分配的数组中原地计算
+        if self._shard[0] == shard_index:
+            return self._shard[1]
+        # 与self.seed_sequence.spawn(分片数)[shard_index]相同，不需要先生成全部分片的随机数流
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=(int(shard_index),)))
+        shard_path_number = min(self.shard_size, self.path_number - shard_index * self.shard_size)
+        return_everyday = np.empty((len(self.volatility), len(self.date_list), shard_path_number))
+        self._get_standard_normal(rng, shard_path_number, return_everyday)
+        # 按Cholesky分解的下三角矩阵原地相关化，从最后一个资产开始，只用到尚未改写的前几个资产
+        buffer = np.empty(return_everyday.shape[1:])
+        for i in reversed(range(len(self.volatility))):
+            return_everyday[i] *= self.cholesky[i, i]
+            for j in range(i):
+                return_everyday[i] += np.multiply(return_everyday[j], self.cholesky[i, j], out=buffer)
+        dt = 1.0 / self.annualization
+        return_everyday *= (self.volatility * np.sqrt(dt))[:, np.newaxis, np.newaxis]
+        return_everyday += ((self.drift - 0.5 * self.volatility ** 2) * dt)[:, np.newaxis, np.newaxis]
+        return_everyday[:, 0, :] = 0.0  # 第一天收盘为初始交易时刻
+        self._shard = (shard_index, return_everyday)
+        return return_everyday
+
+    def get_return_everyday_of_all_assets(self, path_index=None):
+        # 全部资产的对数收益率，资产数×日期数×len(path_index)
+        path_index = np.arange(self.path_number) if path_index is None else np.asarray(path_index)
+        shard_index = path_index // self.shard_size
+        if shard_index[0] == shard_index[-1] and len(path_index) == min(self.shard_size, self.path_number - shard_index[0] * self.shard_size) \
+                and np.all(np.diff(path_index) == 1):
+            # 恰好为一个分片时不复制，返回只读的视图，调用者修改结果不影响缓存的分片
+            return_everyday = self._get_shard_return(shard_index[0]).view()
+            return_everyday.flags.writeable = False
+            return return_everyday
+        return_everyday = np.empty((len(self.volatility), len(self.date_list), len(path_index)))
+        for index in np.unique(shard_index):
+            columns = shard_index == index
+            return_everyday[:, :, columns] = self._get_shard_return(index)[:, :, path_index[columns] - index * self.shard_size]
+        return return_everyday
+
+    def _get_return_everyday(self):
+        return self._get_return_everyday_block(np.arange(self.path_number))
+
+    def _get_return_everyday_block(self, path_index):
+        return_everyday = self.get_return_everyday_of_all_assets(path_index)
+        return return_everyday[0], return_everyday[self.hedging_index]
+
+
+def _get_history_log_return(assets, start_date, end_date):
+    # 一次获取多个资产在[start_date, end_date]的每日对数收益率
+    # 返回(交易日的serialNumber数组, 与assets对应的对数收益率数组的列表)
+    w.start()
+    data = w.wsd(','.join(assets), "pct_chg", 交易日历.date2str(start_date), 交易日历.date2str(end_date), "ShowBlank=0")
+    time_serials = np.array([交易日历.str2date(t.strftime('%Y-%m-%d')).serialNumber() for t in data.Times])
+    return time_serials, [np.log(np.array(return_data, dtype=float) / 100.0 + 1.0) for return_data in data.Data]
+
+
+def _brownian_bridge(step_number):
+    # 步长为1的Brownian桥的构造顺序，终点之后依次二分区间
+    # 返回[(中点, 左端点, 右端点, 左端点权重, 右端点权重, 条件标准差), ...]，共step_number-1项
+    bridge = []
+    intervals = collections.deque([(0, step_number)])
+    while intervals:
+        left, right = intervals.popleft()
+        if right - left < 2:
+            continue
+        index = (left + right) // 2
+        bridge.append((index, left, right, (right - index) / (right - left), (index - left) / (right - left),
+                       np.sqrt((index - left) * (right - index) / (right - left))))
+        intervals.append((left, index))
+        intervals.append((index, right))
+    return bridge
+
+
 def 每日历史回报路径测试1():
     asset = '000300.SH'
     start_date = '2018-09-14'
@@ -168,5 +384,45 @@ def 每日历史回报路径测试2():
     print(sim_path_for_hedging)
 
 
+def 历史收益率重抽样路径测试1():
+    # 用2010年以来的历史收益率生成10000条路径，对冲路径使用同一日期的另一个资产
+    asset = '000300.SH'
+    asset_for_hedging = '000016.SH'
+    start_date = '2018-09-14'
+    end_date = '2018-12-14'
+    generator = BootstrapReturnPathGeneratorByEverydayReturn(asset, start_date, end_date, 10000, '2010-01-04', '2018-09-13',
+                                                             block_length=10, seed=1234, asset_for_hedging=asset_for_hedging)
+    sim_path, sim_path_for_hedging = generator.get_data()
+    history_return = generator._get_history_return()
+    print('历史日波动率：', np.std(history_return, axis=1))
+    print('路径日波动率：', np.std(np.diff(np.log(sim_path.values), axis=0)), np.std(np.diff(np.log(sim_path_for_hedging.values), axis=0)))
+    print(sim_path.iloc[:, :5])
+
+
+def 相关几何布朗运动路径测试1():
+    # 两个相关资产，检查相关系数与波动率、分片的可重复性和生成速度
+    import time
+    asset = '000300.SH'
+    start_date = '2018-01-02'
+    end_date = '2018-12-28'
+    correlation = [[1.0, 0.9], [0.9, 1.0]]
+    time_start = time.time()
+    generator = CorrelatedGBMReturnPathGeneratorByEverydayReturn(asset, start_date, end_date, 20000, [0.05, 0.05], [0.3, 0.25], correlation,
+                                                                 seed=1234, shard_size=5000)
+    return_everyday = generator.get_return_everyday_of_all_assets()
+    time_used = time.time() - time_start
+    print('每秒生成%.0f万个路径日' % (return_everyday[0].size / time_used / 10000))
+    print('相关系数：', np.corrcoef(return_everyday[0, 1:].ravel(), return_everyday[1, 1:].ravel())[0, 1])
+    print('年化波动率：', np.std(return_everyday[:, 1:], axis=(1, 2)) * np.sqrt(240))
+    # 分片的随机数流只与seed和分片序号有关，逐块生成的结果相同
+    blocks = [block for block, _ in generator.get_data_blocks(3000)]
+    print('逐块生成结果一致：', np.allclose(np.hstack(blocks), generator.get_data()[0].values))
+    # Sobol序列加Brownian桥
+    generator = CorrelatedGBMReturnPathGeneratorByEverydayReturn(asset, start_date, end_date, 4096, [0.05, 0.05], [0.3, 0.25], correlation,
+                                                                 seed=1234, sobol=True)
+    sim_path, sim_path_for_hedging = generator.get_data()
+    print('Sobol终值均值：', sim_path.values[-1].mean(), sim_path_for_hedging.values[-1].mean())
+
+
 if __name__ == '__main__':
     每日历史回报路径测试2()
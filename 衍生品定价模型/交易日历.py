@@ -0,0 +1,145 @@
+import functools
+import numpy as np
+import QuantLib as ql
+
+
+# 默认覆盖的日期范围，查询超出范围的日期时自动扩展
+DEFAULT_START_DATE = ql.Date(1, 1, 2000)
+DEFAULT_END_DATE = ql.Date(31, 12, 2035)
+
+
+# 预先计算的交易日索引
+# 交易日按时间顺序编号（序号），日期与序号的转换为数组查找，交易日的加减为序号的加减
+# 日期参数可以为ql.Date、ql.Date的serialNumber或serialNumber的np.ndarray，结果与calendar.advance、calendar.businessDaysBetween一致
+class BusinessDayIndex(object):
+    def __init__(self, calendar, startDate=DEFAULT_START_DATE, endDate=DEFAULT_END_DATE):
+        self.calendar = calendar
+        self.startSerial = None
+        self.endSerial = None
+        self.businessSerials = None  # 序号 -> 交易日的serialNumber
+        self.countBefore = None  # serialNumber - self.startSerial -> 该日之前（不含）的交易日个数
+        self.isBusinessDay = None
+        self._startDate = startDate
+        self._endDate = endDate
+
+    def _build(self, startSerial, endSerial):
+        # 第一次查询时构造，之后只在查询超出范围时扩展
+        serials = np.arange(startSerial, endSerial + 1)
+        isBusinessDay = np.array([self.calendar.isBusinessDay(ql.Date(int(n))) for n in serials])
+        self.startSerial = startSerial
+        self.endSerial = endSerial
+        self.businessSerials = serials[isBusinessDay]
+        self.countBefore = np.cumsum(isBusinessDay) - isBusinessDay
+        self.isBusinessDay = isBusinessDay
+
+    def _get_position(self, date):
+        # 返回serialNumber在索引数组中的位置，范围不足时扩展索引（前后各留一年余量）
+        serial = np.asarray(date.serialNumber() if isinstance(date, ql.Date) else date, dtype=np.int64)
+        if self.startSerial is None:
+            self._build(self._startDate.serialNumber(), self._endDate.serialNumber())
+        if serial.size > 0 and (serial.min() - 366 < self.startSerial or serial.max() + 366 > self.endSerial):
+            self._build(max(min(self.startSerial, int(serial.min()) - 366), ql.Date.minDate().serialNumber()),
+                        min(max(self.endSerial, int(serial.max()) + 366), ql.Date.maxDate().serialNumber()))
+        return serial - self.startSerial
+
+    def ordinal(self, date):
+        # 交易日的序号，非交易日取下一个交易日的序号
+        position = self._get_position(date)
+        return self.countBefore[position]
+
+    def serial(self, ordinal):
+        # 序号对应交易日的serialNumber，序号应由已构造的索引得到
+        return self.businessSerials[ordinal]
+
+    def date(self, ordinal):
+        return ql.Date(int(self.serial(ordinal)))
+
+    def advance(self, date, days):
+        # 与calendar.advance(date, days, ql.Days)一致，date与days可以为可相互广播的数组，返回serialNumber
+        # days为0时取date或其下一个交易日，days大于0时为date之后的第days个交易日，小于0时为之前的第-days个交易日
+        position = self._get_position(date)
+        days = np.asarray(days)
+        countBefore = self.countBefore[position]
+        countThrough = countBefore + self.isBusinessDay[position]
+        ordinal = np.where(days > 0, countThrough + days - 1, countBefore + days)
+        return self.businessSerials[ordinal]
+
+    def advanceDate(self, date, days):
+        # 标量形式的advance，返回ql.Date
+        return ql.Date(int(self.advance(date, days)))
+
+    def businessDaysBetween(self, startDate, endDate):
+        # 与calendar.businessDaysBetween(startDate, endDate)一致：startDate不晚于endDate时包括startDate，不包括endDate，
+        # startDate晚于endDate时为(endDate, startDate]中交易日个数的相反数，日期参数可以为数组
+        startPosition = self._get_position(startDate)
+        endPosition = self._get_position(endDate)
+        forward = self.countBefore[endPosition] - self.countBefore[startPosition]
+        backward = self.countBefore[endPosition + 1] - self.countBefore[startPosition + 1]
+        return np.where(startPosition <= endPosition, forward, backward)[()]
+
+    def businessDates(self, startDate, endDate, includeFirst=True, includeLast=True):
+        # startDate与endDate之间（均先调整为当日或下一个交易日）的全部交易日，返回ql.Date的列表
+        first = self.ordinal(startDate) + (0 if includeFirst else 1)
+        last = self.ordinal(endDate) + (1 if includeLast else 0)
+        return [ql.Date(int(n)) for n in self.businessSerials[first:last]]
+
+
+CHINA = BusinessDayIndex(ql.China())
+
+
+@functools.lru_cache(maxsize=None)
+def _str2serial(string):
+    string = [int(s) for s in string.split('-')]
+    return ql.Date(string[2], string[1], string[0]).serialNumber()
+
+
+@functools.lru_cache(maxsize=None)
+def _serial2str(serial):
+    return ql.Date(serial).ISO()
+
+
+def str2date(string):
+    # 2010-01-01格式的日期转化为ql.Date对象，字符串的解析结果被缓存，每次返回新的ql.Date对象
+    return ql.Date(_str2serial(string))
+
+
+def date2str(date):
+    # ql.Date对象转化为2010-01-01格式的日期
+    return _serial2str(date.serialNumber())
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 交易日历测试1():
+    # 与ql.China()逐日计算的结果对比，以及计算速度的对比
+    import time
+    calendar = ql.China()
+    rng = np.random.RandomState(0)
+    serials = rng.randint(ql.Date(1, 1, 2010).serialNumber(), ql.Date(31, 12, 2019).serialNumber(), 10000)
+    days = rng.randint(-30, 31, 10000)
+    time_start = time.time()
+    result_calendar = [calendar.advance(ql.Date(int(n)), int(d), ql.Days).serialNumber() for n, d in zip(serials, days)]
+    time_calendar = time.time() - time_start
+    CHINA.ordinal(serials)  # 构造索引
+    time_start = time.time()
+    result_index = CHINA.advance(serials, days)
+    time_index = time.time() - time_start
+    print('结果一致：', np.array_equal(result_calendar, result_index))
+    print('ql.China()耗时%.4f秒，交易日索引耗时%.4f秒' % (time_calendar, time_index))
+
+
+def 交易日历测试2():
+    # businessDaysBetween与ql.China()对比，包括startDate晚于endDate和日期相同的情况
+    calendar = ql.China()
+    rng = np.random.RandomState(0)
+    startSerials = rng.randint(ql.Date(1, 1, 2010).serialNumber(), ql.Date(31, 12, 2019).serialNumber(), 2000)
+    endSerials = startSerials + rng.randint(-40, 41, 2000)
+    result_calendar = [calendar.businessDaysBetween(ql.Date(int(m)), ql.Date(int(n))) for m, n in zip(startSerials, endSerials)]
+    result_index = CHINA.businessDaysBetween(startSerials, endSerials)
+    print('结果一致：', np.array_equal(result_calendar, result_index))
+    print(CHINA.businessDaysBetween(ql.Date(4, 4, 2018), ql.Date(7, 3, 2018)), calendar.businessDaysBetween(ql.Date(4, 4, 2018), ql.Date(7, 3, 2018)))
+
+
+if __name__ == '__main__':
+    交易日历测试1()
@@ -0,0 +1,140 @@
+import multiprocessing
+import threading
+import QuantLib as ql
+from 期权定价池 import OptionPricerPool
+import 交易日历
+
+
+# QuantLib的估值日为进程内的全局变量，同一进程内的定价会话依次持有此锁
+_SESSION_LOCK = threading.RLock()
+
+
+# 定价会话
+# 会话期间全局估值日固定为evaluationDate，每次定价前检查模型的估值日，退出时恢复原来的全局估值日
+# 多个线程使用定价会话时按会话串行执行，不会互相改写估值日
+class PricingSession(object):
+    def __init__(self, evaluationDate, pool=None):
+        # evaluationDate格式'YYYY-MM-DD'
+        # pool为会话中复用模型的定价池，默认新建一个
+        self.evaluationDate = evaluationDate
+        self.pool = OptionPricerPool() if pool is None else pool
+        self.switches = 0  # 会话中修改全局估值日的次数
+        self._evaluationDateBefore = None
+
+    def __enter__(self):
+        _SESSION_LOCK.acquire()
+        self._evaluationDateBefore = ql.Settings.instance().evaluationDate
+        self._pin()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        ql.Settings.instance().evaluationDate = self._evaluationDateBefore
+        _SESSION_LOCK.release()
+        return False
+
+    def price(self, Derivative, method='value', **coefsOfDerivative):
+        # 在会话的估值日上对一个合约定价，method为模型的方法名，如'value'、'delta'、'greeks'
+        # 其余参数与Derivative的构造参数相同（不含evaluationDate）
+        model = self.pool.get(Derivative, self.evaluationDate, **coefsOfDerivative)
+        self._pin()  # 定价池构造或更新模型时可能修改了全局估值日
+        return getattr(model, method)()
+
+    def _pin(self):
+        evaluationDate = 交易日历.str2date(self.evaluationDate)
+        if ql.Settings.instance().evaluationDate != evaluationDate:
+            ql.Settings.instance().evaluationDate = evaluationDate
+            self.switches += 1
+
+
+def group_by_date(tasks):
+    # tasks为(Derivative, evaluationDate, coefsOfDerivative)的列表
+    # 返回按估值日排序的[(evaluationDate, [(任务序号, Derivative, coefsOfDerivative), ...]), ...]
+    groups = {}
+    for i, (Derivative, evaluationDate, coefsOfDerivative) in enumerate(tasks):
+        groups.setdefault(evaluationDate, []).append((i, Derivative, coefsOfDerivative))
+    return sorted(groups.items())
+
+
+def price_by_date(tasks, method='value'):
+    # 按估值日分组依次定价，每个估值日只切换一次全局估值日，结果按tasks的顺序返回
+    return _price_date_groups((group_by_date(tasks), method, len(tasks)))[0]
+
+
+def _price_date_groups(task):
+    # 在一个进程内依次对若干估值日分组定价，返回(按任务序号排列的结果, 全局估值日的切换次数)
+    groups, method, number = task
+    results = [None] * number
+    switches = 0
+    pool = OptionPricerPool()
+    for evaluationDate, items in groups:
+        with PricingSession(evaluationDate, pool) as session:
+            for i, Derivative, coefsOfDerivative in items:
+                results[i] = session.price(Derivative, method, **coefsOfDerivative)
+            switches += session.switches
+    return results, switches
+
+
+# 定价调度器
+# 把混合了多个估值日和多种合约的一批任务按估值日分组，分组分配到多个进程中定价，每个进程内按日期顺序执行
+class PricingScheduler(object):
+    def __init__(self, processes=1):
+        self.processes = processes
+        self.switches = 0  # 上一次run中各进程修改全局估值日的次数之和
+
+    def run(self, tasks, method='value'):
+        # tasks为(Derivative, evaluationDate, coefsOfDerivative)的列表，coefsOfDerivative不含evaluationDate
+        # 结果按tasks的顺序返回，与串行的price_by_date一致
+        groups = group_by_date(tasks)
+        if self.processes <= 1 or len(groups) <= 1:
+            results, self.switches = _price_date_groups((groups, method, len(tasks)))
+            return results
+        # 按任务数把估值日分组分配给当前负担最小的进程
+        shards = [[] for _ in range(min(self.processes, len(groups)))]
+        loads = [0] * len(shards)
+        for group in sorted(groups, key=lambda g: -len(g[1])):
+            shard_index = loads.index(min(loads))
+            shards[shard_index].append(group)
+            loads[shard_index] += len(group[1])
+        shard_tasks = [(sorted(shard), method, len(tasks)) for shard in shards]
+        with multiprocessing.Pool(len(shards)) as pool:
+            shard_results = pool.map(_price_date_groups, shard_tasks)
+        results = [None] * len(tasks)
+        for (shard_result, _), shard in zip(shard_results, shards):
+            for _, items in shard:
+                for i, _, _ in items:
+                    results[i] = shard_result[i]
+        self.switches = sum(switches for _, switches in shard_results)
+        return results
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 定价会话测试1():
+    # 多个估值日、多种合约混合的一批任务，按日期分组后在多个进程中定价，与逐个构造模型的结果对比
+    import time
+    from 股票期权定价模型 import EuropeanOptionBSMAnalytic, AmericanOptionBSMBinomial
+
+    evaluationDates = ['2014-03-%02d' % d for d in (7, 10, 11, 12, 13, 14, 17, 18)]
+    tasks = []
+    for stockPrice in [95.0 + i for i in range(20)]:
+        for evaluationDate in evaluationDates:
+            tasks.append((EuropeanOptionBSMAnalytic, evaluationDate,
+                          {'stockPrice': stockPrice, 'strikePrice': 100.0, 'exerciseDate': '2014-06-09', 'optionType': ql.Option.Call,
+                           'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.2}))
+            tasks.append((AmericanOptionBSMBinomial, evaluationDate,
+                          {'stockPrice': stockPrice, 'strikePrice': 100.0, 'maturityDate': '2014-06-09', 'optionType': ql.Option.Put,
+                           'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.2}))
+    time_start = time.time()
+    results_object = [Derivative(evaluationDate=evaluationDate, **coefsOfDerivative).value() for Derivative, evaluationDate, coefsOfDerivative in tasks]
+    time_object = time.time() - time_start
+    scheduler = PricingScheduler(processes=4)
+    time_start = time.time()
+    results_scheduler = scheduler.run(tasks)
+    time_scheduler = time.time() - time_start
+    print('结果一致：', results_object == results_scheduler, '全局估值日切换次数：', scheduler.switches)
+    print('逐个构造模型耗时%.4f秒，调度器耗时%.4f秒' % (time_object, time_scheduler))
+
+
+if __name__ == '__main__':
+    定价会话测试1()
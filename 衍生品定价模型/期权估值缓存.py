@@ -0,0 +1,102 @@
+import collections
+import QuantLib as ql
+from 期权定价池 import MARKET_PARAMETERS, OptionPricerPool
+
+
+# 期权估值缓存
+# 按(方法, 模型类, 合约条款, 估值日, 量化后的行情)缓存value()、delta()、greeks()的结果，超过maxsize时淘汰最久未使用的结果
+# 未命中时在量化后的行情上通过定价池定价，因此同一个键的结果与调用顺序无关
+# MC定价模型需要在合约条款中指定seed，结果才可重复
+class OptionValuationCache(object):
+    def __init__(self, maxsize=100000, quantization=None, pool=None):
+        # quantization为{行情参数名: 量化步长}，如{'stockPrice': 0.0001, 'volatility': 0.0005}，未列出的行情参数不量化
+        # pool为未命中时使用的定价池，默认新建一个
+        self.maxsize = maxsize
+        self.quantization = {} if quantization is None else dict(quantization)
+        self.pool = OptionPricerPool() if pool is None else pool
+        self.results = collections.OrderedDict()
+        self.hits = 0  # 命中缓存的次数
+        self.misses = 0  # 未命中缓存、重新定价的次数
+        self.evictions = 0  # 因超过maxsize被淘汰的结果数
+
+    def get(self, method, Derivative, evaluationDate, **coefsOfDerivative):
+        # method为模型的方法名，如'value'、'delta'、'greeks'，其余参数与Derivative的构造参数相同
+        market = {}
+        marketKey = []
+        for name in MARKET_PARAMETERS:
+            if name in coefsOfDerivative:
+                market[name], index = self._quantize(name, coefsOfDerivative.pop(name))
+                marketKey.append((name, index))
+        key = (method, evaluationDate, tuple(marketKey), OptionPricerPool._get_key(Derivative, coefsOfDerivative))
+        result = self.results.get(key)
+        if result is not None:
+            self.hits += 1
+            self.results.move_to_end(key)
+        else:
+            self.misses += 1
+            result = getattr(self.pool.get(Derivative, evaluationDate, **market, **coefsOfDerivative), method)()
+            self.results[key] = result
+            if len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+                self.evictions += 1
+        if isinstance(result, dict):
+            return dict(result)  # 调用者修改返回的字典不影响缓存
+        return result
+
+    def value(self, Derivative, evaluationDate, **coefsOfDerivative):
+        return self.get('value', Derivative, evaluationDate, **coefsOfDerivative)
+
+    def delta(self, Derivative, evaluationDate, **coefsOfDerivative):
+        return self.get('delta', Derivative, evaluationDate, **coefsOfDerivative)
+
+    def greeks(self, Derivative, evaluationDate, **coefsOfDerivative):
+        return self.get('greeks', Derivative, evaluationDate, **coefsOfDerivative)
+
+    def statistics(self):
+        return {'size': len(self.results), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+    def merge_statistics(self, statistics):
+        # 计入其它进程中同样设定的缓存的命中统计（statistics()的返回值），缓存的结果不合并
+        self.hits += statistics['hits']
+        self.misses += statistics['misses']
+        self.evictions += statistics['evictions']
+
+    def clear(self):
+        self.results = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _quantize(self, name, value):
+        # 返回定价使用的量化后的数值和作为键的整数格点
+        step = self.quantization.get(name)
+        if step is None:
+            return value, value
+        index = int(round(value / step))
+        return index * step, index
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 估值缓存测试1():
+    # 标的价格按0.01量化后，多条路径在相近价格上重复计算delta
+    import time
+    import numpy as np
+    from 股票期权定价模型 import AmericanOptionBSMBinomial
+
+    cache = OptionValuationCache(maxsize=1000, quantization={'stockPrice': 0.01})
+    coefsOfDerivative = {'strikePrice': 100.0, 'maturityDate': '2014-06-09', 'optionType': ql.Option.Put,
+                         'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.2}
+    evaluationDates = ['2014-03-07', '2014-03-10', '2014-03-11', '2014-03-12']
+    stockPrices = 100.0 + np.random.RandomState(0).normal(0.0, 0.5, 500)
+    time_start = time.time()
+    for evaluationDate in evaluationDates:
+        for stockPrice in stockPrices:
+            cache.delta(AmericanOptionBSMBinomial, stockPrice=stockPrice, evaluationDate=evaluationDate, **coefsOfDerivative)
+    print(cache.statistics(), '耗时%.4f秒' % (time.time() - time_start))
+
+
+if __name__ == '__main__':
+    估值缓存测试1()
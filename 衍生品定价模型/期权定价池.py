@@ -0,0 +1,94 @@
+import QuantLib as ql
+
+
+# 行情参数，通过更新模型中的ql.SimpleQuote重新定价，其余参数均视为合约条款
+MARKET_PARAMETERS = ('stockPrice', 'dividendRate', 'riskFree', 'volatility')
+
+
+# 期权定价池
+# 按(模型类, 合约条款)保存一个已构造的模型，重复定价时只更新行情报价和估值日，不再重新构造期权、曲线和定价引擎
+class OptionPricerPool(object):
+    def __init__(self):
+        self.models = {}
+        self.hits = 0  # 定价池中已有模型的次数
+        self.misses = 0  # 新构造模型的次数
+        self.rebuilds = 0  # 估值日变化，重建曲线和定价引擎的次数
+
+    def get(self, Derivative, evaluationDate, **coefsOfDerivative):
+        # 参数与Derivative的构造参数相同，返回行情和估值日已经更新的模型
+        # 返回的模型由定价池持有，调用者不应修改其合约条款
+        market = {name: coefsOfDerivative.pop(name) for name in MARKET_PARAMETERS if name in coefsOfDerivative}
+        key = self._get_key(Derivative, coefsOfDerivative)
+        model = self.models.get(key)
+        if model is None:
+            self.misses += 1
+            model = Derivative(evaluationDate=evaluationDate, **market, **coefsOfDerivative)
+            self.models[key] = model
+            return model
+        self.hits += 1
+        if model.evaluationDate != model.str2date(evaluationDate):
+            self.rebuilds += 1
+            model.setEvaluationDate(evaluationDate)
+        else:
+            ql.Settings.instance().evaluationDate = model.evaluationDate  # 全局估值日可能已被其他模型修改
+        quotes = model._get_quotes()
+        for name in market:
+            quotes[name].setValue(market[name])
+        return model
+
+    def value(self, Derivative, evaluationDate, **coefsOfDerivative):
+        return self.get(Derivative, evaluationDate, **coefsOfDerivative).value()
+
+    def delta(self, Derivative, evaluationDate, **coefsOfDerivative):
+        return self.get(Derivative, evaluationDate, **coefsOfDerivative).delta()
+
+    def statistics(self):
+        return {'models': len(self.models), 'hits': self.hits, 'misses': self.misses, 'rebuilds': self.rebuilds}
+
+    def clear(self):
+        self.models = {}
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    @staticmethod
+    def _get_key(Derivative, coefsOfDerivative):
+        # 列表类型的合约条款（如historyPrices、dividendDates）转化为tuple以便作为字典的键
+        terms = []
+        for name in sorted(coefsOfDerivative):
+            term = coefsOfDerivative[name]
+            if isinstance(term, list):
+                term = tuple(term)
+            terms.append((name, term))
+        return Derivative, tuple(terms)
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 定价池测试1():
+    # 同一合约在不同估值日、不同标的价格下重复计算delta
+    import time
+    from 股票期权定价模型 import AmericanOptionBSMBinomial
+
+    pool = OptionPricerPool()
+    coefsOfDerivative = {'strikePrice': 100.0, 'maturityDate': '2014-06-09', 'optionType': ql.Option.Put,
+                         'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.2}
+    evaluationDates = ['2014-03-07', '2014-03-10', '2014-03-11', '2014-03-12']
+    stockPrices = [95.0 + i for i in range(10)]
+    time_start = time.time()
+    for evaluationDate in evaluationDates:
+        for stockPrice in stockPrices:
+            AmericanOptionBSMBinomial(stockPrice=stockPrice, evaluationDate=evaluationDate, **coefsOfDerivative).delta()
+    time_object = time.time() - time_start
+    time_start = time.time()
+    for evaluationDate in evaluationDates:
+        for stockPrice in stockPrices:
+            pool.delta(AmericanOptionBSMBinomial, stockPrice=stockPrice, evaluationDate=evaluationDate, **coefsOfDerivative)
+    time_pool = time.time() - time_start
+    print(pool.statistics())
+    print('逐个构造模型耗时%.4f秒，定价池耗时%.4f秒' % (time_object, time_pool))
+
+
+if __name__ == '__main__':
+    定价池测试1()
@@ -1,12 +1,19 @@
 import QuantLib as ql
 import random
+import time
 import numpy as np
 from abc import abstractmethod, ABCMeta
+import 蒙特卡洛引擎
+import 交易日历
 
 
 # 定义全局变量
 MC_SAMPLE_NUMBER = 10000
+MC_CONTROL_VARIATE_SAMPLE_NUMBER = 2000
 EPS = 0.001
+GREEKS = ('delta', 'gamma', 'vega', 'theta', 'rho')  # greeks()返回的希腊值，theta、vega、rho为年化数值
+RESOLUTION_START = 25  # 按精度选择步数时的起始步数
+RESOLUTION_MAX = 6400  # 按精度选择步数时的最大步数
 
 
 # 股票期权定价的基类
@@ -32,11 +39,237 @@ class Option(object):
     def delta(self):
         pass
 
-    def str2date(self, string):
+    def setEvaluationDate(self, evaluationDate):
+        # 不重新构造期权合约，在新的估值日上重建曲线、价格过程和定价引擎
+        self.evaluationDate = self.str2date(evaluationDate)
+        ql.Settings.instance().evaluationDate = self.evaluationDate
+        self.process = self.getPricingProcess()
+        self.option.setPricingEngine(self.getPricingEngine())
+
+    def greeks(self, eps=EPS):
+        # 一次返回NPV和GREEKS中的全部希腊值，计算方法见batchGreeks
+        greeks = self.batchGreeks([self], eps)
+        return {name: greeks[name][0] for name in greeks}
+
+    @classmethod
+    def batchGreeks(cls, models, eps=EPS):
+        # models为同一类模型的列表，返回{'NPV', 'delta', 'gamma', 'vega', 'theta', 'rho'}的字典，每项为np.ndarray
+        # 定价引擎对全部模型都提供的希腊值直接使用，其余的用一组共用的差分计算，基准价格只计算一次：
+        # delta和gamma共用标的价格的±eps比例变动，vega、rho为波动率、无风险利率±eps的中心差分，
+        # theta为估值日后移一个交易日的向前差分（标的价格不变），按实际经过的自然日年化，蒙特卡洛模型见_commonRandomTheta
+        values = cls._batchValue(models)
+        greeks = {'NPV': values}
+        engineGreeks = [m._get_engine_greeks() for m in models]
+        for name in GREEKS:
+            if all(name in g for g in engineGreeks):
+                greeks[name] = np.array([g[name] for g in engineGreeks])
+        if 'delta' not in greeks or 'gamma' not in greeks:
+            stockPrice = np.array([m.stockPrice.value() for m in models])
+            valuesUp = cls._batchBumpedValue(models, 'stockPrice', stockPrice * (1 + eps))
+            valuesDown = cls._batchBumpedValue(models, 'stockPrice', stockPrice * (1 - eps))
+            greeks.setdefault('delta', (valuesUp - valuesDown) / (2 * eps * stockPrice))
+            greeks.setdefault('gamma', (valuesUp - 2 * values + valuesDown) / (eps * stockPrice) ** 2)
+        for name, quoteName in (('vega', 'volatility'), ('rho', 'riskFree')):
+            if name not in greeks:
+                quoteValue = np.array([m._get_quotes()[quoteName].value() for m in models])
+                valuesUp = cls._batchBumpedValue(models, quoteName, quoteValue + eps)
+                valuesDown = cls._batchBumpedValue(models, quoteName, quoteValue - eps)
+                greeks[name] = (valuesUp - valuesDown) / (2 * eps)
+        if 'theta' not in greeks:
+            evaluationDate = models[0].evaluationDate
+            nextDates = [交易日历.CHINA.advanceDate(m.evaluationDate, 1) for m in models]
+            yearFractions = np.array([ql.Actual365Fixed().yearFraction(m.evaluationDate, d) for m, d in zip(models, nextDates)])
+            states = [m._roll_evaluation_date(d) for m, d in zip(models, nextDates)]
+            valuesNext = cls._batchValue(models)
+            for m, state in zip(models, states):
+                m._restore_evaluation_date(state)
+            ql.Settings.instance().evaluationDate = evaluationDate
+            greeks['theta'] = (valuesNext - values) / yearFractions
+        return {name: greeks[name] for name in ('NPV',) + GREEKS}
+
+    @classmethod
+    def _batchValue(cls, models):
+        # 现在参数下一组模型的价格，可以共用模拟路径的模型重写此方法
+        return np.array([m.value() for m in models])
+
+    @classmethod
+    def _batchBumpedValue(cls, models, quoteName, quoteValues):
+        # 把各模型名为quoteName的报价设为quoteValues后定价，再恢复原报价
+        quotes = [m._get_quotes()[quoteName] for m in models]
+        quoteValuesNow = [q.value() for q in quotes]
+        for q, value in zip(quotes, quoteValues):
+            q.setValue(value)
+        values = cls._batchValue(models)
+        for q, value in zip(quotes, quoteValuesNow):
+            q.setValue(value)
+        return values
+
+    def _get_engine_greeks(self):
+        # 定价引擎提供的希腊值，不提供的不包含在返回的字典中
+        engineGreeks = {}
+        for name in GREEKS:
+            try:
+                engineGreeks[name] = getattr(self.option, name)()
+            except RuntimeError:
+                pass
+        return engineGreeks
+
+    def _roll_evaluation_date(self, evaluationDate):
+        # 估值日移动到evaluationDate（ql.Date），用于差分计算theta，返回恢复所需的状态
+        state = self.evaluationDate.ISO()
+        self.setEvaluationDate(evaluationDate.ISO())
+        return state
+
+    def _restore_evaluation_date(self, state):
+        self.setEvaluationDate(state)
+
+    def _commonRandomTheta(self, valueFunction):
+        # 蒙特卡洛模型的theta，定义与batchGreeks相同，估值日后移前后用同一组随机数定价，见蒙特卡洛引擎.theta
+        # 两次独立模拟的差分几乎全是抽样误差，子类的_get_value_parameters返回valueFunction除normals外的参数
+        evaluationDate = self.evaluationDate
+        nextDate = 交易日历.CHINA.advanceDate(evaluationDate, 1)
+        parameters = self._get_value_parameters()
+        state = self._roll_evaluation_date(nextDate)
+        rolledParameters = self._get_value_parameters()
+        self._restore_evaluation_date(state)
+        ql.Settings.instance().evaluationDate = evaluationDate
+        yearFraction = ql.Actual365Fixed().yearFraction(evaluationDate, nextDate)
+        theta, thetaError = 蒙特卡洛引擎.theta(valueFunction, parameters, rolledParameters, yearFraction, self.requiredSamples, self.seed)
+        return {'theta': theta, 'thetaError': thetaError}
+
+    def _get_gbm_parameters(self, dates):
+        # 由价格过程的曲线计算各日期的无风险贴现因子、累积对数漂移和累积方差，用于NumPy蒙特卡洛引擎
+        riskFreeDiscount = np.array([self.process.riskFreeRate().discount(d) for d in dates])
+        dividendDiscount = np.array([self.process.dividendYield().discount(d) for d in dates])
+        variance = np.array([self.process.blackVolatility().blackVariance(d, self.strikePrice) for d in dates])
+        return riskFreeDiscount, np.log(dividendDiscount / riskFreeDiscount), variance
+
+    def _get_quotes(self):
+        # 模型中用ql.SimpleQuote包装的行情参数，更新报价即可重新定价
+        quotes = {}
+        for name in ('stockPrice', 'dividendRate', 'riskFree', 'volatility'):
+            if isinstance(getattr(self, name, None), ql.SimpleQuote):
+                quotes[name] = getattr(self, name)
+        return quotes
+
+    def _get_business_dates(self, endDate):
+        # 估值日之后（不含）至endDate（含）的全部交易日，估值日为非交易日时同样以endDate结束
+        first = 交易日历.CHINA.ordinal(交易日历.CHINA.advanceDate(self.evaluationDate, 1))
+        last = 交易日历.CHINA.ordinal(endDate) + int(交易日历.CHINA.calendar.isBusinessDay(endDate))
+        return [交易日历.CHINA.date(n) for n in range(first, last)]
+
+    @staticmethod
+    def str2date(string):
         # 2010-01-01格式的日期转化为ql.Date对象的函数
-        string = [int(s) for s in string.split('-')]
-        date = ql.Date(string[2], string[1], string[0])
-        return date
+        return 交易日历.str2date(string)
+
+
+# 批量定价中年化期限的计算，与单个模型的曲线设定一致
+# 相同的(evaluationDate, exerciseDate)组合只计算一次
+def _get_year_fraction_batch(evaluationDate, exerciseDate):
+    # 返回无风险利率（ActualActual）和分红、波动率（Actual365Fixed）两种计息方式下的期限
+    datePairs = np.char.add(np.char.add(np.asarray(evaluationDate, dtype=str), '|'), np.asarray(exerciseDate, dtype=str))
+    uniquePairs, inverse = np.unique(datePairs, return_inverse=True)
+    riskFreeTimes = np.empty(len(uniquePairs))
+    actual365Times = np.empty(len(uniquePairs))
+    for i, datePair in enumerate(uniquePairs):
+        startDate, endDate = [Option.str2date(d) for d in datePair.split('|')]
+        riskFreeTimes[i] = ql.ActualActual().yearFraction(startDate, endDate)
+        actual365Times[i] = ql.Actual365Fixed().yearFraction(startDate, endDate)
+    inverse = inverse.reshape(datePairs.shape)
+    return riskFreeTimes[inverse], actual365Times[inverse]
+
+
+# 连续分红股票欧式期权的BSM解析公式，全部参数为可广播的np.ndarray
+def _black_scholes_merton_batch(stockPrice, strikePrice, optionType, dividendRate, riskFree, volatility,
+                                riskFreeTime, dividendTime, volatilityTime):
+    # optionType为ql.Option.Call（1）或ql.Option.Put（-1）
+    # 希腊值的定义与ql.AnalyticEuropeanEngine一致，theta、vega、rho均为年化数值
+    stockPrice, strikePrice, optionType, dividendRate, riskFree, volatility, riskFreeTime, dividendTime, volatilityTime = \
+        np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (stockPrice, strikePrice, optionType, dividendRate, riskFree,
+                                                                   volatility, riskFreeTime, dividendTime, volatilityTime)])
+    from scipy.special import ndtr
+    alive = volatilityTime > 0.0  # 到期日不晚于估值日的期权已经失效，全部结果为0
+    riskFreeDiscount = np.exp(-riskFree * riskFreeTime)
+    dividendDiscount = np.exp(-dividendRate * dividendTime)
+    forward = stockPrice * dividendDiscount / riskFreeDiscount
+    variance = volatility * volatility * volatilityTime
+    stdDev = np.sqrt(variance)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d1 = np.log(forward / strikePrice) / stdDev + 0.5 * stdDev
+        d2 = d1 - stdDev
+        density = np.exp(-0.5 * d1 * d1) / np.sqrt(2.0 * np.pi)
+        NPV = riskFreeDiscount * optionType * (forward * ndtr(optionType * d1) - strikePrice * ndtr(optionType * d2))
+        delta = optionType * dividendDiscount * ndtr(optionType * d1)
+        gamma = dividendDiscount * density / (stockPrice * stdDev)
+        vega = stockPrice * dividendDiscount * density * np.sqrt(volatilityTime)
+        rho = optionType * riskFreeTime * riskFreeDiscount * strikePrice * ndtr(optionType * d2)
+        theta = -(np.log(riskFreeDiscount) * NPV + np.log(forward / stockPrice) * stockPrice * delta
+                  + 0.5 * variance * stockPrice * stockPrice * gamma) / volatilityTime
+    result = {'NPV': NPV, 'delta': delta, 'gamma': gamma, 'vega': vega, 'theta': theta, 'rho': rho}
+    for key in result:
+        result[key] = np.where(alive, np.nan_to_num(result[key]), 0.0)
+    return result
+
+
+# 连续分红股票欧式期权BSM价格的向量化反解，全部参数为可广播的np.ndarray
+def _implied_volatility_batch(price, stockPrice, strikePrice, optionType, dividendRate, riskFree,
+                              riskFreeTime, dividendTime, volatilityTime, accuracy=1e-8, maxIterations=100, maxVolatility=5.0):
+    # 在远期价格下把期权转化为虚值期权的时间价值，对总标准差s=sigma*sqrt(T)求解Black公式
+    # 初值为Corrado-Miller有理近似，迭代为带区间保护的Newton法：Newton步落在有根区间外时改用二分
+    # accuracy为隐含波动率的绝对误差，返回(隐含波动率, 是否收敛)
+    # 价格低于内在价值、高于无套利上界或已到期的合约返回(np.nan, False)
+    # 深度实值、深度虚值或低波动率的合约时间价值极小，波动率变动accuracy引起的价格变动小于价格的浮点精度时波动率无法由价格确定，
+    # 返回迭代得到的波动率和False
+    price, stockPrice, strikePrice, optionType, dividendRate, riskFree, riskFreeTime, dividendTime, volatilityTime = \
+        np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (price, stockPrice, strikePrice, optionType, dividendRate,
+                                                                   riskFree, riskFreeTime, dividendTime, volatilityTime)])
+    from scipy.special import ndtr
+    riskFreeDiscount = np.exp(-riskFree * riskFreeTime)
+    forward = stockPrice * np.exp(-dividendRate * dividendTime) / riskFreeDiscount
+    otmType = np.where(strikePrice >= forward, 1.0, -1.0)  # 虚值期权的类型，平值按看涨处理
+    target = price / riskFreeDiscount - np.maximum(optionType * (forward - strikePrice), 0.0)
+    # 时间价值由价格减去内在价值得到，其绝对误差约为价格、远期价格和敲定价中最大者的几倍机器精度
+    priceResolution = 8.0 * np.finfo(float).eps * np.maximum(np.maximum(price / riskFreeDiscount, forward), strikePrice)
+    upperBound = np.where(otmType > 0, forward, strikePrice)
+    valid = (volatilityTime > 0.0) & (target > 0.0) & (target < upperBound)
+    sqrtTime = np.sqrt(np.where(volatilityTime > 0.0, volatilityTime, 1.0))
+    logMoneyness = np.log(forward / strikePrice)
+    # Corrado-Miller初值，判别式为负时退化为Brenner-Subrahmanyam近似
+    callPrice = target + np.maximum(forward - strikePrice, 0.0)
+    halfGap = callPrice - 0.5 * (forward - strikePrice)
+    discriminant = np.maximum(halfGap * halfGap - (forward - strikePrice) ** 2 / np.pi, 0.0)
+    stdDev = np.sqrt(2.0 * np.pi) / (forward + strikePrice) * (halfGap + np.sqrt(discriminant))
+    lower = np.zeros_like(stdDev)
+    upper = maxVolatility * sqrtTime
+    stdDev = np.clip(np.nan_to_num(stdDev), 0.01 * upper, 0.99 * upper)
+    converged = ~valid
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for _ in range(maxIterations):
+            d1 = logMoneyness / stdDev + 0.5 * stdDev
+            d2 = d1 - stdDev
+            value = otmType * (forward * ndtr(otmType * d1) - strikePrice * ndtr(otmType * d2))
+            difference = value - target
+            vega = forward * np.exp(-0.5 * d1 * d1) / np.sqrt(2.0 * np.pi)
+            # Newton步长或有根区间小于容差时收敛，深度虚值合约的vega很小，不能只看价格误差
+            step = difference / vega
+            converged = converged | (np.abs(step) < accuracy * sqrtTime) | (upper - lower < accuracy * sqrtTime) | (difference == 0.0)
+            if np.all(converged):
+                break
+            # 价格关于标准差单调递增，更新有根区间
+            lower = np.where(difference < 0.0, stdDev, lower)
+            upper = np.where(difference > 0.0, stdDev, upper)
+            newton = stdDev - step
+            bracketed = (newton > lower) & (newton < upper)
+            stdDev = np.where(converged, stdDev, np.where(bracketed, newton, 0.5 * (lower + upper)))
+    # 解处的vega乘以容差不超过价格精度时，Newton步长收敛不代表波动率达到了accuracy
+    with np.errstate(invalid='ignore'):
+        d1 = logMoneyness / stdDev + 0.5 * stdDev
+        vega = forward * np.exp(-0.5 * d1 * d1) / np.sqrt(2.0 * np.pi)
+        resolved = (vega * accuracy * sqrtTime > priceResolution) & (target > priceResolution)
+    converged = converged & valid & resolved
+    volatility = np.where(valid, stdDev / sqrtTime, np.nan)
+    return volatility, converged
 
 
 # 欧式股票期权的基类
@@ -107,6 +340,43 @@ class EuropeanOptionBSAnalytic(EuropeanOption):
         delta = self.option.delta()
         return delta
 
+    @classmethod
+    def batch(cls, stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, riskFree, volatility):
+        # 向量化的批量定价，不构造QuantLib对象
+        # 参数与__init__相同，可以为标量或可相互广播的np.ndarray，日期为'YYYY-MM-DD'格式的字符串（数组）
+        # 返回{'NPV', 'delta', 'gamma', 'vega', 'theta', 'rho'}的字典，每项为与参数广播后形状相同的np.ndarray
+        return cls._batch(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, 0.0, riskFree, volatility)
+
+    @staticmethod
+    def _batch(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility):
+        riskFreeTime, actual365Time = _get_year_fraction_batch(evaluationDate, exerciseDate)
+        return _black_scholes_merton_batch(stockPrice, strikePrice, optionType, dividendRate, riskFree, volatility,
+                                           riskFreeTime, actual365Time, actual365Time)
+
+    @classmethod
+    def batchGreeks(cls, models, eps=EPS):
+        # 解析模型直接用向量化的解析公式计算，与ql.AnalyticEuropeanEngine的希腊值一致
+        if cls.batch is None:
+            return super().batchGreeks(models, eps)
+        dividendRate = [m.dividendRate.value() if hasattr(m, 'dividendRate') else 0.0 for m in models]
+        return cls._batch([m.stockPrice.value() for m in models], [m.strikePrice for m in models],
+                          [m.evaluationDate.ISO() for m in models], [m.exerciseDate.ISO() for m in models],
+                          [m.optionType for m in models], dividendRate, [m.riskFree.value() for m in models],
+                          [m.volatility.value() for m in models])
+
+    @classmethod
+    def impliedVolatilityBatch(cls, price, stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, riskFree, accuracy=1e-8, maxIterations=100):
+        # 由一组期权（如整个期权链）的价格批量反解隐含波动率，参数的形式与batch相同
+        # 返回(隐含波动率, 是否收敛)两个np.ndarray，未收敛的合约见_implied_volatility_batch
+        return cls._impliedVolatilityBatch(price, stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, 0.0,
+                                           riskFree, accuracy, maxIterations)
+
+    @staticmethod
+    def _impliedVolatilityBatch(price, stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, accuracy, maxIterations):
+        riskFreeTime, actual365Time = _get_year_fraction_batch(evaluationDate, exerciseDate)
+        return _implied_volatility_batch(price, stockPrice, strikePrice, optionType, dividendRate, riskFree,
+                                         riskFreeTime, actual365Time, actual365Time, accuracy, maxIterations)
+
 
 # 连续分红股票欧式期权的BSM解析定价模型
 class EuropeanOptionBSMAnalytic(EuropeanOptionBSAnalytic):
@@ -150,9 +420,22 @@ class EuropeanOptionBSMAnalytic(EuropeanOptionBSAnalytic):
         value = self.NPV(self.stockPrice.value(), self.dividendRate.value(), self.riskFree.value(), self.volatility.value())
         return value
 
+    @classmethod
+    def batch(cls, stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility):
+        # 向量化的批量定价，参数与返回值的说明见EuropeanOptionBSAnalytic.batch
+        return cls._batch(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility)
+
+    @classmethod
+    def impliedVolatilityBatch(cls, price, stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, accuracy=1e-8, maxIterations=100):
+        # 批量反解隐含波动率，参数与返回值的说明见EuropeanOptionBSAnalytic.impliedVolatilityBatch
+        return cls._impliedVolatilityBatch(price, stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate,
+                                           riskFree, accuracy, maxIterations)
+
 
 # 连续分红股票欧式期权的BSM蒙特卡洛定价模型
 class EuropeanOptionBSMMonteCarlo(EuropeanOptionBSMAnalytic):
+    batch = None  # 蒙特卡洛模型没有批量解析定价
+
     def __init__(self, stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility, seed=None, requiredSamples=MC_SAMPLE_NUMBER):
         # MC参数设定
         if seed is None:
@@ -177,6 +460,28 @@ class EuropeanOptionBSMMonteCarlo(EuropeanOptionBSMAnalytic):
         delta = (value_p - value_m) / (2 * eps * self.stockPrice.value())
         return delta
 
+    def pathwiseGreeks(self):
+        # 同一组模拟路径上一次计算NPV、delta、gamma、vega及其标准误差（键名加Error）
+        # 使用NumPy蒙特卡洛引擎，随机数与ql.MCEuropeanEngine不同，NPV在误差范围内一致
+        riskFreeDiscount, logDrift, variance = self._get_gbm_parameters([self.exerciseDate])
+        greeks = 蒙特卡洛引擎.european_greeks(self.stockPrice.value(), self.strikePrice, self.optionType,
+                                          riskFreeDiscount[0], logDrift[0], variance[0], self.volatility.value(),
+                                          self.requiredSamples, self.seed)
+        return greeks
+
+    def commonRandomTheta(self):
+        # 估值日后移一个交易日前后在同一组随机数上定价的theta及其标准误差，返回{'theta', 'thetaError'}
+        return self._commonRandomTheta(蒙特卡洛引擎.european_values)
+
+    def _get_value_parameters(self):
+        riskFreeDiscount, logDrift, variance = self._get_gbm_parameters([self.exerciseDate])
+        return {'stockPrice': self.stockPrice.value(), 'strikePrice': self.strikePrice, 'optionType': self.optionType,
+                'riskFreeDiscount': riskFreeDiscount[0], 'logDrift': logDrift, 'variance': variance}
+
+    def _get_engine_greeks(self):
+        # ql.MCEuropeanEngine不提供希腊值，后移估值日重新模拟的随机数与原模拟无关，theta使用commonRandomTheta
+        return {'theta': self.commonRandomTheta()['theta']}
+
 
 # 离散分红欧式股票期权的基类
 class EuropeanOptionDiscreteDividends(Option):
@@ -265,23 +570,38 @@ class AmericanOption(Option):
         self.maturityDate = self.str2date(maturityDate)  # 美式期权为到期日
         self.optionType = optionType
         # 构造期权
-        self.option = ql.VanillaOption(ql.PlainVanillaPayoff(self.optionType, self.strikePrice),
-                                       ql.AmericanExercise(self.evaluationDate, self.maturityDate))
+        self.option = self._get_option()
+
+    def _get_option(self):
+        option = ql.VanillaOption(ql.PlainVanillaPayoff(self.optionType, self.strikePrice),
+                                  ql.AmericanExercise(self.evaluationDate, self.maturityDate))
+        return option
 
 
 # 连续分红股票美式期权的BSM二叉树定价模型
 class AmericanOptionBSMBinomial(AmericanOption):
-    def __init__(self, stockPrice, strikePrice, evaluationDate, maturityDate, optionType, dividendRate, riskFree, volatility):
+    def __init__(self, stockPrice, strikePrice, evaluationDate, maturityDate, optionType, dividendRate, riskFree, volatility, tolerance=None, richardson=False):
         # 无风险利率的计算方式为ActualActual
         # 波动率的计算方式为Actual365Fixed
+        # tolerance为None时，步数取估值日到到期日的自然日天数
+        # 否则从RESOLUTION_START步开始逐次加倍，取相邻两次价格之差小于tolerance的最小步数，见selectResolution
+        # richardson为True时，用所选步数n及n/2两次结果的Richardson外推2P(n)-P(n/2)作为NPV和delta
         super().__init__(stockPrice, strikePrice, evaluationDate, maturityDate, optionType)
         self.dividendRate = ql.SimpleQuote(dividendRate)
         self.riskFree = ql.SimpleQuote(riskFree)
         self.volatility = ql.SimpleQuote(volatility)
+        self.tolerance = tolerance
+        self.richardson = richardson
+        self.resolution = None  # 按精度选择的步数
+        self.resolutionError = None  # 所选步数与其一半步数的价格之差
+        self.resolutionTime = 0.0  # 选择步数耗时（秒）
+        self.coarseOption = None  # Richardson外推使用的一半步数的期权
         self.process = self.getPricingProcess()
         # 定义价格引擎
         engine = self.getPricingEngine()
         self.option.setPricingEngine(engine)
+        if self.tolerance is not None:
+            self.selectResolution()
 
     def getPricingProcess(self):
         # 构造无风险利率、分红和波动率曲线
@@ -296,11 +616,73 @@ class AmericanOptionBSMBinomial(AmericanOption):
                                                ql.BlackVolTermStructureHandle(volatility))
         return process
 
-    def getPricingEngine(self):
+    def getPricingEngine(self, resolution=None):
+        # resolution为二叉树步数，默认为按精度选择的步数，未选择时为估值日到到期日的自然日天数
         # 二叉树的方法有crr（CoxRossRubinstein），jr（JarrowRudd），eqp（AdditiveEQPBinomialTree），tian（Tian），lr（LeisenReimer），joshi4（Joshi4），trigeorgis（Trigeorgis）
-        engine = ql.BinomialVanillaEngine(self.process, "AdditiveEQPBinomialTree", steps=self.maturityDate-self.evaluationDate)
+        steps = self._get_resolution(resolution)
+        engine = ql.BinomialVanillaEngine(self.process, "AdditiveEQPBinomialTree", steps=steps)
         return engine
 
+    def _get_resolution(self, resolution):
+        if resolution is None:
+            resolution = self.resolution
+        if resolution is None:
+            resolution = self.maturityDate - self.evaluationDate
+        return resolution
+
+    def selectResolution(self):
+        # 在现在的参数下按self.tolerance选择步数：步数n从RESOLUTION_START开始逐次加倍，
+        # 直到|P(2n)-P(n)|<tolerance或达到RESOLUTION_MAX，取2n；行情参数变化后不重新选择
+        time_start = time.perf_counter()
+        resolution = RESOLUTION_START
+        self.option.setPricingEngine(self.getPricingEngine(resolution))
+        coarseNPV = self.option.NPV()
+        while True:
+            self.option.setPricingEngine(self.getPricingEngine(2 * resolution))
+            fineNPV = self.option.NPV()
+            if abs(fineNPV - coarseNPV) < self.tolerance or 2 * resolution >= RESOLUTION_MAX:
+                break
+            resolution *= 2
+            coarseNPV = fineNPV
+        self.resolution = 2 * resolution
+        self.resolutionError = abs(fineNPV - coarseNPV)
+        if self.richardson:
+            self.coarseOption = self._get_option()
+            self.coarseOption.setPricingEngine(self.getPricingEngine(resolution))
+        self.resolutionTime = time.perf_counter() - time_start
+        return self.resolution
+
+    def setEvaluationDate(self, evaluationDate):
+        # 按精度选择步数时，在新的估值日上重新选择
+        if self.tolerance is None:
+            super().setEvaluationDate(evaluationDate)
+        else:
+            self.evaluationDate = self.str2date(evaluationDate)
+            ql.Settings.instance().evaluationDate = self.evaluationDate
+            self.process = self.getPricingProcess()
+            self.option.setPricingEngine(self.getPricingEngine())
+            self.selectResolution()
+
+    def _get_engine_greeks(self):
+        # Richardson外推时引擎的希腊值不是外推后的数值，全部使用差分
+        if self.coarseOption is not None:
+            return {}
+        return super()._get_engine_greeks()
+
+    def _roll_evaluation_date(self, evaluationDate):
+        # 差分计算theta时沿用已选择的步数
+        state = self.evaluationDate.ISO()
+        self._set_evaluation_date_keeping_resolution(evaluationDate.ISO())
+        return state
+
+    def _restore_evaluation_date(self, state):
+        self._set_evaluation_date_keeping_resolution(state)
+
+    def _set_evaluation_date_keeping_resolution(self, evaluationDate):
+        Option.setEvaluationDate(self, evaluationDate)
+        if self.coarseOption is not None:
+            self.coarseOption.setPricingEngine(self.getPricingEngine(self.resolution // 2))
+
     def NPV(self, stockPrice, dividendRate, riskFree, volatility):
         # 记录现在的价格
         stockPriceNow = self.stockPrice.value()
@@ -313,6 +695,8 @@ class AmericanOptionBSMBinomial(AmericanOption):
         self.riskFree.setValue(riskFree)
         self.volatility.setValue(volatility)
         NPVValue = self.option.NPV()
+        if self.coarseOption is not None:
+            NPVValue = 2 * NPVValue - self.coarseOption.NPV()
         # 恢复原参数
         self.stockPrice.setValue(stockPriceNow)
         self.dividendRate.setValue(dividendRateNow)
@@ -326,19 +710,23 @@ class AmericanOptionBSMBinomial(AmericanOption):
 
     def delta(self):
         delta = self.option.delta()
+        if self.coarseOption is not None:
+            delta = 2 * delta - self.coarseOption.delta()
         return delta
 
 
 # 连续分红股票美式期权的BSM有限差分定价模型
 class AmericanOptionBSMFD(AmericanOptionBSMBinomial):
-    def getPricingEngine(self):
-        engine = ql.FDAmericanEngine(self.process, timeSteps=self.maturityDate-self.evaluationDate, gridPoints=100)
+    def getPricingEngine(self, resolution=None):
+        # 未按精度选择步数时，时间步数为自然日天数，价格网格为100个点
+        # 按精度选择时，resolution同时作为时间步数和价格网格点数
+        if resolution is None and self.resolution is None:
+            engine = ql.FDAmericanEngine(self.process, timeSteps=self.maturityDate-self.evaluationDate, gridPoints=100)
+        else:
+            resolution = self._get_resolution(resolution)
+            engine = ql.FDAmericanEngine(self.process, timeSteps=resolution, gridPoints=resolution)
         return engine
 
-    def delta(self):
-        delta = self.option.delta()
-        return delta
-
 
 # 连续分红股票美式期权的BSM蒙特卡洛定价模型
 class AmericanOptionBSMMonteCarlo(AmericanOptionBSMBinomial):
@@ -365,6 +753,111 @@ class AmericanOptionBSMMonteCarlo(AmericanOptionBSMBinomial):
         delta = (value_p - value_m) / (2 * eps * self.stockPrice.value())
         return delta
 
+    def pathwiseGreeks(self):
+        # 同一组模拟路径上一次计算NPV、delta、gamma、vega及其标准误差（键名加Error）
+        # 在self._get_exercise_dates()的可行权日上使用Longstaff-Schwartz方法确定行权策略
+        # 希腊值有偏、标准误差偏小，见蒙特卡洛引擎.american_greeks
+        riskFreeDiscount, logDrift, variance = self._get_gbm_parameters(self._get_exercise_dates())
+        greeks = 蒙特卡洛引擎.american_greeks(self.stockPrice.value(), self.strikePrice, self.optionType,
+                                          riskFreeDiscount, logDrift, variance, self.volatility.value(),
+                                          self.requiredSamples, self.seed)
+        return greeks
+
+    def commonRandomTheta(self):
+        # 估值日后移一个交易日前后在同一组随机数上定价的theta及其标准误差，返回{'theta', 'thetaError'}
+        # 后移前后分别回归行权策略
+        return self._commonRandomTheta(蒙特卡洛引擎.american_values)
+
+    def _get_value_parameters(self):
+        riskFreeDiscount, logDrift, variance = self._get_gbm_parameters(self._get_exercise_dates())
+        return {'stockPrice': self.stockPrice.value(), 'strikePrice': self.strikePrice, 'optionType': self.optionType,
+                'riskFreeDiscount': riskFreeDiscount, 'logDrift': logDrift, 'variance': variance}
+
+    def _get_engine_greeks(self):
+        # ql.MCAmericanEngine不提供希腊值，后移估值日后可行权日和时间步数改变，重新模拟的随机数与原模拟无关，theta使用commonRandomTheta
+        return {'theta': self.commonRandomTheta()['theta']}
+
+    def _get_exercise_dates(self):
+        # 与ql.MCAmericanEngine相同，估值日之后的每个自然日为一个可行权日
+        return [self.evaluationDate + i + 1 for i in range(self.maturityDate - self.evaluationDate)]
+
+
+# 连续分红股票美式期权的BSM定价模型-NumPy向量化Longstaff-Schwartz方法
+# 同一标的的多个合约（如一组行权价）可以共用一组模拟路径和回归基函数定价，见batchNPV
+class AmericanOptionBSMLongstaffSchwartz(AmericanOptionBSMMonteCarlo):
+    def __init__(self, stockPrice, strikePrice, evaluationDate, maturityDate, optionType, dividendRate, riskFree, volatility, seed=None, requiredSamples=MC_SAMPLE_NUMBER, exerciseGrid='business', basisOrder=3):
+        # exerciseGrid为可行权日的设定：'calendar'-每个自然日，'business'-中国交易日历的每个交易日，
+        # 或['2014-03-10', '2014-03-17']格式的日期列表，到期日总是可行权
+        # basisOrder为回归基函数S/S_0的多项式次数
+        self.exerciseGrid = exerciseGrid
+        self.basisOrder = basisOrder
+        super().__init__(stockPrice, strikePrice, evaluationDate, maturityDate, optionType, dividendRate, riskFree, volatility, seed, requiredSamples)
+
+    def NPV(self, stockPrice, dividendRate, riskFree, volatility):
+        # 记录现在的价格
+        stockPriceNow = self.stockPrice.value()
+        dividendRateNow = self.dividendRate.value()
+        riskFreeNow = self.riskFree.value()
+        volatilityNow = self.volatility.value()
+        # 更新相关的计算参数
+        self.stockPrice.setValue(stockPrice)
+        self.dividendRate.setValue(dividendRate)
+        self.riskFree.setValue(riskFree)
+        self.volatility.setValue(volatility)
+        NPVValue = self.batchNPV([self])[0][0]
+        # 恢复原参数
+        self.stockPrice.setValue(stockPriceNow)
+        self.dividendRate.setValue(dividendRateNow)
+        self.riskFree.setValue(riskFreeNow)
+        self.volatility.setValue(volatilityNow)
+        return NPVValue
+
+    def errorEstimate(self):
+        # 现在参数下NPV的标准误差
+        return self.batchNPV([self])[1][0]
+
+    @classmethod
+    def _batchValue(cls, models):
+        # 差分计算希腊值时，一组模型共用一组模拟路径
+        return cls.batchNPV(models)[0]
+
+    def _get_engine_greeks(self):
+        # 标的价格和波动率的差分会改变回归得到的行权策略，gamma的差分结果不稳定，delta、gamma、vega使用路径导数估计
+        greeks = self.pathwiseGreeks()
+        greeks = {name: greeks[name] for name in ('delta', 'gamma', 'vega')}
+        greeks['theta'] = self.commonRandomTheta()['theta']
+        return greeks
+
+    def _get_value_parameters(self):
+        parameters = super()._get_value_parameters()
+        parameters['basisOrder'] = self.basisOrder
+        return parameters
+
+    def _get_exercise_dates(self):
+        if self.exerciseGrid == 'calendar':
+            exerciseDates = super()._get_exercise_dates()
+        elif self.exerciseGrid == 'business':
+            exerciseDates = self._get_business_dates(self.maturityDate)
+        else:
+            exerciseDates = [self.str2date(d) for d in self.exerciseGrid]
+        exerciseDates = [d for d in exerciseDates if self.evaluationDate < d < self.maturityDate]
+        return exerciseDates + [self.maturityDate]
+
+    @staticmethod
+    def batchNPV(models):
+        # 同一标的的多个合约共用一组模拟路径和回归基函数定价，返回NPV与标准误差的np.ndarray
+        # 各模型的stockPrice、evaluationDate、利率、分红与波动率应相同，行权价、类型、到期日和可行权日可以不同
+        # 随机数种子、样本数和回归基函数取第一个模型的设定
+        model = models[0]
+        exerciseDates = [m._get_exercise_dates() for m in models]
+        serialNumbers = sorted(set(d.serialNumber() for dates in exerciseDates for d in dates))
+        riskFreeDiscount, logDrift, variance = model._get_gbm_parameters([ql.Date(n) for n in serialNumbers])
+        lastExerciseIndex = np.array([serialNumbers.index(m.maturityDate.serialNumber()) for m in models])
+        return 蒙特卡洛引擎.american_prices(model.stockPrice.value(), [m.strikePrice for m in models],
+                                       [m.optionType for m in models], lastExerciseIndex,
+                                       riskFreeDiscount, logDrift, variance,
+                                       model.requiredSamples, model.seed, basisOrder=model.basisOrder)
+
 
 # 离散平均亚式股票期权的基类
 class DiscreteAveragingAsiannOption(Option):
@@ -384,14 +877,38 @@ class DiscreteAveragingAsiannOption(Option):
         # 构造期权
         # evaluationDate如果是第一天盘中，则historyPrices为[]
         # 否则，historyPrices的最后一项应为evaluationDate的收盘价
+        self.option = self._get_option()
+
+    def _get_option(self):
         runningAccumulator, pastFixings = self._get_accumulator()
-        fixingDates = self._get_fixing_dates()
-        self.option = ql.DiscreteAveragingAsianOption(self.averageType,
-                                                      runningAccumulator,
-                                                      pastFixings,
-                                                      fixingDates,
-                                                      ql.PlainVanillaPayoff(self.optionType, self.strikePrice),
-                                                      ql.EuropeanExercise(self.exerciseDate))
+        self.fixingDates = self._get_fixing_dates()  # 采样日只在估值日变化时重新计算
+        option = ql.DiscreteAveragingAsianOption(self.averageType,
+                                                 runningAccumulator,
+                                                 pastFixings,
+                                                 self.fixingDates,
+                                                 ql.PlainVanillaPayoff(self.optionType, self.strikePrice),
+                                                 ql.EuropeanExercise(self.exerciseDate))
+        return option
+
+    def setEvaluationDate(self, evaluationDate):
+        # 均值采样日依赖估值日，需要重新构造期权合约
+        self.evaluationDate = self.str2date(evaluationDate)
+        ql.Settings.instance().evaluationDate = self.evaluationDate
+        self.option = self._get_option()
+        self.process = self.getPricingProcess()
+        self.option.setPricingEngine(self.getPricingEngine())
+
+    def _roll_evaluation_date(self, evaluationDate):
+        # 估值日后移时，跨过的采样日按现在的标的价格计入历史价格
+        state = (self.evaluationDate.ISO(), self.historyPrices)
+        passedFixings = sum(1 for d in self.fixingDates if d <= evaluationDate)
+        self.historyPrices = list(self.historyPrices) + [self.stockPrice.value()] * passedFixings
+        self.setEvaluationDate(evaluationDate.ISO())
+        return state
+
+    def _restore_evaluation_date(self, state):
+        evaluationDate, self.historyPrices = state
+        self.setEvaluationDate(evaluationDate)
 
     def _get_accumulator(self):
         # 根据历史价格构造runningAccumulator和pastFixings
@@ -406,10 +923,7 @@ class DiscreteAveragingAsiannOption(Option):
         # 不包括self.evaluationDate
         # 包括self.exerciseDate
         # 中间的交易日全部包括
-        fixingDates = []
-        for i in range(self.calendar.businessDaysBetween(self.evaluationDate, self.exerciseDate)):
-            fixingDates.append(self.calendar.advance(self.evaluationDate, i + 1, ql.Days))
-        return fixingDates
+        return self._get_business_dates(self.exerciseDate)
 
 
 # 离散平均价格亚式股票期权BSM定价模型-蒙特卡洛求解
@@ -482,6 +996,89 @@ class DiscreteArithmeticAveragingPriceAsiannOptionBSMMonteCarlo(DiscreteAveragin
         delta = (value_p - value_m) / (2 * eps * self.stockPrice.value())
         return delta
 
+    def pathwiseGreeks(self):
+        # 同一组模拟路径上一次计算NPV、delta、gamma、vega及其标准误差（键名加Error）
+        # historyPrices的处理与ql.DiscreteAveragingAsianOption相同
+        runningAccumulator, pastFixings = self._get_accumulator()
+        riskFreeDiscount, logDrift, variance = self._get_gbm_parameters(self.fixingDates)
+        exerciseDiscount = self.process.riskFreeRate().discount(self.exerciseDate)
+        greeks = 蒙特卡洛引擎.asian_greeks(self.stockPrice.value(), self.strikePrice, self.optionType,
+                                       exerciseDiscount, logDrift, variance, self.volatility.value(),
+                                       runningAccumulator, pastFixings, self.requiredSamples, self.seed)
+        return greeks
+
+    def commonRandomTheta(self):
+        # 估值日后移一个交易日前后在同一组随机数上定价的theta及其标准误差，返回{'theta', 'thetaError'}
+        # 后移跨过的采样日按现在的标的价格计入历史价格，见_roll_evaluation_date
+        return self._commonRandomTheta(蒙特卡洛引擎.asian_values)
+
+    def _get_value_parameters(self):
+        runningAccumulator, pastFixings = self._get_accumulator()
+        _, logDrift, variance = self._get_gbm_parameters(self.fixingDates)
+        return {'stockPrice': self.stockPrice.value(), 'strikePrice': self.strikePrice, 'optionType': self.optionType,
+                'riskFreeDiscount': self.process.riskFreeRate().discount(self.exerciseDate), 'logDrift': logDrift,
+                'variance': variance, 'runningAccumulator': runningAccumulator, 'pastFixings': pastFixings}
+
+    def _get_engine_greeks(self):
+        # 蒙特卡洛引擎不提供希腊值，后移估值日后采样日个数改变，重新模拟的随机数与原模拟无关，theta使用commonRandomTheta
+        return {'theta': self.commonRandomTheta()['theta']}
+
+
+# 离散平均价格亚式股票期权BSM定价模型-NumPy蒙特卡洛求解
+# 全部路径的全部采样日一次模拟，以几何平均亚式期权的解析价格作为控制变量，相同误差下需要的样本数远少于ql.MCDiscreteArithmeticAPEngine
+class DiscreteArithmeticAveragingPriceAsiannOptionBSMControlVariateMonteCarlo(DiscreteArithmeticAveragingPriceAsiannOptionBSMMonteCarlo):
+    def __init__(self, stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, historyPrices, dividendRate, riskFree, volatility, seed=None, requiredSamples=MC_CONTROL_VARIATE_SAMPLE_NUMBER):
+        super().__init__(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, historyPrices, dividendRate, riskFree, volatility, seed, requiredSamples)
+
+    def NPV(self, stockPrice, dividendRate, riskFree, volatility):
+        # 记录现在的价格
+        stockPriceNow = self.stockPrice.value()
+        dividendRateNow = self.dividendRate.value()
+        riskFreeNow = self.riskFree.value()
+        volatilityNow = self.volatility.value()
+        # 更新相关的计算参数
+        self.stockPrice.setValue(stockPrice)
+        self.dividendRate.setValue(dividendRate)
+        self.riskFree.setValue(riskFree)
+        self.volatility.setValue(volatility)
+        NPVValue = self.batchNPV([self])[0][0]
+        # 恢复原参数
+        self.stockPrice.setValue(stockPriceNow)
+        self.dividendRate.setValue(dividendRateNow)
+        self.riskFree.setValue(riskFreeNow)
+        self.volatility.setValue(volatilityNow)
+        return NPVValue
+
+    def errorEstimate(self):
+        # 现在参数下NPV的标准误差
+        return self.batchNPV([self])[1][0]
+
+    @classmethod
+    def _batchValue(cls, models):
+        # 差分计算希腊值时，一组模型共用一组模拟路径
+        return cls.batchNPV(models)[0]
+
+    @staticmethod
+    def batchNPV(models):
+        # 同一标的的多个合约共用一组模拟路径定价，返回NPV与标准误差的np.ndarray
+        # 各模型的stockPrice、evaluationDate、利率、分红与波动率应相同，采样日可以不同，随机数种子和样本数取第一个模型的设定
+        model = models[0]
+        serialNumbers = sorted(set(d.serialNumber() for m in models for d in m.fixingDates))
+        fixingIndex = {serialNumber: i for i, serialNumber in enumerate(serialNumbers)}
+        _, logDrift, variance = model._get_gbm_parameters([ql.Date(n) for n in serialNumbers])
+        contracts = []
+        for m in models:
+            runningAccumulator, pastFixings = m._get_accumulator()
+            contracts.append({'strikePrice': m.strikePrice,
+                              'optionType': m.optionType,
+                              'riskFreeDiscount': m.process.riskFreeRate().discount(m.exerciseDate),
+                              'fixingIndex': [fixingIndex[d.serialNumber()] for d in m.fixingDates],
+                              'runningAccumulator': runningAccumulator,
+                              'historyLogSum': np.sum(np.log(m.historyPrices)),
+                              'pastFixings': pastFixings})
+        return 蒙特卡洛引擎.asian_control_variate_prices(model.stockPrice.value(), logDrift, variance, contracts,
+                                                     model.requiredSamples, model.seed)
+
 
 # 此处开始写测试函数
 # 也是使用说明
@@ -500,6 +1097,79 @@ def 欧式期权测试1():
     print(model.value())
 
 
+def 欧式期权批量定价测试1():
+    # 批量定价与逐个构造模型的结果对比，以及计算速度的对比
+    import time
+    number = 2000
+    rng = np.random.RandomState(0)
+    stockPrice = rng.uniform(0.8, 1.2, number)
+    strikePrice = rng.uniform(0.9, 1.1, number)
+    evaluationDate = '2019-02-27'
+    exerciseDate = np.array(['2019-03-27', '2019-04-24', '2019-06-26', '2019-09-25'])[rng.randint(0, 4, number)]
+    optionType = np.where(rng.uniform(size=number) > 0.5, ql.Option.Call, ql.Option.Put)
+    dividendRate = rng.uniform(0.0, 0.03, number)
+    riskFree = rng.uniform(0.01, 0.04, number)
+    volatility = rng.uniform(0.1, 0.5, number)
+    time_start = time.perf_counter()
+    value_list, delta_list = [], []
+    for i in range(number):
+        model = EuropeanOptionBSMAnalytic(stockPrice[i], strikePrice[i], evaluationDate, exerciseDate[i], int(optionType[i]),
+                                          dividendRate[i], riskFree[i], volatility[i])
+        value_list.append(model.value())
+        delta_list.append(model.delta())
+    time_loop = time.perf_counter() - time_start
+    # 第一次批量定价时导入scipy.special，不计入耗时，取多次中最短的耗时
+    result = EuropeanOptionBSMAnalytic.batch(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType,
+                                             dividendRate, riskFree, volatility)
+    time_batch = float('inf')
+    for _ in range(5):
+        time_start = time.perf_counter()
+        EuropeanOptionBSMAnalytic.batch(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility)
+        time_batch = min(time_batch, time.perf_counter() - time_start)
+    print('NPV最大误差：%.2e，delta最大误差：%.2e' % (np.max(np.abs(result['NPV'] - value_list)),
+                                              np.max(np.abs(result['delta'] - delta_list))))
+    print('逐个定价%i个期权耗时%.4f秒，批量定价耗时%.4f秒，速度提升%.1f倍' % (number, time_loop, time_batch, time_loop / time_batch))
+
+
+def 隐含波动率批量计算测试1():
+    # 由批量定价的价格反解隐含波动率，检查误差、收敛标识和计算速度
+    import time
+    number = 2000
+    rng = np.random.RandomState(0)
+    stockPrice = 2.8
+    strikePrice = rng.uniform(2.0, 3.6, number)
+    evaluationDate = '2019-02-27'
+    exerciseDate = np.array(['2019-03-27', '2019-04-24', '2019-06-26', '2019-09-25'])[rng.randint(0, 4, number)]
+    optionType = np.where(rng.uniform(size=number) > 0.5, ql.Option.Call, ql.Option.Put)
+    riskFree = 0.03
+    volatility = rng.uniform(0.1, 0.8, number)
+    price = EuropeanOptionBSMAnalytic.batch(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType,
+                                            0.0, riskFree, volatility)['NPV']
+    time_start = time.time()
+    impliedVolatility, converged = EuropeanOptionBSMAnalytic.impliedVolatilityBatch(price, stockPrice, strikePrice, evaluationDate,
+                                                                                    exerciseDate, optionType, 0.0, riskFree)
+    time_batch = time.time() - time_start
+    print('收敛%i个，未收敛%i个，收敛合约的最大波动率误差：%.2e，耗时%.4f秒' % (np.sum(converged), np.sum(~converged),
+                                                            np.max(np.abs(impliedVolatility - volatility)[converged]), time_batch))
+
+
+def 隐含波动率批量计算测试2():
+    # 深度实值、深度虚值和低波动率的合约时间价值极小，价格无法确定波动率时返回未收敛，收敛的合约误差不超过accuracy
+    stockPrice = 2.8
+    strikePrice = np.array([1.4, 1.7, 2.0, 2.4, 2.8, 3.2, 3.6, 4.2, 5.6])
+    evaluationDate = '2019-02-27'
+    exerciseDate = np.array(['2019-03-13', '2019-05-27', '2020-02-27'])[:, None]
+    volatility = np.array([0.05, 0.1, 0.3])[:, None, None]
+    for optionType in (ql.Option.Call, ql.Option.Put):
+        price = EuropeanOptionBSMAnalytic.batch(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType,
+                                                0.0, 0.03, volatility)['NPV']
+        impliedVolatility, converged = EuropeanOptionBSMAnalytic.impliedVolatilityBatch(price, stockPrice, strikePrice, evaluationDate,
+                                                                                        exerciseDate, optionType, 0.0, 0.03)
+        error = np.abs(impliedVolatility - volatility)
+        print('收敛%i个，未收敛%i个，收敛合约的最大波动率误差：%.2e，未收敛合约的最大波动率误差：%.2e' % (
+            np.sum(converged), np.sum(~converged), np.max(error[converged]), np.nanmax(np.where(converged, 0.0, error))))
+
+
 def 美式期权测试1():
     stockPrice = 100.0
     strikePrice = 100.0
@@ -514,6 +1184,76 @@ def 美式期权测试1():
     print(model.delta())
 
 
+def 美式期权测试2():
+    # 蒙特卡洛模型在同一组路径上计算希腊值
+    stockPrice = 100.0
+    strikePrice = 100.0
+    evaluationDate = '2014-03-07'
+    maturityDate = '2014-06-07'
+    optionType = ql.Option.Put
+    dividendRate = 0.0
+    riskFree = 0.01
+    volatility = 0.2
+    model = AmericanOptionBSMMonteCarlo(stockPrice, strikePrice, evaluationDate, maturityDate, optionType, dividendRate, riskFree, volatility, seed=1)
+    print(model.pathwiseGreeks())
+
+
+def 美式期权测试3():
+    # 一组行权价的美式看跌期权共用一组路径定价，可行权日为交易日
+    import time
+    stockPrice = 100.0
+    evaluationDate = '2014-03-07'
+    maturityDate = '2014-06-07'
+    optionType = ql.Option.Put
+    dividendRate = 0.0
+    riskFree = 0.01
+    volatility = 0.2
+    strikePrices = [90.0, 95.0, 100.0, 105.0, 110.0]
+    time_start = time.time()
+    models = [AmericanOptionBSMLongstaffSchwartz(stockPrice, strikePrice, evaluationDate, maturityDate, optionType, dividendRate, riskFree, volatility, seed=1)
+              for strikePrice in strikePrices]
+    print(AmericanOptionBSMLongstaffSchwartz.batchNPV(models), '耗时%.4f秒' % (time.time() - time_start))
+    time_start = time.time()
+    print([AmericanOptionBSMBinomial(stockPrice, strikePrice, evaluationDate, maturityDate, optionType, dividendRate, riskFree, volatility).value()
+           for strikePrice in strikePrices], '二叉树耗时%.4f秒' % (time.time() - time_start))
+
+
+def 美式期权测试4():
+    # 按精度选择二叉树和有限差分的步数
+    stockPrice = 100.0
+    strikePrice = 100.0
+    evaluationDate = '2014-03-07'
+    maturityDate = '2014-06-07'
+    optionType = ql.Option.Put
+    dividendRate = 0.0
+    riskFree = 0.01
+    volatility = 0.2
+    for Derivative in [AmericanOptionBSMBinomial, AmericanOptionBSMFD]:
+        for richardson in [False, True]:
+            model = Derivative(stockPrice, strikePrice, evaluationDate, maturityDate, optionType, dividendRate, riskFree, volatility,
+                               tolerance=0.001, richardson=richardson)
+            print(Derivative.__name__, 'richardson=%s' % richardson, model.value(), model.delta(),
+                  '步数%i，误差%.6f，选择步数耗时%.4f秒' % (model.resolution, model.resolutionError, model.resolutionTime))
+
+
+def 美式期权测试5():
+    # 蒙特卡洛pathwise delta的偏差：与有限差分的delta比较，并比较报告的标准误差与不同seed之间delta的离散程度
+    stockPrice = 100.0
+    strikePrice = 100.0
+    evaluationDate = '2014-03-07'
+    maturityDate = '2014-06-07'
+    optionType = ql.Option.Put
+    dividendRate = 0.0
+    riskFree = 0.01
+    volatility = 0.2
+    model = AmericanOptionBSMFD(stockPrice, strikePrice, evaluationDate, maturityDate, optionType, dividendRate, riskFree, volatility)
+    greeksList = [AmericanOptionBSMMonteCarlo(stockPrice, strikePrice, evaluationDate, maturityDate, optionType, dividendRate, riskFree,
+                                              volatility, seed=seed).pathwiseGreeks() for seed in range(1, 9)]
+    delta = np.array([greeks['delta'] for greeks in greeksList])
+    print('有限差分delta：%.4f，pathwise delta均值：%.4f，不同seed的标准差：%.4f，报告的标准误差：%.4f' % (
+        model.delta(), np.mean(delta), np.std(delta, ddof=1), np.mean([greeks['deltaError'] for greeks in greeksList])))
+
+
 def 亚式期权测试1():
     # historyPrices使用说明
     # 模型计算中，不包括evaluationDate作为均值采样日，但包括exerciseDate
@@ -536,6 +1276,91 @@ def 亚式期权测试1():
     print(model.delta())
 
 
+def 亚式期权测试2():
+    # 控制变量法与ql.MCDiscreteArithmeticAPEngine的误差和耗时对比，以及多个合约共用一组路径定价
+    import time
+    stockPrice = 100.0
+    evaluationDate = '2014-03-07'
+    exerciseDate = '2014-06-07'
+    optionType = ql.Option.Call
+    historyPrices = [99.0, 98.7, 101.5, 101.4]
+    dividendRate = 0.0
+    riskFree = 0.01
+    volatility = 0.20
+    time_start = time.time()
+    model = DiscreteArithmeticAveragingPriceAsiannOptionBSMMonteCarlo(stockPrice, 100.0, evaluationDate, exerciseDate, optionType, historyPrices, dividendRate, riskFree, volatility)
+    print('QuantLib引擎：%.4f（误差%.4f），耗时%.4f秒' % (model.value(), model.option.errorEstimate(), time.time() - time_start))
+    time_start = time.time()
+    model = DiscreteArithmeticAveragingPriceAsiannOptionBSMControlVariateMonteCarlo(stockPrice, 100.0, evaluationDate, exerciseDate, optionType, historyPrices, dividendRate, riskFree, volatility)
+    print('控制变量法：%.4f（误差%.4f），耗时%.4f秒' % (model.value(), model.errorEstimate(), time.time() - time_start))
+    models = [DiscreteArithmeticAveragingPriceAsiannOptionBSMControlVariateMonteCarlo(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, historyPrices, dividendRate, riskFree, volatility, seed=1)
+              for strikePrice in [90.0, 95.0, 100.0, 105.0, 110.0]]
+    print(DiscreteArithmeticAveragingPriceAsiannOptionBSMControlVariateMonteCarlo.batchNPV(models))
+
+
+def 希腊值测试1():
+    # 各模型的greeks()与欧式解析模型的对比，以及一组同类模型的批量计算
+    stockPrice = 100.0
+    strikePrice = 100.0
+    evaluationDate = '2014-03-07'
+    exerciseDate = '2014-06-09'
+    optionType = ql.Option.Put
+    dividendRate = 0.0
+    riskFree = 0.01
+    volatility = 0.2
+    print('欧式解析', EuropeanOptionBSMAnalytic(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility).greeks())
+    print('欧式蒙特卡洛', EuropeanOptionBSMMonteCarlo(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility, seed=1).greeks())
+    print('美式二叉树', AmericanOptionBSMBinomial(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility).greeks())
+    models = [AmericanOptionBSMLongstaffSchwartz(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility, seed=1)
+              for strikePrice in [90.0, 100.0, 110.0]]
+    print('美式Longstaff-Schwartz', AmericanOptionBSMLongstaffSchwartz.batchGreeks(models))
+
+
+def 希腊值测试2():
+    # 估值日为周五时theta跨过周末，后移到下一个交易日（周一）；估值日为周六时亚式期权的采样日同样以到期日结束
+    # 亚式期权的theta与同一周末的几何平均解析价格差分（约-13.4）在几倍标准误差之内一致
+    stockPrice = 100.0
+    strikePrice = 100.0
+    exerciseDate = '2014-06-09'
+    optionType = ql.Option.Put
+    dividendRate = 0.0
+    riskFree = 0.01
+    volatility = 0.2
+    european = EuropeanOptionBSMAnalytic(stockPrice, strikePrice, '2014-03-07', exerciseDate, optionType, dividendRate, riskFree, volatility)
+    asian = DiscreteArithmeticAveragingPriceAsiannOptionBSMControlVariateMonteCarlo(stockPrice, strikePrice, '2014-03-07', exerciseDate, optionType, [], dividendRate, riskFree, volatility, seed=1)
+    print('欧式theta', european.greeks()['theta'], '亚式theta', asian.commonRandomTheta())
+    saturday = DiscreteArithmeticAveragingPriceAsiannOptionBSMControlVariateMonteCarlo(stockPrice, strikePrice, '2014-03-08', exerciseDate, optionType, [], dividendRate, riskFree, volatility, seed=1)
+    print('周五采样日数', len(asian.fixingDates), '周六采样日数', len(saturday.fixingDates), '最后采样日', saturday.fixingDates[-1].ISO())
+
+
+def 希腊值测试3():
+    # 蒙特卡洛模型的theta在估值日后移前后使用同一组随机数，与欧式解析模型后移一个交易日（周五到周一）的差分之差应在几倍标准误差之内
+    # 解析模型greeks()的theta为瞬时值，与三个自然日的差分相差约0.06
+    stockPrice = 100.0
+    strikePrice = 100.0
+    evaluationDate = '2014-03-07'
+    exerciseDate = '2014-06-09'
+    optionType = ql.Option.Put
+    dividendRate = 0.0
+    riskFree = 0.01
+    volatility = 0.2
+    analytic = EuropeanOptionBSMAnalytic(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility)
+    nextDate = 交易日历.CHINA.advanceDate(analytic.evaluationDate, 1)
+    analyticNext = EuropeanOptionBSMAnalytic(stockPrice, strikePrice, nextDate.ISO(), exerciseDate, optionType, dividendRate, riskFree, volatility)
+    analyticTheta = (analyticNext.value() - analytic.value()) / ql.Actual365Fixed().yearFraction(analytic.evaluationDate, nextDate)
+    print('欧式解析瞬时theta：%.4f，后移一个交易日的差分：%.4f' % (analytic.greeks()['theta'], analyticTheta))
+    for seed in range(1, 4):
+        theta = EuropeanOptionBSMMonteCarlo(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree,
+                                            volatility, seed=seed).commonRandomTheta()
+        print('蒙特卡洛theta：%.4f，标准误差：%.4f，与解析差分相差%.2f倍标准误差' % (
+            theta['theta'], theta['thetaError'], abs(theta['theta'] - analyticTheta) / theta['thetaError']))
+    models = [AmericanOptionBSMLongstaffSchwartz(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree, volatility, seed=1)
+              for strikePrice in [90.0, 100.0, 110.0]]
+    print('美式Longstaff-Schwartz theta', [model.commonRandomTheta() for model in models])
+    print('美式二叉树theta', [AmericanOptionBSMBinomial(stockPrice, strikePrice, evaluationDate, exerciseDate, optionType, dividendRate, riskFree,
+                                                   volatility).greeks()['theta'] for strikePrice in [90.0, 100.0, 110.0]])
+
+
 if __name__ == '__main__':
     美式期权测试1()
     亚式期权测试1()
\ No newline at end of file
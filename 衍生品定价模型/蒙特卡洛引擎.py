@@ -0,0 +1,270 @@
+import numpy as np
+
+
+# 基于NumPy的几何布朗运动蒙特卡洛引擎
+# 价格路径使用对数价格的精确离散：S_i = S_0 * exp(logDrift_i - 0.5 * variance_i + W_i)
+# logDrift_i为采样时刻的累积对数漂移（ln(分红贴现因子/无风险贴现因子)），variance_i为累积方差，W_i为方差时间下的布朗运动
+# 希腊值在同一组路径上一次计算：delta、vega使用pathwise估计，gamma使用pathwise与likelihood ratio的混合估计
+
+def get_normals(requiredSamples, stepNumber, seed, antitheticVariate=True):
+    # 返回(样本数, 步数)的标准正态随机数
+    # antitheticVariate为True时，后一半为前一半的对偶变量，共2*requiredSamples条路径
+    rng = np.random.default_rng(seed)
+    normals = rng.standard_normal((requiredSamples, stepNumber))
+    if antitheticVariate:
+        normals = np.concatenate([normals, -normals], axis=0)
+    return normals
+
+
+def get_gbm_paths(stockPrice, logDrift, variance, normals):
+    # 返回价格路径和方差时间下的布朗运动，形状均为(路径数, 步数)
+    logDrift = np.asarray(logDrift, dtype=float)
+    variance = np.asarray(variance, dtype=float)
+    stepVariance = np.diff(np.r_[0.0, variance])
+    brownian = np.cumsum(normals * np.sqrt(stepVariance), axis=1)
+    paths = stockPrice * np.exp(logDrift - 0.5 * variance + brownian)
+    return paths, brownian
+
+
+def get_mean_and_error(samples, antitheticVariate=True):
+    # 样本均值与标准误差，对偶变量的两条路径先取平均作为一个样本
+    if antitheticVariate:
+        half = samples.shape[0] // 2
+        samples = 0.5 * (samples[:half] + samples[half:])
+    return np.mean(samples, axis=0), np.std(samples, axis=0, ddof=1) / np.sqrt(samples.shape[0])
+
+
+def _get_greeks(stockPrice, value, pathwiseDelta, pathwiseVega, firstNormal, firstVariance, antitheticVariate):
+    # value、pathwiseDelta、pathwiseVega为每条路径的贴现收益及其对S_0、波动率的导数
+    # gamma = E[pathwiseDelta * (Z_1 / sqrt(variance_1) - 1)] / S_0，Z_1为第一步的正态随机数
+    # E[Z_1] = 0，pathwiseDelta先减去其均值以降低方差
+    score = firstNormal / np.sqrt(firstVariance)
+    pathwiseGamma = ((pathwiseDelta - np.mean(pathwiseDelta)) * score - pathwiseDelta) / stockPrice
+    greeks = {}
+    for name, samples in [('NPV', value), ('delta', pathwiseDelta), ('gamma', pathwiseGamma), ('vega', pathwiseVega)]:
+        greeks[name], greeks[name + 'Error'] = get_mean_and_error(samples, antitheticVariate)
+    return greeks
+
+
+def european_greeks(stockPrice, strikePrice, optionType, riskFreeDiscount, logDrift, variance, volatility,
+                    requiredSamples, seed, antitheticVariate=True):
+    # 欧式期权只需要到期日一步模拟
+    # riskFreeDiscount、logDrift、variance为到期日的贴现因子、累积对数漂移与累积方差
+    normals = get_normals(requiredSamples, 1, seed, antitheticVariate)
+    paths, brownian = get_gbm_paths(stockPrice, [logDrift], [variance], normals)
+    price, brownian = paths[:, 0], brownian[:, 0]
+    exercised = optionType * (price - strikePrice) > 0.0
+    value = riskFreeDiscount * np.maximum(optionType * (price - strikePrice), 0.0)
+    payoffDerivative = riskFreeDiscount * optionType * exercised
+    pathwiseDelta = payoffDerivative * price / stockPrice
+    pathwiseVega = payoffDerivative * price * (brownian - variance) / volatility
+    return _get_greeks(stockPrice, value, pathwiseDelta, pathwiseVega, normals[:, 0], variance, antitheticVariate)
+
+
+def asian_greeks(stockPrice, strikePrice, optionType, riskFreeDiscount, logDrift, variance, volatility,
+                 runningAccumulator, pastFixings, requiredSamples, seed, antitheticVariate=True):
+    # 离散算术平均价格亚式期权，平均价格为(runningAccumulator + 未来采样价格之和) / (pastFixings + 未来采样次数)
+    # riskFreeDiscount为行权日的贴现因子，logDrift、variance为各个未来采样日的累积值
+    normals = get_normals(requiredSamples, len(variance), seed, antitheticVariate)
+    paths, brownian = get_gbm_paths(stockPrice, logDrift, variance, normals)
+    fixingNumber = pastFixings + paths.shape[1]
+    average = (runningAccumulator + np.sum(paths, axis=1)) / fixingNumber
+    exercised = optionType * (average - strikePrice) > 0.0
+    value = riskFreeDiscount * np.maximum(optionType * (average - strikePrice), 0.0)
+    payoffDerivative = riskFreeDiscount * optionType * exercised
+    pathwiseDelta = payoffDerivative * np.sum(paths, axis=1) / (fixingNumber * stockPrice)
+    pathwiseVega = payoffDerivative * np.sum(paths * (brownian - variance), axis=1) / (fixingNumber * volatility)
+    return _get_greeks(stockPrice, value, pathwiseDelta, pathwiseVega, normals[:, 0], variance[0], antitheticVariate)
+
+
+def european_values(stockPrice, strikePrice, optionType, riskFreeDiscount, logDrift, variance, normals):
+    # 每条路径的贴现收益，logDrift、variance为只含到期日一项的数组，normals为(路径数, 1)
+    paths, _ = get_gbm_paths(stockPrice, logDrift, variance, normals)
+    return riskFreeDiscount * np.maximum(optionType * (paths[:, -1] - strikePrice), 0.0)
+
+
+def american_values(stockPrice, strikePrice, optionType, riskFreeDiscount, logDrift, variance, normals, basisOrder=3):
+    # 每条路径按Longstaff-Schwartz行权策略的贴现收益，估值日立即行权更优时每条路径均取内在价值
+    paths, _ = get_gbm_paths(stockPrice, logDrift, variance, normals)
+    basis = get_regression_basis(paths, stockPrice, basisOrder)
+    exerciseIndex = get_exercise_indices(paths, basis, [strikePrice], [optionType], riskFreeDiscount)[:, 0]
+    exercised = exerciseIndex >= 0
+    stepIndex = np.where(exercised, exerciseIndex, 0)
+    value = np.where(exercised, riskFreeDiscount[stepIndex] * optionType * (paths[np.arange(len(paths)), stepIndex] - strikePrice), 0.0)
+    intrinsicValue = max(optionType * (stockPrice - strikePrice), 0.0)
+    if intrinsicValue > np.mean(value):
+        value = np.full(len(value), intrinsicValue)
+    return value
+
+
+def asian_values(stockPrice, strikePrice, optionType, riskFreeDiscount, logDrift, variance, runningAccumulator, pastFixings, normals):
+    # 离散算术平均价格亚式期权每条路径的贴现收益，参数的含义与asian_greeks相同
+    paths, _ = get_gbm_paths(stockPrice, logDrift, variance, normals)
+    average = (runningAccumulator + np.sum(paths, axis=1)) / (pastFixings + paths.shape[1])
+    return riskFreeDiscount * np.maximum(optionType * (average - strikePrice), 0.0)
+
+
+def theta(valueFunction, parameters, rolledParameters, yearFraction, requiredSamples, seed, antitheticVariate=True):
+    # 估值日后移前后在同一组随机数上定价的向前差分，返回(theta, 标准误差)
+    # valueFunction(normals=normals, **parameters)返回每条路径的贴现收益，parameters、rolledParameters为后移前后的参数，
+    # 后移后的采样日应为后移前采样日的最后几个，使用同一组随机数的最后几列：共同的采样步随机数相同，只有第一步的时间间隔改变
+    # 欧式期权只有一步，两次定价的差只来自时间间隔，误差很小；多步模型后移后的路径从标的价格重新开始，
+    # 差分仍包括被跨过的几步的随机性（美式期权还包括两次回归的行权策略之差），误差见返回的标准误差
+    stepNumber = len(parameters['variance'])
+    rolledStepNumber = len(rolledParameters['variance'])
+    normals = get_normals(requiredSamples, stepNumber, seed, antitheticVariate)
+    value = valueFunction(normals=normals, **parameters)
+    rolledValue = valueFunction(normals=normals[:, stepNumber - rolledStepNumber:], **rolledParameters)
+    return get_mean_and_error((rolledValue - value) / yearFraction, antitheticVariate)
+
+
+def geometric_asian_price(stockPrice, strikePrice, optionType, riskFreeDiscount, logDrift, variance,
+                          historyLogSum, pastFixings):
+    # 离散几何平均价格亚式期权的解析价格，几何平均包括历史价格
+    # historyLogSum为历史价格的对数之和，logDrift、variance为各个未来采样日的累积值（按时间递增）
+    from scipy.special import ndtr
+    logDrift = np.asarray(logDrift, dtype=float)
+    variance = np.asarray(variance, dtype=float)
+    futureFixings = len(variance)
+    fixingNumber = pastFixings + futureFixings
+    # 对数几何平均的均值与方差，Cov(W_i, W_j) = min(variance_i, variance_j)
+    logMean = (historyLogSum + futureFixings * np.log(stockPrice) + np.sum(logDrift - 0.5 * variance)) / fixingNumber
+    logVariance = np.sum(variance * (2 * (futureFixings - np.arange(futureFixings)) - 1)) / fixingNumber ** 2
+    if logVariance <= 0.0:
+        return riskFreeDiscount * max(optionType * (np.exp(logMean) - strikePrice), 0.0)
+    stdDev = np.sqrt(logVariance)
+    forward = np.exp(logMean + 0.5 * logVariance)
+    d1 = np.log(forward / strikePrice) / stdDev + 0.5 * stdDev
+    d2 = d1 - stdDev
+    return riskFreeDiscount * optionType * (forward * ndtr(optionType * d1) - strikePrice * ndtr(optionType * d2))
+
+
+def asian_control_variate_prices(stockPrice, logDrift, variance, contracts, requiredSamples, seed, antitheticVariate=True):
+    # 同一标的的多个离散算术平均价格亚式期权共用一组模拟路径定价，以几何平均亚式期权的解析价格作为控制变量
+    # logDrift、variance为全部合约采样日并集（按时间递增）上的累积值
+    # contracts中每项为字典，包括strikePrice、optionType、riskFreeDiscount（行权日贴现因子）、
+    # fixingIndex（合约的未来采样日在并集中的位置）、runningAccumulator、historyLogSum、pastFixings
+    # 返回各合约NPV与标准误差的np.ndarray
+    logDrift = np.asarray(logDrift, dtype=float)
+    variance = np.asarray(variance, dtype=float)
+    normals = get_normals(requiredSamples, len(variance), seed, antitheticVariate)
+    _, brownian = get_gbm_paths(stockPrice, logDrift, variance, normals)
+    logPaths = np.log(stockPrice) + logDrift - 0.5 * variance + brownian
+    paths = np.exp(logPaths)
+    pathSums = {}  # 采样日相同的合约只计算一次路径的和
+    NPV = np.zeros(len(contracts))
+    NPVError = np.zeros(len(contracts))
+    for i, contract in enumerate(contracts):
+        fixingIndex = tuple(contract['fixingIndex'])
+        if fixingIndex not in pathSums:
+            pathSums[fixingIndex] = (np.sum(paths[:, list(fixingIndex)], axis=1), np.sum(logPaths[:, list(fixingIndex)], axis=1))
+        pathSum, logPathSum = pathSums[fixingIndex]
+        fixingNumber = contract['pastFixings'] + len(fixingIndex)
+        strikePrice, optionType = contract['strikePrice'], contract['optionType']
+        arithmeticAverage = (contract['runningAccumulator'] + pathSum) / fixingNumber
+        geometricAverage = np.exp((contract['historyLogSum'] + logPathSum) / fixingNumber)
+        arithmeticPayoff = contract['riskFreeDiscount'] * np.maximum(optionType * (arithmeticAverage - strikePrice), 0.0)
+        geometricPayoff = contract['riskFreeDiscount'] * np.maximum(optionType * (geometricAverage - strikePrice), 0.0)
+        geometricPrice = geometric_asian_price(stockPrice, strikePrice, optionType, contract['riskFreeDiscount'],
+                                               logDrift[list(fixingIndex)], variance[list(fixingIndex)],
+                                               contract['historyLogSum'], contract['pastFixings'])
+        # 控制变量系数取样本回归系数
+        geometricVariance = np.var(geometricPayoff)
+        if geometricVariance > 0.0:
+            beta = np.mean((arithmeticPayoff - np.mean(arithmeticPayoff)) * (geometricPayoff - np.mean(geometricPayoff))) / geometricVariance
+        else:
+            beta = 0.0
+        samples = arithmeticPayoff - beta * (geometricPayoff - geometricPrice)
+        NPV[i], NPVError[i] = get_mean_and_error(samples, antitheticVariate)
+    return NPV, NPVError
+
+
+def get_regression_basis(paths, stockPrice, basisOrder):
+    # 最小二乘回归的基函数：S/S_0的0至basisOrder次多项式，返回(路径数, 步数, basisOrder+1)
+    moneyness = paths / stockPrice
+    return moneyness[..., np.newaxis] ** np.arange(basisOrder + 1)
+
+
+def get_exercise_indices(paths, basis, strikePrices, optionTypes, riskFreeDiscount, lastExerciseIndex=None):
+    # Longstaff-Schwartz方法的行权策略，多个合约共用一组路径和一组回归基函数，各合约的回归在同一步中向量化求解
+    # strikePrices、optionTypes、lastExerciseIndex（合约的最后可行权步，默认为最后一步）的长度为合约数
+    # riskFreeDiscount为各步的贴现因子（贴现到估值日）
+    # 返回(路径数, 合约数)的最优行权步，-1表示不行权
+    pathNumber, stepNumber = paths.shape
+    strikePrices = np.atleast_1d(np.asarray(strikePrices, dtype=float))
+    optionTypes = np.broadcast_to(np.asarray(optionTypes, dtype=float), strikePrices.shape)
+    if lastExerciseIndex is None:
+        lastExerciseIndex = np.full(strikePrices.shape, stepNumber - 1)
+    exerciseIndex = np.full((pathNumber, len(strikePrices)), -1)
+    cashFlow = np.zeros((pathNumber, len(strikePrices)))  # 贴现到估值日的现金流
+    for step in range(stepNumber - 1, -1, -1):
+        payoff = np.maximum(optionTypes * (paths[:, step, np.newaxis] - strikePrices), 0.0)
+        inTheMoney = (payoff > 0.0) & (step <= lastExerciseIndex)
+        lastStep = step == lastExerciseIndex
+        exercise = inTheMoney & lastStep  # 最后可行权步实值即行权
+        # 其余可行权步，实值路径的现金流对基函数回归得到继续持有的价值
+        regression = inTheMoney & ~lastStep
+        weight = regression.astype(float)
+        X = basis[:, step]
+        basisNumber = X.shape[1]
+        normalMatrix = (weight.T @ (X[:, :, np.newaxis] * X[:, np.newaxis, :]).reshape(pathNumber, -1)).reshape(-1, basisNumber, basisNumber)
+        normalVector = (weight * cashFlow).T @ X
+        coefs = np.einsum('kij,kj->ki', np.linalg.pinv(normalMatrix), normalVector)
+        continuation = X @ coefs.T
+        enough = np.sum(regression, axis=0) > basis.shape[-1]  # 实值路径过少的步不行权
+        exercise |= regression & enough & (payoff * riskFreeDiscount[step] > continuation)
+        cashFlow = np.where(exercise, payoff * riskFreeDiscount[step], cashFlow)
+        exerciseIndex[exercise] = step
+    return exerciseIndex
+
+
+def american_prices(stockPrice, strikePrices, optionTypes, lastExerciseIndex, riskFreeDiscount, logDrift, variance,
+                    requiredSamples, seed, antitheticVariate=True, basisOrder=3):
+    # 同一标的的多个美式期权共用一组模拟路径和回归基函数，使用Longstaff-Schwartz方法定价
+    # riskFreeDiscount、logDrift、variance为全部合约可行权日并集上的值
+    # 返回各合约NPV与标准误差的np.ndarray，估值日立即行权更优时取内在价值
+    strikePrices = np.atleast_1d(np.asarray(strikePrices, dtype=float))
+    optionTypes = np.broadcast_to(np.asarray(optionTypes, dtype=float), strikePrices.shape)
+    normals = get_normals(requiredSamples, len(variance), seed, antitheticVariate)
+    paths, _ = get_gbm_paths(stockPrice, logDrift, variance, normals)
+    basis = get_regression_basis(paths, stockPrice, basisOrder)
+    exerciseIndex = get_exercise_indices(paths, basis, strikePrices, optionTypes, riskFreeDiscount, lastExerciseIndex)
+    exercised = exerciseIndex >= 0
+    stepIndex = np.where(exercised, exerciseIndex, 0)
+    price = np.take_along_axis(paths, stepIndex, axis=1)
+    value = np.where(exercised, riskFreeDiscount[stepIndex] * optionTypes * (price - strikePrices), 0.0)
+    NPV, NPVError = get_mean_and_error(value, antitheticVariate)
+    intrinsicValue = np.maximum(optionTypes * (stockPrice - strikePrices), 0.0)
+    immediateExercise = intrinsicValue > NPV
+    return np.where(immediateExercise, intrinsicValue, NPV), np.where(immediateExercise, 0.0, NPVError)
+
+
+def american_greeks(stockPrice, strikePrice, optionType, riskFreeDiscount, logDrift, variance, volatility,
+                    requiredSamples, seed, antitheticVariate=True, basisOrder=3):
+    # 美式期权的Longstaff-Schwartz方法，行权策略确定后，按行权时刻计算pathwise希腊值
+    # riskFreeDiscount、logDrift、variance为各个可行权日的值，估值日立即行权时希腊值按内在价值计算
+    # 求导时行权边界固定不动，而边界由同一组路径回归得到，既不是最优边界，也随S_0和波动率变化，
+    # 因此希腊值是有偏的：平值看跌期权的delta绝对值偏大约0.005（约1%），见美式期权测试5
+    # 键名加Error的标准误差只是给定行权边界下的抽样误差，不包括上述偏差和回归边界本身的随机性，
+    # 不同seed之间delta的实际离散程度约为报告的标准误差的3倍
+    normals = get_normals(requiredSamples, len(variance), seed, antitheticVariate)
+    paths, brownian = get_gbm_paths(stockPrice, logDrift, variance, normals)
+    basis = get_regression_basis(paths, stockPrice, basisOrder)
+    exerciseIndex = get_exercise_indices(paths, basis, [strikePrice], [optionType], riskFreeDiscount)[:, 0]
+    exercised = exerciseIndex >= 0
+    pathIndex = np.flatnonzero(exercised)
+    stepIndex = exerciseIndex[exercised]
+    price = paths[pathIndex, stepIndex]
+    discount = riskFreeDiscount[stepIndex]
+    value = np.zeros(paths.shape[0])
+    pathwiseDelta = np.zeros(paths.shape[0])
+    pathwiseVega = np.zeros(paths.shape[0])
+    value[pathIndex] = discount * optionType * (price - strikePrice)
+    pathwiseDelta[pathIndex] = discount * optionType * price / stockPrice
+    pathwiseVega[pathIndex] = discount * optionType * price * (brownian[pathIndex, stepIndex] - variance[stepIndex]) / volatility
+    greeks = _get_greeks(stockPrice, value, pathwiseDelta, pathwiseVega, normals[:, 0], variance[0], antitheticVariate)
+    intrinsicValue = max(optionType * (stockPrice - strikePrice), 0.0)
+    if intrinsicValue > greeks['NPV']:  # 估值日立即行权
+        greeks.update({'NPV': intrinsicValue, 'delta': float(optionType), 'gamma': 0.0, 'vega': 0.0,
+                       'NPVError': 0.0, 'deltaError': 0.0, 'gammaError': 0.0, 'vegaError': 0.0})
+    return greeks
@@ -0,0 +1,300 @@
+import collections
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import QuantLib as ql
+
+
+# 运行统计
+# 默认关闭，不影响任何计算；enable()后对TARGETS中已导入模块的类（及其全部子类）的方法计时和计数，disable()后恢复原方法
+# 统计内容：
+# 'construct/类名'-模型、路径生成器、回测对象的构造次数，按实际构造的类计，包括没有定义__init__、继承父类__init__的子类
+# 'notify/类名'-期权合约因报价、曲线或估值日变动而失效的次数（包括NPV(...)中保存、恢复报价造成的失效，合约重新计算前的多次变动只通知一次）
+# 'recalc/类名'-最外层的定价方法调用时合约已被通知、需要重新计算的次数，按定价调用计数：
+# delta()等在方法内部通过NPV(...)改变报价多次定价的，一次调用中定价引擎重新计算多次，只计一次
+# 'fetch/方法名'-行情数据源实际向Wind请求数据的次数
+# 以及每个方法（调用点）的调用次数、总耗时和按对数分组的耗时直方图
+# trace为True时同时记录每次调用的时间段，可导出为Chrome trace（chrome://tracing或Perfetto打开）
+# 多进程计算时，fork方式启动的子进程继承统计状态但结果不汇总到主进程
+TARGETS = [
+    ('股票期权定价模型', 'Option', ('__init__', 'NPV', 'value', 'delta', 'greeks', 'setEvaluationDate')),
+    ('路径生成器', 'PathGenerator', ('__init__', 'get_data', '_get_return_everyday', '_get_return_everyday_block')),
+    ('单资产衍生品对冲回测', 'SingleAssetDerivativeBacktestDayBase',
+     ('__init__', 'get_asset_delta', 'get_payoff', 'get_hedging_profit_and_loss', 'get_hedging_statistics', 'summary')),
+    ('行情数据接口', 'MarketDataProvider', ('wsd', 'wss', 'wsq')),
+    ('行情数据接口', 'CachedProvider', ('_request',)),
+]
+PRICING_METHODS = ('NPV', 'value', 'delta', 'greeks')  # 调用时检查合约是否需要重新计算的方法
+HISTOGRAM_BINS = 42  # 耗时直方图按2的幂次分组：第i组为[2**(i-1), 2**i)纳秒，最后一组包括2**40纳秒（约18分钟）以上
+
+
+class _State(object):
+    def __init__(self):
+        self.enabled = False
+        self.trace = False
+        self.observe = False
+        self.max_events = 0
+        self.counters = collections.Counter()
+        self.timings = {}  # 调用点 -> [调用次数, 总耗时, 最短耗时, 最长耗时, 直方图]
+        self.events = []  # (调用点, 开始时刻, 耗时, 线程)，单位为纳秒
+        self.patched = []  # (类, 方法名, 原方法)
+        self.constructing = set()  # 正在构造的对象的id，父类__init__的嵌套调用不重复统计
+        self.start_ns = 0
+
+
+# QuantLib的估值日为进程内的全局变量，定价只在单线程中进行，统计不加锁，多线程同时调用时计数可能略有遗漏
+_STATE = _State()
+
+
+def enable(trace=False, max_events=1000000, observe=True):
+    # 开始统计，统计在enable之前已经导入的模块；trace为True时最多记录max_events次调用的时间段
+    # observe为True时在构造的期权合约上注册ql.Observer，统计通知和重新计算的次数；每次通知调用一次Python函数，是统计的主要开销
+    if _STATE.enabled:
+        return
+    _STATE.trace = trace
+    _STATE.observe = observe
+    _STATE.max_events = max_events
+    _STATE.start_ns = time.perf_counter_ns()
+    for module_name, class_name, method_names in TARGETS:
+        module = sys.modules.get(module_name)
+        if module is not None and hasattr(module, class_name):
+            _patch(getattr(module, class_name), method_names)
+    _STATE.enabled = True
+
+
+def disable():
+    # 停止统计并恢复原方法，已有的统计结果保留
+    for cls, name, original in reversed(_STATE.patched):
+        setattr(cls, name, original)
+    _STATE.patched = []
+    _STATE.enabled = False
+
+
+def reset():
+    _STATE.counters = collections.Counter()
+    _STATE.timings = {}
+    _STATE.events = []
+    _STATE.start_ns = time.perf_counter_ns()
+
+
+def is_enabled():
+    return _STATE.enabled
+
+
+def count(name, number=1):
+    if _STATE.enabled:
+        _STATE.counters[name] += number
+
+
+class _Timer(object):
+    def __init__(self, site):
+        self.site = site
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _record(self.site, self.start, time.perf_counter_ns())
+        return False
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(site):
+    # 对with语句块计时，未开启统计时为空操作
+    return _Timer(site) if _STATE.enabled else _NULL_TIMER
+
+
+def _record(site, start, end):
+    duration = end - start
+    timing = _STATE.timings.get(site)
+    if timing is None:
+        timing = _STATE.timings[site] = [0, 0, duration, duration, [0] * HISTOGRAM_BINS]
+    timing[0] += 1
+    timing[1] += duration
+    if duration < timing[2]:
+        timing[2] = duration
+    if duration > timing[3]:
+        timing[3] = duration
+    timing[4][min(duration.bit_length(), HISTOGRAM_BINS - 1)] += 1
+    if _STATE.trace and len(_STATE.events) < _STATE.max_events:
+        _STATE.events.append((site, start, duration, threading.get_ident()))
+
+
+# 方法的替换
+def _get_classes(root):
+    classes = [root]
+    for cls in root.__subclasses__():
+        classes.extend(c for c in _get_classes(cls) if c not in classes)
+    return classes
+
+
+def _patch(root, method_names):
+    for cls in _get_classes(root):
+        for name in method_names:
+            original = cls.__dict__.get(name)
+            if original is None or isinstance(original, (classmethod, staticmethod)) or not callable(original):
+                continue
+            setattr(cls, name, _wrap(cls, name, original))
+            _STATE.patched.append((cls, name, original))
+
+
+def _wrap(cls, name, function):
+    site = '%s.%s' % (cls.__name__, name)
+    if name == '__init__':
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            key = id(self)
+            if key in _STATE.constructing:
+                return function(self, *args, **kwargs)  # 子类构造中调用的父类__init__不单独统计
+            _STATE.constructing.add(key)
+            start = time.perf_counter_ns()
+            try:
+                result = function(self, *args, **kwargs)
+            finally:
+                _STATE.constructing.discard(key)
+            # 按实际构造的类统计，继承父类__init__的子类由父类的替换方法计入
+            class_name = type(self).__name__
+            _record(class_name + '.__init__', start, time.perf_counter_ns())
+            _STATE.counters['construct/' + class_name] += 1
+            if _STATE.observe:
+                _observe(self)
+            return result
+    elif name == '_request':
+        @functools.wraps(function)
+        def wrapper(self, method, *args):
+            _STATE.counters['fetch/' + method] += 1
+            start = time.perf_counter_ns()
+            try:
+                return function(self, method, *args)
+            finally:
+                _record(site, start, time.perf_counter_ns())
+    elif name in PRICING_METHODS:
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            observer = self.__dict__.get('_instrumentation_observer')
+            if observer is not None:
+                if observer.depth == 0 and observer.stale:
+                    observer.stale = False
+                    _STATE.counters['recalc/' + type(self).__name__] += 1
+                observer.depth += 1  # delta()中调用的NPV(...)等嵌套定价调用不再计数
+            start = time.perf_counter_ns()
+            try:
+                return function(self, *args, **kwargs)
+            finally:
+                _record(site, start, time.perf_counter_ns())
+                if observer is not None:
+                    observer.depth -= 1
+    else:
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(self, *args, **kwargs)
+            finally:
+                _record(site, start, time.perf_counter_ns())
+    return wrapper
+
+
+class _InstrumentObserver(object):
+    # 期权合约的观察者，合约依赖的报价、曲线或估值日变动时收到通知，下一次定价需要重新计算
+    def __init__(self, name, instrument):
+        self.name = 'notify/' + name
+        self.stale = True
+        self.depth = 0  # 正在进行的定价方法调用的层数
+        self.observer = ql.Observer(self._notify)
+        self.observer.registerWith(instrument)
+
+    def _notify(self):
+        self.stale = True
+        _STATE.counters[self.name] += 1
+
+
+def _observe(model):
+    instrument = getattr(model, 'option', None)
+    if isinstance(instrument, ql.Instrument):
+        model._instrumentation_observer = _InstrumentObserver(type(model).__name__, instrument)
+
+
+# 结果的输出
+def get_statistics():
+    # 返回{'counters': {名称: 次数}, 'timings': {调用点: {count, total, mean, min, max, histogram}}}，耗时单位为秒
+    timings = {}
+    for site, (number, total, minimum, maximum, histogram) in sorted(_STATE.timings.items()):
+        timings[site] = {'count': number, 'total': total * 1e-9, 'mean': total * 1e-9 / number, 'min': minimum * 1e-9,
+                         'max': maximum * 1e-9, 'histogram': list(histogram)}
+    return {'counters': dict(sorted(_STATE.counters.items())), 'timings': timings,
+            'histogram_edges': [0.0] + [2 ** i * 1e-9 for i in range(HISTOGRAM_BINS - 1)] + [float('inf')]}
+
+
+def export_json(file_name):
+    with open(file_name, 'w', encoding='utf-8') as file:
+        json.dump(get_statistics(), file, ensure_ascii=False, indent=2)
+
+
+def export_chrome_trace(file_name):
+    # Chrome trace格式，每次调用为一个完整事件（ph='X'），计数器在结束时刻输出一次
+    pid = os.getpid()
+    events = [{'name': site, 'ph': 'X', 'ts': (start - _STATE.start_ns) / 1000.0, 'dur': duration / 1000.0, 'pid': pid, 'tid': tid}
+              for site, start, duration, tid in _STATE.events]
+    end = max([event['ts'] + event['dur'] for event in events], default=0.0)
+    for name, value in sorted(_STATE.counters.items()):
+        events.append({'name': name, 'ph': 'C', 'ts': end, 'pid': pid, 'args': {'count': value}})
+    with open(file_name, 'w', encoding='utf-8') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file, ensure_ascii=False)
+
+
+def summary(top=20):
+    # 打印计数和总耗时最长的top个调用点
+    statistics = get_statistics()
+    for name, value in statistics['counters'].items():
+        print('%-60s%12i' % (name, value))
+    timings = sorted(statistics['timings'].items(), key=lambda item: -item[1]['total'])[:top]
+    for site, timing in timings:
+        print('%-60s%12i%12.6f%12.6f' % (site, timing['count'], timing['total'], timing['mean']))
+
+
+# 此处开始写测试函数
+# 也是使用说明
+
+def 运行统计测试1():
+    # 对一次逐个构造模型计算delta的回测统计构造、NPV、重新计算的次数和各方法的耗时
+    import tempfile
+    import numpy as np
+    from 股票期权定价模型 import EuropeanOptionBSMAnalytic
+    from 路径生成器 import BrownianMCReturnPathGeneratorByEverydayReturn
+    from 单资产衍生品对冲回测 import SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption
+
+    enable(trace=True)
+    coefsOfDerivative = {'strikePrice': 1.0, 'optionType': ql.Option.Call, 'dividendRate': 0.0, 'riskFree': 0.01, 'volatility': 0.3}
+    backtest_model = SingleAssetDerivativeBacktestDeltaHedging4EuropeanOption('000300.SH', '2018-03-08', '2018-06-08', BrownianMCReturnPathGeneratorByEverydayReturn,
+                                                                              {'path_number': 50, 'drift': 0.0, 'volatility': 0.3},
+                                                                              EuropeanOptionBSMAnalytic, coefsOfDerivative, delta_mode='pool')
+    backtest_model.get_hedging_profit_and_loss()
+    model = EuropeanOptionBSMAnalytic(1.0, 1.0, '2018-03-08', '2018-06-08', ql.Option.Call, 0.0, 0.01, 0.3)
+    for stockPrice in np.linspace(0.9, 1.1, 100):
+        model.NPV(stockPrice, 0.0, 0.01, 0.3)
+    disable()
+    summary()
+    directory = tempfile.mkdtemp()
+    export_json(os.path.join(directory, '运行统计.json'))
+    export_chrome_trace(os.path.join(directory, '运行统计trace.json'))
+    print('结果保存在', directory)
+
+
+if __name__ == '__main__':
+    运行统计测试1()
@@ -1,5 +1,7 @@
 import datetime
-from WindPy import w
+import sys
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\行情数据')
+from 行情数据接口 import w
 w.start()
 
 
@@ -1,10 +1,11 @@
-import xlrd
 import numpy as np
-from WindPy import w
-import statsmodels.api as sm
+import sys
+sys.path.append('D:\\programs\\DerivativesWithQuantLib\\行情数据')
+from 行情数据接口 import w
 
 
 def get_stock_portfolio(file_path):
+    import xlrd
     portfolio_dict = {}
     workbook = xlrd.open_workbook(file_path)
     sheet_portfolio = workbook.sheet_by_name('投资组合')
@@ -58,6 +59,7 @@ def get_portfolio_ratio_v1(portfolio_dict, future_index_code, start_date, end_da
     # 投资组合价值为因变量，一手股指期货指数价值为自变量，做线性回归
     future_index_values_diff = np.diff(future_index_values)
     portfolio_values_diff = np.diff(portfolio_values)
+    import statsmodels.api as sm
     X = sm.add_constant(future_index_values_diff.reshape(-1, 1))
     reg_model = sm.OLS(portfolio_values_diff, X)
     result = reg_model.fit()